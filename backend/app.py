@@ -1,71 +1,231 @@
 # backend/app.py
+"""
+The F1 API: an application factory plus the routes, registered on the `api` blueprint.
+
+Importing this module connects to nothing. The routes' shared state (the MongoDB
+connection, the response cache, the session catalog, the reference data, the lap store and the snapshots)
+belongs to the process and is warmed by `warm_up`: it ensures indexes and loads the catalog
+and reference data. gunicorn.conf.py calls `preload` in the master before forking, so the
+workers share the warm state copy-on-write instead of each loading it. Otherwise a process
+warms itself on its first request. `/api/healthz` reports liveness and `/api/readyz` the
+warm-up status.
+"""
+import gc
 import os
-from flask import Flask, jsonify, request
+import time
+import threading
+from flask import Blueprint, Flask, Response, current_app, has_app_context, jsonify, request
 from flask_cors import CORS
-from pymongo import MongoClient
-from bson import json_util
-import json
+from werkzeug.local import LocalProxy
 import logging
+import queue
 from datetime import datetime
 
+import queries
+from batch import in_batch, parse_batch, run_batch, shared
+from concurrency import run_parallel
+from conditions import condition_filter
+from cache import ResponseCache
+from catalog import CatalogStore, ReferenceData
+from connection import Connection
+from encoding import dumps, json_response, json_stream
+from generation import read_generation, read_live_generations
+from indexes import ensure_indexes
+from lap_analysis import compare_columns
+from lap_store import LAP_STORE_DIR, LapStore
+from live import LiveHub, has_ended
+from metrics import Metrics
+from pagination import decode_cursor, encode_cursor, to_columns
+from snapshots import SnapshotStore
+from stint_analysis import analyze_stints
+import telemetry
+
 # --- Setup ---
-app = Flask(__name__)
-CORS(app) 
 logging.basicConfig(level=logging.INFO)
+metrics = Metrics()
+api = Blueprint('api', __name__)
+WARMUP_RETRY_SECONDS = float(os.environ.get('WARMUP_RETRY_SECONDS', '5'))
 
 
 # --- Database Connection ---
 MONGO_URI = os.environ.get('MONGO_URI')
-if not MONGO_URI:
-    logging.error("FATAL: MONGO_URI environment variable not set!")
-    raise Exception("MONGO_URI environment variable not set!")
+connection = Connection(MONGO_URI, event_listeners=metrics.event_listeners(), on_connect=metrics.attach)
+
+
+def _per_app(name, default):
+    """A proxy to the app's own `name` when create_app was given a database, else to `default()`."""
+    def resolve():
+        state = current_app.extensions.get('f1_database') if has_app_context() else None
+        return default() if state is None else state[name]
+    return LocalProxy(resolve)
+
+
+db = _per_app('db', connection.database)
+
+response_cache = ResponseCache(lambda: read_generation(db), lambda: read_live_generations(db))
+_session_catalog = CatalogStore(db, lambda: read_generation(db))
+_reference_data = CatalogStore(db, lambda: read_generation(db), loader=ReferenceData.load)
+_lap_store = LapStore(LAP_STORE_DIR, lambda: read_generation(db))
+session_catalog = _per_app('session_catalog', lambda: _session_catalog)
+reference_data = _per_app('reference_data', lambda: _reference_data)
+lap_store = _per_app('lap_store', lambda: _lap_store)
+snapshot_store = SnapshotStore()
+
+LAPS_PAGE_MAX = 5000
+live_hub = LiveHub(db)
+LIVE_KEEPALIVE_SECONDS = 15
+STARTED_AT = time.time()
+warm_state = {'warm': False, 'preloaded': False, 'pid': None, 'seconds': None, 'error': None, 'attempted_at': None}
+warm_lock = threading.Lock()
+
+
+def warm_up():
+    """Ensures indexes and loads the session catalog and reference data. Returns True if they loaded."""
+    started = time.perf_counter()
+    warm_state.update(pid=os.getpid(), attempted_at=time.monotonic(), error=None)
+    try:
+        ensure_indexes(db)
+    except Exception as e:
+        logging.warning(f"Could not ensure indexes at startup: {e}")
+    try:
+        catalog, reference = session_catalog.current(), reference_data.current()
+    except Exception as e:
+        logging.warning(f"Could not load the session catalog and reference data at startup: {e}")
+        warm_state.update(warm=False, error=str(e))
+        return False
+    warm_state.update(warm=True, seconds=round(time.perf_counter() - started, 3),
+                      sessions=len(catalog), drivers=len(reference.drivers), meetings=len(reference.meetings_by_key))
+    return True
+
+
+def preload():
+    """
+    Warms the process before it forks workers: loads the warm state, closes the MongoDB client
+    (each worker opens its own) and freezes the loaded objects out of the garbage collector's
+    reach, so collections in the workers do not write to, and so copy, the shared pages.
+    """
+    warmed = warm_up()
+    connection.close()
+    warm_state['preloaded'] = warmed
+    gc.freeze()
+    return warmed
+
+
+def ensure_warm():
+    """Warms this process if nothing has yet, retrying a failed warm-up at most every WARMUP_RETRY_SECONDS."""
+    if warm_state['warm']:
+        return True
+    with warm_lock:
+        attempted_at = warm_state['attempted_at']
+        if warm_state['warm'] or (attempted_at is not None and warm_state['pid'] == os.getpid()
+                                  and time.monotonic() - attempted_at < WARMUP_RETRY_SECONDS):
+            return warm_state['warm']
+        return warm_up()
+
+
+def create_app(database=None):
+    """
+    Builds the Flask app. No connection is opened until the first query.
+
+    Given a `database`, such as the ingestor's, the app serves it instead of MONGO_URI's, with its
+    own catalog and reference data. The response cache, the lap store and the snapshots hold the
+    process's database, so such an app goes without them.
+    """
+    app = Flask(__name__)
+    CORS(app)
+    metrics.init_app(app)
+    app.register_blueprint(api)
+    if database is not None:
+        generation = lambda: read_generation(database)
+        app.extensions['f1_database'] = {
+            'db': database,
+            'session_catalog': CatalogStore(database, generation),
+            'reference_data': CatalogStore(database, generation, loader=ReferenceData.load),
+            'lap_store': LapStore(None, generation),
+        }
+        app.config.update(RESPONSE_CACHE_ENABLED=False, SNAPSHOT_ENABLED=False)
+    elif not MONGO_URI:
+        logging.error("MONGO_URI environment variable not set!")
+    return app
 
-DB_NAME = 'f1_data'
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
 
-def parse_json(data):
-    """Helper function to convert MongoDB BSON to JSON."""
-    return json.loads(json_util.dumps(data))
+@api.before_app_request
+def warm_on_first_request():
+    # Liveness must not wait on MongoDB; an app with its own database has no process state to warm
+    if request.endpoint != 'api.get_health' and 'f1_database' not in current_app.extensions:
+        ensure_warm()
+
+@api.route('/api/batch', methods=['POST'])
+def post_batch():
+    """Several GET or POST requests to the other routes in one round trip; see batch.py."""
+    try:
+        items = parse_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        return Response(run_batch(current_app._get_current_object(), items), mimetype='application/json')
+    except Exception as e:
+        logging.error(f"Error in /api/batch: {e}")
+        return jsonify({"error": "An internal server error occurred"}), 500
+
+@api.route('/api/healthz')
+def get_health():
+    """Liveness: the process is serving requests. Touches nothing else."""
+    return jsonify({'status': 'ok', 'pid': os.getpid(), 'uptime_seconds': round(time.time() - STARTED_AT, 1)})
+
+@api.route('/api/readyz')
+def get_readiness():
+    """Readiness: the warm state is loaded and MongoDB answers."""
+    status = {key: value for key, value in warm_state.items() if key != 'attempted_at'}
+    status['pid'] = os.getpid()
+    try:
+        db.command('ping')
+        status['mongo'] = 'ok'
+    except Exception as e:
+        status['mongo'] = str(e)
+    ready = status['warm'] and status['mongo'] == 'ok'
+    return jsonify({'status': 'ready' if ready else 'warming', **status}), 200 if ready else 503
 
 # --- NEW: Dedicated endpoint for the robust Comparison Page ---
-@app.route('/api/comparison/laps', methods=['POST'])
+@api.route('/api/comparison/laps', methods=['POST'])
 def get_comparison_laps():
     try:
         comparison_columns = request.json
         if not comparison_columns or not isinstance(comparison_columns, list):
             return jsonify({"error": "Request body must be a list of comparison columns"}), 400
 
-        response_data = []
         for column in comparison_columns:
-            session_key = column.get('sessionKey')
-            driver_number = column.get('driverNumber')
-
-            if not session_key or not driver_number:
-                continue
-
-            # Fetch all laps for the specified driver and session
-            pipeline = [
-                {'$match': {'session_key': session_key, 'driver_number': driver_number, 'lap_duration': {'$ne': None}}},
-                {'$project': {
-                    '_id': 0,
-                    'lap_number': 1,
-                    'lap_duration': 1,
-                    'sector_1_time': 1,
-                    'sector_2_time': 1,
-                    'sector_3_time': 1,
-                    'tyre_compound': 1
-                }},
-                {'$sort': {'lap_number': 1}}
-            ]
-            laps = list(db.laps.aggregate(pipeline))
-            
-            response_data.append({
-                "columnId": column.get("id"),
-                "laps": laps
-            })
+            if not isinstance(column, dict) or not all(
+                isinstance(column.get(field), int) and not isinstance(column.get(field), bool)
+                for field in ('sessionKey', 'driverNumber')
+            ):
+                return jsonify({"error": "Each comparison column needs an integer sessionKey and driverNumber"}), 400
+        columns = comparison_columns
+        pairs = sorted({(column['sessionKey'], column['driverNumber']) for column in columns})
+
+        # One query for every column, split back out by (session, driver)
+        laps_by_pair = {pair: [] for pair in pairs}
+        if pairs:
+            for lap in db.laps.aggregate(queries.comparison_laps_pipeline(pairs)):
+                pair = (lap.pop('session_key'), lap.pop('driver_number'))
+                laps_by_pair[pair].append(lap)
 
-        return jsonify(parse_json(response_data))
+        response_data = [
+            {"columnId": column.get("id"), "laps": laps_by_pair[(column['sessionKey'], column['driverNumber'])]}
+            for column in columns
+        ]
+
+        # Optional server-side analysis: ?analysis=true&reference=<columnId>&window=3
+        if request.args.get('analysis', '').lower() == 'true' and response_data:
+            column_ids = [entry["columnId"] for entry in response_data]
+            reference_id = request.args.get('reference')
+            reference = next((i for i, cid in enumerate(column_ids) if str(cid) == reference_id), 0)
+            window = max(request.args.get('window', 3, type=int), 1)
+            analyses = compare_columns([entry["laps"] for entry in response_data], reference, window)
+            for entry, analysis in zip(response_data, analyses):
+                entry["analysis"] = analysis
+
+        return json_response(response_data)
     except Exception as e:
         logging.error(f"Error in /api/comparison/laps: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
@@ -73,7 +233,8 @@ def get_comparison_laps():
 
 # --- All other endpoints remain unchanged below ---
 
-@app.route('/api/analysis')
+@api.route('/api/analysis')
+@response_cache.route
 def get_analysis():
     try:
         analysis_type = request.args.get('type')
@@ -83,169 +244,120 @@ def get_analysis():
             return jsonify({"error": "type and drivers query parameters are required"}), 400
         
         driver_ids = [int(num) for num in driver_ids_str.split(',')]
+        try:
+            conditions = condition_filter(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if conditions and analysis_type != 'track':
+            return jsonify({"error": "Lap condition filters only apply to type=track"}), 400
         
         results = []
         if analysis_type == 'career':
-            race_sessions = db.sessions.find({'session_name': 'Race'}, {'_id': 1})
-            race_session_keys = [s['_id'] for s in race_sessions]
-            pipeline = [
-                {'$match': {'driver_number': {'$in': driver_ids}, 'session_key': {'$in': race_session_keys}, 'position': {'$ne': None}}},
-                {'$group': {
-                    '_id': '$driver_number',
-                    'wins': {'$sum': {'$cond': [{'$eq': ['$position', 1]}, 1, 0]}},
-                    'podiums': {'$sum': {'$cond': [{'$lte': ['$position', 3]}, 1, 0]}},
-                }},
-                {'$project': {'_id': 0, 'driver_number': '$_id', 'wins': 1, 'podiums': 1}}
-            ]
-            results_data = list(db.session_results.aggregate(pipeline))
-            qualifying_sessions = db.sessions.find({'session_name': 'Qualifying'}, {'_id': 1})
-            qualifying_session_keys = [s['_id'] for s in qualifying_sessions]
+            # One query for every driver's wins, podiums and poles
+            results_data = {
+                r['driver_number']: r for r in db.session_results.aggregate(queries.career_stats_pipeline(driver_ids))
+            }
             for driver_id in driver_ids:
-                driver_result = next((r for r in results_data if r['driver_number'] == driver_id), {'driver_number': driver_id, 'wins': 0, 'podiums': 0})
-                poles = db.session_results.count_documents({
-                    'driver_number': driver_id, 
-                    'position': 1,
-                    'session_key': {'$in': qualifying_session_keys}
-                })
-                driver_result['poles'] = poles
-                results.append(driver_result)
+                results.append(results_data.get(driver_id, {'driver_number': driver_id, 'wins': 0, 'podiums': 0, 'poles': 0}))
         elif analysis_type == 'season':
             year = int(request.args.get('year'))
-            pipeline = [
-                {'$lookup': {'from': 'sessions', 'localField': 'session_key', 'foreignField': '_id', 'as': 'session_info'}},
-                {'$unwind': '$session_info'},
-                {'$match': {'driver_number': {'$in': driver_ids}, 'session_info.year': year, 'position': {'$ne': None}}},
-                {'$group': {
-                    '_id': '$driver_number',
-                    'wins': {'$sum': {'$cond': [{'$eq': ['$position', 1]}, 1, 0]}},
-                    'podiums': {'$sum': {'$cond': [{'$lte': ['$position', 3]}, 1, 0]}}
-                }},
-                {'$project': {'_id': 0, 'driver_number': '$_id', 'wins': 1, 'podiums': 1}}
-            ]
+            pipeline = queries.season_analysis_pipeline(driver_ids, year)
             results = list(db.session_results.aggregate(pipeline))
         elif analysis_type == 'track':
             circuit_key = int(request.args.get('circuit_key'))
-            pipeline = [
-                {'$lookup': {'from': 'sessions', 'localField': 'session_key', 'foreignField': '_id', 'as': 'session_info'}},
-                {'$unwind': '$session_info'},
-                {'$lookup': {'from': 'meetings', 'localField': 'session_info.meeting_key', 'foreignField': '_id', 'as': 'meeting_info'}},
-                {'$unwind': '$meeting_info'},
-                {'$match': {'driver_number': {'$in': driver_ids}, 'meeting_info.circuit_key': circuit_key, 'lap_duration': {'$ne': None}}},
-                {'$sort': {'lap_duration': 1}},
-                {'$group': {
-                    '_id': '$driver_number',
-                    'best_lap_time': {'$first': {'fastest_lap': '$lap_duration', 'year': '$session_info.year'}}
-                }},
-                 {'$project': {'_id': 0, 'driver_number': '$_id', 'best_lap_time': 1}}
-            ]
-            results = list(db.laps.aggregate(pipeline))
+            # The lap store has no condition columns, so filtered queries go to Mongo
+            store = None if conditions else lap_store.current()
+            if store is not None:
+                results = [
+                    {'driver_number': driver, 'best_lap_time': {'fastest_lap': fastest_lap, 'year': year}}
+                    for driver, (fastest_lap, year) in store.best_laps(driver_ids, circuit_key).items()
+                ]
+            else:
+                pipeline = queries.track_analysis_pipeline(driver_ids, circuit_key, conditions)
+                results = list(db.laps.aggregate(pipeline))
         else:
             return jsonify({"error": "Invalid analysis type"}), 400
 
-        return jsonify(parse_json(results))
+        return json_response(results)
     except Exception as e:
         logging.error(f"Error in /api/analysis: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/status')
+@api.route('/api/status')
 def get_status():
     return jsonify({'status': 'ok', 'message': 'F1 API is running.'})
     
-@app.route('/api/years')
+@api.route('/api/cache/stats')
+def get_cache_stats():
+    return jsonify({**response_cache.stats(), 'snapshots': snapshot_store.stats()})
+
+@api.route('/api/metrics')
+def get_metrics():
+    return metrics.response()
+
+@api.route('/api/years')
+@response_cache.route
 def get_available_years():
     try:
-        years = db.sessions.distinct('year')
-        years.sort(reverse=True)
-        return jsonify(years)
+        return jsonify(session_catalog.current().years_available())
     except Exception as e:
         logging.error(f"Error in /api/years: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/records')
+@api.route('/api/records')
+@response_cache.route
 def get_records():
     try:
         year_str = request.args.get('year')
         if not year_str:
             return jsonify({"error": "year query parameter is required"}), 400
         year = int(year_str)
-        champion_pipeline = [
-            {'$lookup': {'from': 'sessions', 'localField': 'session_key', 'foreignField': '_id', 'as': 'session_info'}},
-            {'$unwind': '$session_info'},
-            {'$match': {'session_info.year': year, 'session_info.session_name': 'Race', 'points': {'$ne': None}}},
-            {'$group': {'_id': '$driver_number', 'total_points': {'$sum': '$points'}}},
-            {'$sort': {'total_points': -1}},
-            {'$limit': 1},
-            {'$lookup': {'from': 'drivers', 'localField': '_id', 'foreignField': '_id', 'as': 'driver_info'}},
-            {'$unwind': '$driver_info'}
-        ]
-        champion_data = list(db.session_results.aggregate(champion_pipeline))
-        season_champion = champion_data[0] if champion_data else None
-        wins_pipeline = [
-            {'$lookup': {'from': 'sessions', 'localField': 'session_key', 'foreignField': '_id', 'as': 'session_info'}},
-            {'$unwind': '$session_info'},
-            {'$match': {'session_info.year': year, 'session_info.session_name': 'Race', 'position': 1}},
-            {'$group': {'_id': '$driver_number', 'wins': {'$sum': 1}}},
-            {'$sort': {'wins': -1}},
-            {'$limit': 1},
-            {'$lookup': {'from': 'drivers', 'localField': '_id', 'foreignField': '_id', 'as': 'driver_info'}},
-            {'$unwind': '$driver_info'}
-        ]
-        most_wins_data = list(db.session_results.aggregate(wins_pipeline))
-        most_wins = most_wins_data[0] if most_wins_data else None
-        fastest_lap_pipeline = [
-            {'$lookup': {'from': 'sessions', 'localField': 'session_key', 'foreignField': '_id', 'as': 'session_info'}},
-            {'$unwind': '$session_info'},
-            {'$match': {'session_info.year': year, 'lap_duration': {'$ne': None}}},
-            {'$sort': {'lap_duration': 1}},
-            {'$limit': 1},
-            {'$lookup': {'from': 'drivers', 'localField': 'driver_number', 'foreignField': '_id', 'as': 'driver_info'}},
-            {'$unwind': '$driver_info'},
-            {'$lookup': {'from': 'meetings', 'localField': 'session_info.meeting_key', 'foreignField': '_id', 'as': 'meeting_info'}},
-            {'$unwind': '$meeting_info'}
-        ]
-        fastest_lap_data = list(db.laps.aggregate(fastest_lap_pipeline))
-        fastest_lap = fastest_lap_data[0] if fastest_lap_data else None
+        records = db.season_records.find_one({'_id': year})
+        if records:
+            season_champion, most_wins, fastest_lap = records['season_champion'], records['most_wins'], records['fastest_lap']
+        else:
+            # Season not materialized yet (see standings.py); compute it live
+            season_champion, most_wins, fastest_lap = run_parallel(
+                lambda: next(db.session_results.aggregate(queries.champion_pipeline(year)), None),
+                lambda: next(db.session_results.aggregate(queries.most_wins_pipeline(year)), None),
+                lambda: next(db.laps.aggregate(queries.season_fastest_lap_pipeline(year)), None)
+            )
         response = {
             'year': year, 'season_champion': season_champion,
             'most_wins': most_wins, 'fastest_lap': fastest_lap
         }
-        return jsonify(parse_json(response))
+        return json_response(response)
     except (ValueError, TypeError):
         return jsonify({"error": "year must be a valid integer"}), 400
     except Exception as e:
         logging.error(f"Error in /api/records: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/meetings')
+@api.route('/api/meetings')
+@response_cache.route
 def get_all_meetings():
     try:
-        pipeline = [
-            {'$sort': {'date_start': -1}},
-            {'$group': {
-                '_id': {'year': '$year', 'meeting_name': '$meeting_name'},
-                'doc': {'$first': '$$ROOT'}
-            }},
-            {'$replaceRoot': {'newRoot': '$doc'}},
-            {'$sort': {'year': -1, 'date_start': -1}}
-        ]
-        meetings = list(db.meetings.aggregate(pipeline))
-        return jsonify(parse_json(meetings))
+        return json_response(reference_data.current().meetings)
     except Exception as e:
         logging.error(f"Error in /api/meetings: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/meetings/<int:meeting_key>')
+@api.route('/api/meetings/<int:meeting_key>')
+@response_cache.route
 def get_meeting_details(meeting_key):
     try:
-        meeting = db.meetings.find_one({'_id': meeting_key})
+        # A meeting newer than the reference data's generation is looked up directly
+        meeting = reference_data.current().meetings_by_key.get(meeting_key) or db.meetings.find_one({'_id': meeting_key})
         if not meeting:
             return jsonify({"error": "Meeting not found"}), 404
-        return jsonify(parse_json(meeting))
+        return json_response(meeting)
     except Exception as e:
         logging.error(f"Error in /api/meetings/{meeting_key}: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/meetings/<int:meeting_key>/details')
+@api.route('/api/meetings/<int:meeting_key>/details')
+@snapshot_store.route
+@response_cache.route
 def get_meeting_details_consolidated(meeting_key):
     try:
         meeting = db.meetings.find_one({'_id': meeting_key})
@@ -255,195 +367,302 @@ def get_meeting_details_consolidated(meeting_key):
         winner = None
         race_session = next((s for s in sessions if s['session_name'].lower() == 'race'), None)
         if race_session:
-            pipeline = [
-                {'$match': {'session_key': race_session['_id'], 'position': 1}}, {'$limit': 1},
-                {'$lookup': {'from': 'drivers', 'localField': 'driver_number', 'foreignField': '_id', 'as': 'driver_info'}},
-                {'$unwind': '$driver_info'},
-                {'$project': {
-                    '_id': 0, 'position': '$position', 'driver_number': '$driver_number',
-                    'full_name': '$driver_info.full_name', 'team_name': '$driver_info.team_name',
-                    'team_color': '$driver_info.team_colour', 'laps_completed': '$number_of_laps',
-                    'headshot_url': '$driver_info.headshot_url', 'dnf': '$dnf'
-                }}
-            ]
+            pipeline = queries.race_winner_pipeline(race_session['_id'])
             winner_data = list(db.session_results.aggregate(pipeline))
             if winner_data:
                 winner = winner_data[0]
         response = {'meeting_details': meeting, 'sessions': sessions, 'winner': winner}
-        return jsonify(parse_json(response))
+        return json_response(response)
     except Exception as e:
         logging.error(f"Error in /api/meetings/{meeting_key}/details: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/meetings/<int:meeting_key>/sessions')
+@api.route('/api/meetings/<int:meeting_key>/sessions')
+@response_cache.route
 def get_sessions_for_meeting(meeting_key):
     try:
         query = {'meeting_key': meeting_key}
         sessions = list(db.sessions.find(query).sort('date_start', -1))
-        return jsonify(parse_json(sessions))
+        return json_response(sessions)
     except Exception as e:
         logging.error(f"Error in /api/meetings/{meeting_key}/sessions: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/sessions/<int:session_key>')
+@api.route('/api/sessions/<int:session_key>')
+@response_cache.route
 def get_session_details(session_key):
     try:
-        session = db.sessions.find_one({'_id': session_key})
+        session = shared(('session', session_key), lambda: db.sessions.find_one({'_id': session_key}))
         if not session:
             return jsonify({"error": "Session not found"}), 404
-        return jsonify(parse_json(session))
+        return json_response(session)
     except Exception as e:
         logging.error(f"Error in /api/sessions/{session_key}: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/sessions/<int:session_key>/details')
+@api.route('/api/sessions/<int:session_key>/details')
+@snapshot_store.route
+@response_cache.route
 def get_session_details_consolidated(session_key):
     try:
-        session = db.sessions.find_one({'_id': session_key})
+        entry = session_catalog.current().get(session_key)
+
+        def session_and_meeting():
+            session = shared(('session', session_key), lambda: db.sessions.find_one({'_id': session_key}))
+            if entry:
+                return session, None
+            return session, session and db.meetings.find_one({'_id': session['meeting_key']})
+
+        # The catalog knows the meeting up front, so it is fetched alongside the session;
+        # a session too new for the catalog falls back to looking it up after
+        (session, meeting), positions, fastest_laps, catalog_meeting = run_parallel(
+            session_and_meeting,
+            lambda: with_session_drivers(db.session_results, queries.session_positions_pipeline(session_key), session_key),
+            lambda: with_session_drivers(db.laps, queries.session_fastest_laps_pipeline(session_key), session_key),
+            lambda: entry and db.meetings.find_one({'_id': entry['meeting_key']})
+        )
         if not session:
             return jsonify({"error": "Session not found"}), 404
-        meeting = db.meetings.find_one({'_id': session['meeting_key']})
-        positions_pipeline = [
-            {'$match': {'session_key': session_key}},
-            {'$addFields': {'is_finisher': {'$cond': {'if': {'$eq': ["$dnf", False]}, 'then': 1, 'else': 2}}}},
-            {'$sort': {'is_finisher': 1, 'position': 1}},
-            {'$lookup': {'from': 'drivers', 'localField': 'driver_number', 'foreignField': '_id', 'as': 'driver_info'}},
-            {'$unwind': '$driver_info'},
-            {'$project': {
-                '_id': 0, 'position': '$position', 'driver_number': '$driver_number',
-                'full_name': '$driver_info.full_name', 'team_name': '$driver_info.team_name',
-                'team_color': '$driver_info.team_colour', 'laps_completed': '$number_of_laps',
-                'headshot_url': '$driver_info.headshot_url', 'dnf': '$dnf'
-            }}
-        ]
-        positions = list(db.session_results.aggregate(positions_pipeline))
-        laps_pipeline = [
-            {'$match': {'session_key': session_key, 'lap_duration': {'$ne': None}}},
-            {'$sort': {'lap_duration': 1}},
-            {'$group': {
-                '_id': '$driver_number', 'fastest_lap_duration': {'$first': '$lap_duration'},
-                'lap_number': {'$first': '$lap_number'}
-            }},
-            {'$sort': {'fastest_lap_duration': 1}}, {'$limit': 10},
-            {'$lookup': {'from': 'drivers', 'localField': '_id', 'foreignField': '_id', 'as': 'driver_info'}},
-            {'$unwind': '$driver_info'},
-            {'$project': {
-                '_id': 0, 'driver_number': '$_id', 'full_name': '$driver_info.full_name',
-                'team_name': '$driver_info.team_name', 'team_color': '$driver_info.team_colour',
-                'lap_duration': '$fastest_lap_duration', 'lap_number': '$lap_number'
-            }}
-        ]
-        fastest_laps = list(db.laps.aggregate(laps_pipeline))
+        meeting = meeting or catalog_meeting
         response = {
             'session': session, 'meeting': meeting,
             'positions': positions, 'fastest_laps': fastest_laps
         }
-        return jsonify(parse_json(response))
+        return json_response(response)
     except Exception as e:
         logging.error(f"Error in /api/sessions/{session_key}/details: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/sessions/<int:session_key>/positions')
+@api.route('/api/sessions/<int:session_key>/positions')
+@response_cache.route
 def get_session_positions(session_key):
     try:
-        pipeline = [
-            {'$match': {'session_key': session_key}},
-            {'$addFields': {'is_finisher': {'$cond': { 'if': { '$eq': [ "$dnf", False ] }, 'then': 1, 'else': 2 }}}},
-            {'$sort': {'is_finisher': 1, 'position': 1}},
-            {'$lookup': {'from': 'drivers', 'localField': 'driver_number', 'foreignField': '_id', 'as': 'driver_info'}},
-            {'$unwind': '$driver_info'},
-            {'$project': {
-                '_id': 0, 'position': '$position', 'driver_number': '$driver_number',
-                'full_name': '$driver_info.full_name', 'team_name': '$driver_info.team_name',
-                'team_color': '$driver_info.team_colour', 'laps_completed': '$number_of_laps',
-                'headshot_url': '$driver_info.headshot_url', 'dnf': '$dnf'
-            }}
-        ]
+        pipeline = queries.session_positions_pipeline(session_key)
         positions = list(db.session_results.aggregate(pipeline))
-        return jsonify(parse_json(positions))
+        return json_response(positions)
     except Exception as e:
         logging.error(f"Error in /api/sessions/{session_key}/positions: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/laps')
+def telemetry_response(session_key, stream):
+    """Shared handler for the downsampled telemetry streams; see telemetry.py."""
+    try:
+        points = int(request.args.get('points', telemetry.DEFAULT_POINTS))
+        drivers_str = request.args.get('drivers')
+        drivers = [int(num) for num in drivers_str.split(',')] if drivers_str else None
+        start = telemetry.parse_time(request.args['start']) if request.args.get('start') else None
+        end = telemetry.parse_time(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({"error": "points and drivers must be integers, start and end ISO timestamps"}), 400
+    if not 3 <= points <= telemetry.MAX_POINTS:
+        return jsonify({"error": f"points must be between 3 and {telemetry.MAX_POINTS}"}), 400
+
+    collection, _, fields = telemetry.STREAMS[stream]
+    pipeline = queries.telemetry_pipeline(session_key, fields, drivers, start, end)
+    series = telemetry.downsample_stream(db[collection].aggregate(pipeline), stream, points)
+    return json_response({
+        'session_key': session_key, 'points': points, 'start': start, 'end': end, 'drivers': series
+    })
+
+@api.route('/api/sessions/<int:session_key>/positions/timeline')
+@response_cache.route
+def get_position_timeline(session_key):
+    try:
+        return telemetry_response(session_key, 'position')
+    except Exception as e:
+        logging.error(f"Error in /api/sessions/{session_key}/positions/timeline: {e}")
+        return jsonify({"error": "An internal server error occurred"}), 500
+
+@api.route('/api/sessions/<int:session_key>/intervals')
+@response_cache.route
+def get_intervals(session_key):
+    try:
+        return telemetry_response(session_key, 'intervals')
+    except Exception as e:
+        logging.error(f"Error in /api/sessions/{session_key}/intervals: {e}")
+        return jsonify({"error": "An internal server error occurred"}), 500
+
+@api.route('/api/sessions/<int:session_key>/race-trace')
+@response_cache.route
+def get_race_trace(session_key):
+    """Running order, gaps and race trace per lap, precomputed at ingest; see race_trace.py."""
+    try:
+        trace = db.race_traces.find_one({'_id': session_key}, {'_id': 0, 'built_at': 0})
+        if not trace:
+            return jsonify({"error": "No race trace for this session"}), 404
+        return json_response(trace)
+    except Exception as e:
+        logging.error(f"Error in /api/sessions/{session_key}/race-trace: {e}")
+        return jsonify({"error": "An internal server error occurred"}), 500
+
+@api.route('/api/sessions/<int:session_key>/stints/analysis')
+@response_cache.route
+def get_stint_analysis(session_key):
+    """Degradation, fuel-corrected pace and outlier laps per stint, and a compound comparison; see stint_analysis.py."""
+    try:
+        laps, stints, pit_stops = run_parallel(
+            lambda: list(db.laps.aggregate(queries.stint_laps_pipeline(session_key))),
+            lambda: list(db.stints.find(**queries.stints_query(session_key))),
+            lambda: list(db.pit_stops.find(**queries.pit_laps_query(session_key)))
+        )
+        if not laps:
+            return jsonify({"error": "No laps found for this session"}), 404
+        return json_response({'session_key': session_key, **analyze_stints(laps, stints, pit_stops)})
+    except Exception as e:
+        logging.error(f"Error in /api/sessions/{session_key}/stints/analysis: {e}")
+        return jsonify({"error": "An internal server error occurred"}), 500
+
+@api.route('/api/live/stream')
+def live_stream():
+    """Server-Sent Events of new position, intervals, laps and race_control rows for a live session."""
+    try:
+        session = live_hub.resolve_session(request.args.get('session_key', 'latest'))
+    except ValueError:
+        return jsonify({"error": "session_key must be a valid integer or 'latest'"}), 400
+    except Exception as e:
+        logging.error(f"Error in /api/live/stream: {e}")
+        return jsonify({"error": "Could not reach the live data source"}), 502
+    if session is None:
+        return jsonify({"error": "No live session found"}), 404
+    # A finished session has nothing left to poll; its data comes from the regular routes
+    if has_ended(session):
+        return jsonify({"error": "Session has ended"}), 409
+    session_key = session['session_key']
+    poller, subscriber = live_hub.subscribe(session_key)
+
+    def events():
+        try:
+            yield b'event: session\ndata: ' + dumps({'session_key': session_key}) + b'\n\n'
+            while True:
+                try:
+                    event = subscriber.get(timeout=LIVE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    # Comment lines keep proxies from closing an idle connection
+                    yield b': keepalive\n\n'
+                    continue
+                if event is None:
+                    return
+                yield f"event: {event['stream']}\ndata: ".encode() + dumps(event['rows']) + b'\n\n'
+        finally:
+            live_hub.unsubscribe(poller, subscriber)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@api.route('/api/laps')
+@snapshot_store.route
+@response_cache.route
 def get_laps():
     try:
         session_key_str = request.args.get('session_key')
         if not session_key_str:
             return jsonify({"error": "session_key query parameter is required"}), 400
         session_key = int(session_key_str)
-        sort_order = request.args.get('sort')
-        match_stage = {'session_key': session_key, 'lap_duration': {'$ne': None}}
-        pipeline = [
-            {'$match': match_stage},
-            {'$lookup': {
-                'from': 'drivers', 'localField': 'driver_number',
-                'foreignField': '_id', 'as': 'driver_info'
-            }},
-            {'$unwind': '$driver_info'},
-            {'$project': {
-                '_id': 1, 'session_key': 1, 'driver_number': 1, 'lap_number': 1, 'lap_duration': 1,
-                'stint': 1, 'is_pit_out_lap': 1, 'tyre_compound': 1,
-                'full_name': '$driver_info.full_name', 'team_name': '$driver_info.team_name',
-                'team_color': '$driver_info.team_colour'
-            }}
-        ]
-        if sort_order == 'fastest':
-            pipeline.extend([
-                {'$sort': {'lap_duration': 1}},
-                {'$group': {'_id': '$driver_number', 'fastest_lap_doc': {'$first': '$$ROOT'}}},
-                {'$replaceRoot': {'newRoot': '$fastest_lap_doc'}},
-                {'$sort': {'lap_duration': 1}}, {'$limit': 10}
-            ])
+        try:
+            conditions = condition_filter(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        fastest = request.args.get('sort') == 'fastest'
+        columnar = request.args.get('format') == 'columnar'
+        limit_str, cursor = request.args.get('limit'), request.args.get('cursor')
+        paginated = limit_str is not None or cursor is not None
+        if paginated and fastest:
+            return jsonify({"error": "limit and cursor cannot be combined with sort=fastest"}), 400
+        if not paginated and not columnar:
+            pipeline = queries.laps_pipeline(session_key, fastest=fastest, conditions=conditions)
+            if in_batch():
+                return json_response(with_session_drivers(db.laps, pipeline, session_key))
+            # Streamed straight from the cursor; a full race is over a thousand documents
+            return json_stream(db.laps.aggregate(pipeline))
+
+        next_cursor = None
+        if paginated:
+            try:
+                limit = min(int(limit_str or LAPS_PAGE_MAX), LAPS_PAGE_MAX)
+                after = decode_cursor(cursor, 2) if cursor else None
+            except ValueError:
+                return jsonify({"error": "limit must be a positive integer and cursor one returned by this endpoint"}), 400
+            if limit < 1:
+                return jsonify({"error": "limit must be a positive integer and cursor one returned by this endpoint"}), 400
+            # One extra row tells us whether another page follows
+            pipeline = queries.laps_page_pipeline(session_key, after=after, limit=limit + 1, join=not columnar,
+                                                  conditions=conditions)
+            laps = list(db.laps.aggregate(pipeline))
+            if len(laps) > limit:
+                laps = laps[:limit]
+                next_cursor = encode_cursor((laps[-1]['lap_number'], laps[-1]['driver_number']))
         else:
-            pipeline.append({'$sort': {'lap_number': 1, 'lap_duration': 1}})
-        laps = list(db.laps.aggregate(pipeline))
-        return jsonify(parse_json(laps))
+            laps = list(db.laps.aggregate(queries.laps_pipeline(session_key, fastest=fastest, join=False,
+                                                                conditions=conditions)))
+
+        if not columnar:
+            return json_response({"laps": laps, "next_cursor": next_cursor})
+        # Driver info once per driver rather than repeated on every lap
+        driver_numbers = sorted({lap['driver_number'] for lap in laps})
+        drivers = {
+            d['_id']: {'full_name': d.get('full_name'), 'team_name': d.get('team_name'), 'team_color': d.get('team_colour')}
+            for d in db.drivers.find({'_id': {'$in': driver_numbers}}, {'full_name': 1, 'team_name': 1, 'team_colour': 1})
+        }
+        return json_response({
+            "count": len(laps), "columns": to_columns(laps, queries.LAP_FIELDS),
+            "drivers": drivers, "next_cursor": next_cursor
+        })
     except (ValueError, TypeError):
         return jsonify({"error": "session_key must be a valid integer"}), 400
     except Exception as e:
         logging.error(f"Error in /api/laps: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/drivers/all')
+@api.route('/api/drivers/all')
+@response_cache.route
 def get_all_drivers():
     try:
-        drivers = list(db.drivers.find().sort('full_name', 1))
-        return jsonify(parse_json(drivers))
+        return json_response(reference_data.current().drivers)
     except Exception as e:
         logging.error(f"Error in /api/drivers/all: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/drivers')
+def session_drivers(session_key):
+    """Driver documents of the drivers classified in a session, or who set a lap in it, by team."""
+    distinct_driver_nums = db.session_results.distinct('driver_number', {'session_key': session_key})
+    if not distinct_driver_nums:
+        distinct_driver_nums = db.laps.distinct('driver_number', {'session_key': session_key})
+    return list(db.drivers.find({'_id': {'$in': distinct_driver_nums}}).sort('team_name', 1))
+
+def with_session_drivers(collection, pipeline, session_key):
+    """
+    Runs a pipeline that joins `drivers`. Inside a batch the join is done here instead, from the
+    session's drivers the batch loads once, plus any driver of the rows they do not cover.
+    """
+    if not in_batch():
+        return list(collection.aggregate(pipeline))
+    head, local_field, tail = queries.split_driver_lookup(pipeline)
+    rows = list(collection.aggregate(head))
+    drivers = {d['_id']: d for d in shared(('session_drivers', session_key), lambda: session_drivers(session_key))}
+    # Drivers with laps but no classification are not among the session's drivers
+    missing = {row.get(local_field) for row in rows} - drivers.keys()
+    if missing:
+        drivers.update({d['_id']: d for d in db.drivers.find({'_id': {'$in': list(missing)}})})
+    return queries.join_drivers(rows, local_field, drivers, tail)
+
+@api.route('/api/drivers')
+@response_cache.route
 def get_drivers_by_session():
     try:
         session_key = int(request.args.get('session_key'))
-        distinct_driver_nums = db.session_results.distinct('driver_number', {'session_key': session_key})
-        if not distinct_driver_nums:
-            distinct_driver_nums = db.laps.distinct('driver_number', {'session_key': session_key})
-        drivers = list(db.drivers.find({'_id': {'$in': distinct_driver_nums}}).sort('team_name', 1))
-        return jsonify(parse_json(drivers))
+        return json_response(shared(('session_drivers', session_key), lambda: session_drivers(session_key)))
     except (ValueError, TypeError):
         return jsonify({"error": "session_key must be a valid integer"}), 400
     except Exception as e:
         logging.error(f"Error in /api/drivers: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/stats/season/<int:year>')
+@api.route('/api/stats/season/<int:year>')
+@response_cache.route
 def get_season_stats(year):
     try:
-        total_sessions = db.sessions.count_documents({'year': year})
-        pipeline = [
-            {'$match': {'year': year}},
-            {'$lookup': {
-                'from': 'session_results', 'localField': '_id',
-                'foreignField': 'session_key', 'as': 'results'
-            }},
-            {'$unwind': '$results'},
-            {'$group': {'_id': '$results.driver_number'}}
-        ]
-        drivers = list(db.sessions.aggregate(pipeline))
-        total_drivers = len(drivers)
+        total_sessions = len(session_catalog.current().session_keys(year=year))
+        total_drivers = len(db.session_results.distinct('driver_number', {'year': year}))
         return jsonify({
             'year': year, 'total_sessions': total_sessions,
             'total_drivers': total_drivers
@@ -452,62 +671,40 @@ def get_season_stats(year):
         logging.error(f"Error in /api/stats/season/{year}: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
         
-@app.route('/api/drivers/<int:driver_number>/stats')
+@api.route('/api/drivers/<int:driver_number>/stats')
+@response_cache.route
 def get_driver_stats(driver_number):
     try:
-        race_sessions = db.sessions.find({'session_name': 'Race'}, {'_id': 1})
-        race_session_keys = [s['_id'] for s in race_sessions]
-        wins = db.session_results.count_documents({
-            'driver_number': driver_number, 'position': 1,
-            'session_key': {'$in': race_session_keys}
-        })
-        championship_pipeline = [
-            {'$lookup': {
-                'from': 'sessions', 'localField': 'session_key',
-                'foreignField': '_id', 'as': 'session_info'
-            }},
-            {'$unwind': '$session_info'},
-            {'$match': {'session_info.session_name': 'Race', 'points': {'$ne': None}}},
-            {'$group': {
-                '_id': {'year': '$session_info.year', 'driver_number': '$driver_number'},
-                'total_points': {'$sum': '$points'}
-            }},
-            {'$sort': {'_id.year': 1, 'total_points': -1}},
-            {'$group': {
-                '_id': '$_id.year',
-                'champion_driver': {'$first': '$_id.driver_number'}
-            }},
-            {'$match': {'champion_driver': driver_number}},
-            {'$count': 'count'}
-        ]
-        championship_result = list(db.session_results.aggregate(championship_pipeline))
-        championships = championship_result[0]['count'] if championship_result else 0
+        career = db.driver_career_stats.find_one({'_id': driver_number})
+        if career:
+            wins, championships = career['wins'], career['championships']
+        else:
+            # Driver not materialized yet (see standings.py); compute it live
+            wins = db.session_results.count_documents(queries.race_wins_filter(driver_number))
+            championship_result = list(db.session_results.aggregate(queries.championships_pipeline(driver_number)))
+            championships = championship_result[0]['count'] if championship_result else 0
         stats = {
             'driver_number': driver_number, 'grand_prix_victories': wins,
             'championships_won': championships
         }
-        return jsonify(parse_json(stats))
+        return json_response(stats)
     except Exception as e:
         logging.error(f"Error in /api/drivers/{driver_number}/stats: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
-@app.route('/api/sessions/<int:session_key>/compare')
+@api.route('/api/sessions/<int:session_key>/compare')
+@response_cache.route
 def get_driver_comparison(session_key):
     try:
         driver_ids_str = request.args.get('drivers')
         if not driver_ids_str:
             return jsonify({"error": "drivers query parameter is required"}), 400
         driver_ids = [int(num) for num in driver_ids_str.split(',')]
-        positions_data = list(db.session_results.find({'session_key': session_key, 'driver_number': {'$in': driver_ids}}))
-        fastest_laps_data = list(db.laps.aggregate([
-            {'$match': {'session_key': session_key, 'driver_number': {'$in': driver_ids}, 'lap_duration': {'$ne': None}}},
-            {'$sort': {'lap_duration': 1}},
-            {'$group': {'_id': '$driver_number', 'fastest_lap': {'$first': '$lap_duration'}}}
-        ]))
-        pit_stops_data = list(db.pit_stops.aggregate([
-            {'$match': {'session_key': session_key, 'driver_number': {'$in': driver_ids}}},
-            {'$group': {'_id': '$driver_number', 'pit_stop_count': {'$sum': 1}}}
-        ]))
+        positions_data, fastest_laps_data, pit_stops_data = run_parallel(
+            lambda: list(db.session_results.find({'session_key': session_key, 'driver_number': {'$in': driver_ids}})),
+            lambda: list(db.laps.aggregate(queries.compare_fastest_laps_pipeline(session_key, driver_ids))),
+            lambda: list(db.pit_stops.aggregate(queries.compare_pit_stops_pipeline(session_key, driver_ids)))
+        )
         def get_driver_stat(data_list, driver_num, key, default_val=None):
             item = next((d for d in data_list if d.get('_id') == driver_num or d.get('driver_number') == driver_num), None)
             return item.get(key) if item else default_val
@@ -520,10 +717,13 @@ def get_driver_comparison(session_key):
                 'pit_stops': get_driver_stat(pit_stops_data, driver_num, 'pit_stop_count', 0)
             }
             comparison_results.append(driver_data)
-        return jsonify(parse_json(comparison_results))
+        return json_response(comparison_results)
     except Exception as e:
         logging.error(f"Error in /api/sessions/{session_key}/compare: {e}")
         return jsonify({"error": "An internal server error occurred"}), 500
 
+app = create_app()
+
 if __name__ == '__main__':
+    warm_up()
     app.run(debug=True, port=5000)
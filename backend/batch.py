@@ -0,0 +1,164 @@
+# backend/batch.py
+"""
+Serves several API requests in one round trip.
+
+`POST /api/batch` takes a list of sub-requests against the existing routes:
+
+    {"requests": [
+        {"id": "details", "path": "/api/sessions/9158/details"},
+        {"id": "drivers", "path": "/api/drivers?session_key=9158"},
+        {"id": "laps", "method": "POST", "path": "/api/comparison/laps", "body": [...]}
+    ]}
+
+Each one is dispatched in-process through the full Flask request cycle, with its own
+request context, so it passes through the response cache and metrics like any other
+request. The sub-requests run concurrently on the query pool (see concurrency.py). The
+response lists every result in request order with its own status, and each body is copied
+in unparsed:
+
+    {"responses": [{"id": "details", "status": 200, "ms": 4.2, "body": {...}}, ...],
+     "shared_hits": 1, "ms": 6.0}
+
+Sub-requests of one batch share a memo. A route that reads a document other routes also
+read, such as a session or its drivers, fetches it through `shared`, so a batch queries it
+once. Inside a batch, the session details and laps routes also take their driver info from
+the session's shared drivers instead of each joining `drivers` in its own pipeline. Outside
+a batch `shared` simply calls the loader.
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from urllib.parse import urlsplit
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+
+from concurrency import run_parallel
+from encoding import dumps
+
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', '20'))
+# Endpoints that cannot be answered inside a batch: the batch itself and never-ending streams
+EXCLUDED_ENDPOINTS = {'api.post_batch', 'api.live_stream'}
+METHODS = ('GET', 'POST')
+
+_memo = contextvars.ContextVar('batch_memo', default=None)
+
+
+class Memo:
+    """Values loaded once per batch. Concurrent callers of a key wait for the first to load it."""
+
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+
+    def get(self, key, loader):
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = {'ready': threading.Event()}
+                owner = True
+            else:
+                self.hits += 1
+                owner = False
+        if owner:
+            try:
+                entry['value'] = loader()
+            except Exception as e:
+                entry['error'] = e
+            finally:
+                entry['ready'].set()
+        else:
+            entry['ready'].wait()
+        if 'error' in entry:
+            raise entry['error']
+        return entry['value']
+
+
+def shared(key, loader):
+    """`loader()`, called once per batch for each key. Callers must not modify the value."""
+    memo = _memo.get()
+    return loader() if memo is None else memo.get(key, loader)
+
+
+def in_batch():
+    """True while serving a sub-request of a batch."""
+    return _memo.get() is not None
+
+
+def parse_batch(payload):
+    """Validates a batch body; returns [(id, method, path, query string, JSON body)] or raises ValueError."""
+    items = payload.get('requests') if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        raise ValueError("Body must be a non-empty list of requests, or an object with one under 'requests'")
+    if len(items) > BATCH_MAX_REQUESTS:
+        raise ValueError(f"A batch may hold at most {BATCH_MAX_REQUESTS} requests")
+    parsed = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {'path': item}
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str) or not item['path'].startswith('/api/'):
+            raise ValueError(f"Request {index} needs a 'path' starting with /api/")
+        method = str(item.get('method', 'GET')).upper()
+        if method not in METHODS:
+            raise ValueError(f"Request {index}: method must be one of {', '.join(METHODS)}")
+        url = urlsplit(item['path'])
+        parsed.append((item.get('id', index), method, url.path, url.query, item.get('body')))
+    return parsed
+
+
+def _dispatch(app, method, path, query, body):
+    """Runs one sub-request through the app; returns (status, mimetype, body bytes)."""
+    builder = EnvironBuilder(path=path, query_string=query, method=method, json=body)
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+    # A fresh app context gives each sub-request its own `g` instead of the batch request's
+    with app.app_context(), app.request_context(environ) as context:
+        if context.request.routing_exception is None and context.request.endpoint in EXCLUDED_ENDPOINTS:
+            return 400, 'application/json', dumps({"error": "This endpoint cannot be batched"})
+        try:
+            response = app.full_dispatch_request()
+        except HTTPException as e:
+            response = e.get_response()
+        except Exception as e:
+            logging.error(f"Error in batched {method} {path}: {e}")
+            return 500, 'application/json', dumps({"error": "An internal server error occurred"})
+        # Files, such as published snapshots, are read into the body rather than passed through
+        response.direct_passthrough = False
+        try:
+            return response.status_code, response.mimetype, response.get_data()
+        finally:
+            # Releases the file a snapshot response holds open
+            response.close()
+
+
+def run_batch(app, items):
+    """Dispatches parsed sub-requests concurrently and renders the combined response body."""
+    memo = Memo()
+    started = time.perf_counter()
+
+    def call(item):
+        def run():
+            token = _memo.set(memo)
+            try:
+                request_started = time.perf_counter()
+                status, mimetype, body = _dispatch(app, *item[1:])
+                return status, mimetype, body, (time.perf_counter() - request_started) * 1000
+            finally:
+                _memo.reset(token)
+        return run
+
+    results = run_parallel(*[call(item) for item in items])
+    parts = []
+    for item, (status, mimetype, body, ms) in zip(items, results):
+        if mimetype != 'application/json':
+            body = dumps(body.decode('utf-8', 'replace'))
+        parts.append(b'{"id":' + dumps(item[0]) + b',"status":' + str(status).encode() +
+                     b',"ms":' + dumps(round(ms, 2)) + b',"body":' + (body or b'null') + b'}')
+    total_ms = round((time.perf_counter() - started) * 1000, 2)
+    return (b'{"responses":[' + b','.join(parts) + b'],"shared_hits":' + str(memo.hits).encode() +
+            b',"ms":' + dumps(total_ms) + b'}')
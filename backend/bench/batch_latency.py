@@ -0,0 +1,102 @@
+# backend/bench/batch_latency.py
+"""
+Page-load latency of the session page's requests, sent separately and as one /api/batch call.
+
+    gunicorn -b 127.0.0.1:5000 app:app
+    python bench/batch_latency.py --loads 50
+
+The page's data is a session's details, its drivers, all its laps and its fastest laps.
+Each page load is timed three ways, with a new HTTP connection per load as a browser
+opening the page would have:
+
+* `sequential`: one request after another, as the client awaited them.
+* `concurrent`: all requests at once, one connection each.
+* `batch`: a single POST to /api/batch.
+
+Run the API with RESPONSE_CACHE_ENABLED=false to time the queries rather than the cache.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def page_paths(base_url):
+    """The session page's requests for the latest race the API knows."""
+    meeting = requests.get(f"{base_url}/api/meetings", timeout=30).json()[0]
+    details = requests.get(f"{base_url}/api/meetings/{meeting['_id']}/details", timeout=30).json()
+    race = next((s for s in details['sessions'] if s['session_name'] == 'Race'), details['sessions'][0])
+    session_key = race['_id']
+    return [
+        f"/api/sessions/{session_key}/details",
+        f"/api/drivers?session_key={session_key}",
+        f"/api/laps?session_key={session_key}",
+        f"/api/laps?session_key={session_key}&sort=fastest",
+    ]
+
+
+def _get(base_url, path):
+    with requests.Session() as session:
+        response = session.get(base_url + path, timeout=60)
+        response.raise_for_status()
+        return len(response.content)
+
+
+def sequential(base_url, paths, executor):
+    with requests.Session() as session:
+        size = 0
+        for path in paths:
+            response = session.get(base_url + path, timeout=60)
+            response.raise_for_status()
+            size += len(response.content)
+        return size
+
+
+def concurrent(base_url, paths, executor):
+    return sum(executor.map(lambda path: _get(base_url, path), paths))
+
+
+def batch(base_url, paths, executor):
+    with requests.Session() as session:
+        response = session.post(f"{base_url}/api/batch", json={'requests': paths}, timeout=60)
+        response.raise_for_status()
+        statuses = [item['status'] for item in response.json()['responses']]
+        if any(status != 200 for status in statuses):
+            raise SystemExit(f"A batched request failed: {statuses}")
+        return len(response.content)
+
+
+def measure(mode, base_url, paths, loads, executor):
+    timings, size = [], 0
+    for _ in range(loads):
+        started = time.perf_counter()
+        size = mode(base_url, paths, executor)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'p50_ms': round(statistics.median(timings), 1),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 1),
+        'mean_ms': round(statistics.mean(timings), 1),
+        'bytes': size,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare separate requests with one /api/batch call for a page load.")
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--loads', type=int, default=50, help="Page loads timed per mode.")
+    args = parser.parse_args()
+
+    paths = page_paths(args.base_url)
+    print(f"Page requests: {', '.join(paths)}")
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        # One untimed load per mode, so every mode starts from the same warm server
+        for mode in (sequential, concurrent, batch):
+            mode(args.base_url, paths, executor)
+        print(f"{'mode':<12} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'bytes':>10}")
+        for mode in (sequential, concurrent, batch):
+            result = measure(mode, args.base_url, paths, args.loads, executor)
+            print(f"{mode.__name__:<12} {result['p50_ms']:>8} {result['p95_ms']:>8} {result['mean_ms']:>8} "
+                  f"{result['bytes']:>10}")
@@ -0,0 +1,68 @@
+# backend/bench/encoder.py
+"""
+Microbenchmark of the response encoder against the old parse_json + jsonify round trip.
+
+    python bench/encoder.py --docs 1200 --repeat 200
+
+Payloads are synthetic but shaped like /api/laps documents (ObjectId ids, floats, strings,
+a datetime), at the size of a full race and of a long practice session.
+"""
+import os
+import sys
+import json
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId, json_util
+from flask import Flask, jsonify
+
+from encoding import json_response, json_stream
+
+
+def lap_documents(count, seed=1):
+    rng = random.Random(seed)
+    start = datetime(2024, 3, 2, 15, tzinfo=timezone.utc)
+    return [{
+        '_id': ObjectId(), 'session_key': 9472, 'driver_number': rng.choice([1, 4, 11, 16, 44, 55, 63, 81]),
+        'lap_number': i // 20 + 1, 'lap_duration': round(rng.uniform(90, 100), 3), 'stint': 1 + i // 400,
+        'is_pit_out_lap': rng.random() < 0.03, 'tyre_compound': rng.choice(['SOFT', 'MEDIUM', 'HARD']),
+        'date_start': start + timedelta(seconds=95 * i), 'full_name': 'Max VERSTAPPEN',
+        'team_name': 'Red Bull Racing', 'team_color': '3671C6'
+    } for i in range(count)]
+
+
+def parse_json(data):
+    """The encoder the routes used before: dumps, loads back, then jsonify dumps again."""
+    return json.loads(json_util.dumps(data))
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare response encoders.")
+    parser.add_argument('--docs', type=int, nargs='+', default=[1200, 3000])
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    with app.app_context():
+        for count in args.docs:
+            docs = lap_documents(count)
+            old = measure(lambda: jsonify(parse_json(docs)).get_data(), args.repeat)
+            new = measure(lambda: json_response(docs).get_data(), args.repeat)
+            streamed = measure(lambda: b''.join(json_stream(iter(docs)).response), args.repeat)
+            size = len(json_response(docs).get_data())
+            print(f"{count:>6} docs ({size / 1024:.0f} KiB): parse_json+jsonify {old:7.2f} ms   "
+                  f"json_response {new:6.2f} ms ({old / new:4.1f}x)   json_stream {streamed:6.2f} ms")
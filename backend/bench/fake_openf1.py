@@ -0,0 +1,222 @@
+# backend/bench/fake_openf1.py
+"""
+Local stand-in for the OpenF1 API, used to exercise and time the ingestor without network access.
+
+    python bench/fake_openf1.py --port 8001 --meetings 24 --latency 0.05
+    python data_ingestor.py --api-base http://127.0.0.1:8001/v1 --rate-limit 0
+
+`--latency` adds a fixed delay per request to mimic the real API's round trip, and
+`--error-rate` makes a fraction of requests fail with 429/503 to exercise the retry path.
+
+`--replay SESSION_KEY` replays one session as if it were live: its position, intervals, laps
+and race_control rows only appear once the replay clock, running `--speed` times faster than
+real time from server start, passes their timestamp. `session_key=latest` then resolves to it,
+and the session is listed as running from server start, so the API accepts it as live.
+
+    python bench/fake_openf1.py --port 8001 --replay 9005 --speed 10 --samples 2000
+    OPENF1_API_BASE=http://127.0.0.1:8001/v1 python live.py --interval 2
+
+Comparison filters in OpenF1's syntax (`date>2023-09-16T13:03:35`, `lap_number>=10`) are
+honoured on every endpoint, and equality filters on any field of meetings and sessions.
+Responses carry an ETag and a matching If-None-Match is answered with 304.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+DRIVER_NUMBERS = [1, 4, 11, 14, 16, 18, 22, 23, 24, 27, 31, 44, 55, 63, 77, 81, 2, 10, 20, 3]
+REPLAY_FIELDS = {'position': 'date', 'intervals': 'date', 'laps': 'date_start', 'race_control': 'date'}
+FILTER = re.compile(r'^([a-z_]+)(>=|<=|>|<|=)(.*)$')
+SESSION_NAMES = [('Practice 1', 'Practice'), ('Practice 2', 'Practice'), ('Practice 3', 'Practice'),
+                 ('Qualifying', 'Qualifying'), ('Race', 'Race')]
+
+
+def build_dataset(meetings, laps_per_session, samples_per_driver, seed=1):
+    """Builds a small, deterministic OpenF1-shaped dataset keyed by endpoint."""
+    rng = random.Random(seed)
+    data = {'meetings': [], 'sessions': [], 'by_session': {}}
+    season_start = datetime(2023, 3, 1, tzinfo=timezone.utc)
+    session_key = 9000
+    for m in range(meetings):
+        meeting_key = 1200 + m
+        start = season_start + timedelta(days=14 * m)
+        data['meetings'].append({
+            'meeting_key': meeting_key, 'meeting_name': f'Grand Prix {m + 1}', 'year': start.year,
+            'circuit_key': 10 + m, 'circuit_short_name': f'Circuit {m + 1}', 'country_name': 'Testland',
+            'country_code': 'TST', 'location': f'City {m + 1}', 'date_start': start.isoformat(),
+        })
+        for day, (name, session_type) in enumerate(SESSION_NAMES):
+            session_key += 1
+            date_start = start + timedelta(days=day // 2, hours=2 * day)
+            data['sessions'].append({
+                'session_key': session_key, 'meeting_key': meeting_key, 'session_name': name,
+                'session_type': session_type, 'year': start.year, 'circuit_key': 10 + m,
+                'date_start': date_start.isoformat(), 'date_end': (date_start + timedelta(hours=2)).isoformat(),
+            })
+            data['by_session'][session_key] = _session_payload(rng, session_key, meeting_key, date_start,
+                                                                laps_per_session, samples_per_driver)
+    return data
+
+
+def _session_payload(rng, session_key, meeting_key, date_start, laps, samples):
+    common = {'session_key': session_key, 'meeting_key': meeting_key}
+    payload = {name: [] for name in ['drivers', 'intervals', 'laps', 'pit', 'position',
+                                     'race_control', 'session_result', 'stints', 'weather']}
+    for position, number in enumerate(DRIVER_NUMBERS, start=1):
+        payload['drivers'].append({**common, 'driver_number': number, 'full_name': f'Driver {number}',
+                                   'team_name': f'Team {number % 10}', 'team_colour': '3671C6'})
+        payload['session_result'].append({**common, 'driver_number': number, 'position': position,
+                                          'points': max(0, 26 - position), 'dnf': False,
+                                          'number_of_laps': laps})
+        for lap in range(1, laps + 1):
+            s1, s2, s3 = (rng.uniform(25, 32) for _ in range(3))
+            payload['laps'].append({**common, 'driver_number': number, 'lap_number': lap,
+                                    'lap_duration': round(s1 + s2 + s3, 3), 'duration_sector_1': round(s1, 3),
+                                    'duration_sector_2': round(s2, 3), 'duration_sector_3': round(s3, 3),
+                                    'is_pit_out_lap': False,
+                                    'date_start': (date_start + timedelta(seconds=90 * lap)).isoformat()})
+        for i in range(samples):
+            date = (date_start + timedelta(seconds=4 * i)).isoformat()
+            payload['position'].append({**common, 'driver_number': number, 'position': position, 'date': date})
+            payload['intervals'].append({**common, 'driver_number': number, 'date': date,
+                                         'gap_to_leader': round(position * rng.uniform(0.5, 1.5), 3),
+                                         'interval': round(rng.uniform(0.2, 2.0), 3)})
+    # Fixed messages, so adding them leaves the random draws above unchanged
+    for seconds, lap, category, flag, message in [(0, 1, 'Flag', 'GREEN', 'GREEN LIGHT - PIT EXIT OPEN'),
+                                                  (60, 1, 'Flag', 'YELLOW', 'YELLOW IN TRACK SECTOR 3'),
+                                                  (75, 1, 'Flag', 'CLEAR', 'CLEAR IN TRACK SECTOR 3'),
+                                                  (90 * laps, laps, 'Flag', 'CHEQUERED', 'CHEQUERED FLAG')]:
+        payload['race_control'].append({**common, 'date': (date_start + timedelta(seconds=seconds)).isoformat(),
+                                        'lap_number': lap, 'category': category, 'flag': flag, 'message': message,
+                                        'driver_number': None, 'scope': 'Track'})
+    return payload
+
+
+def parse_query(query):
+    """Splits a query string into OpenF1-style (field, operator, value) conditions."""
+    conditions = []
+    for part in filter(None, query.split('&')):
+        match = FILTER.match(unquote(part.replace('+', ' ')))
+        if match:
+            conditions.append(match.groups())
+    return conditions
+
+
+def _compare(value, operator, target):
+    if value is None:
+        return False
+    if isinstance(value, (int, float)):
+        try:
+            target = float(target)
+        except ValueError:
+            return False
+    else:
+        try:
+            # Timestamps compare as instants, whatever precision either side was written with
+            value, target = datetime.fromisoformat(value), datetime.fromisoformat(target)
+            if target.tzinfo is None:
+                target = target.replace(tzinfo=timezone.utc)
+        except (TypeError, ValueError):
+            value = str(value)
+    return {'=': value == target, '>': value > target, '>=': value >= target,
+            '<': value < target, '<=': value <= target}[operator]
+
+
+def apply_filters(rows, conditions):
+    return [row for row in rows if all(_compare(row.get(field), op, target) for field, op, target in conditions)]
+
+
+class Handler(BaseHTTPRequestHandler):
+    dataset = None
+    latency = 0.0
+    error_rate = 0.0
+    replay = None
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            self._send(random.choice([429, 503]), {'detail': 'simulated failure'})
+            return
+        url = urlparse(self.path)
+        endpoint = url.path.rstrip('/').rsplit('/', 1)[-1]
+        conditions = parse_query(url.query)
+        params = {field: value for field, op, value in conditions if op == '='}
+        filters = [c for c in conditions if c[1] != '=']
+        if endpoint in ('meetings', 'sessions'):
+            rows = self.dataset[endpoint]
+            if params.get('session_key') == 'latest':
+                key = self.replay['session_key'] if self.replay else rows[-1]['session_key']
+                rows = [s for s in rows if s['session_key'] == key]
+                del params['session_key']
+            rows = [r for r in rows if all(str(r.get(field)) == value for field, value in params.items())]
+            self._send(200, apply_filters(rows, filters))
+        else:
+            session_key = int(params.get('session_key', 0)) if params.get('session_key', '0').isdigit() else 0
+            payload = self.dataset['by_session'].get(session_key, {})
+            if endpoint not in payload:
+                self._send(404, {'detail': 'Not found'})
+                return
+            rows = payload[endpoint]
+            if self.replay and session_key == self.replay['session_key'] and endpoint in REPLAY_FIELDS:
+                rows = apply_filters(rows, [(REPLAY_FIELDS[endpoint], '<=', self.replay_clock())])
+            self._send(200, apply_filters(rows, filters))
+
+    @classmethod
+    def replay_clock(cls):
+        """The replayed session's current instant, as an ISO timestamp."""
+        elapsed = (time.monotonic() - cls.replay['started']) * cls.replay['speed']
+        return (cls.replay['date_start'] + timedelta(seconds=elapsed)).isoformat()
+
+    def _send(self, status, body):
+        encoded = json.dumps(body).encode()
+        etag = f'"{hashlib.sha1(encoded).hexdigest()}"'
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        if status == 200:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a synthetic OpenF1 dataset locally.")
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--meetings', type=int, default=4)
+    parser.add_argument('--laps', type=int, default=50, help="Laps per driver per session.")
+    parser.add_argument('--samples', type=int, default=200, help="Position/interval samples per driver per session.")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds of simulated latency per request.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with 429/503.")
+    parser.add_argument('--replay', type=int, help="Session key to replay as a live session.")
+    parser.add_argument('--speed', type=float, default=1.0, help="Replay clock speed relative to real time.")
+    args = parser.parse_args()
+
+    Handler.dataset = build_dataset(args.meetings, args.laps, args.samples)
+    Handler.latency = args.latency
+    Handler.error_rate = args.error_rate
+    if args.replay:
+        session = next(s for s in Handler.dataset['sessions'] if s['session_key'] == args.replay)
+        Handler.replay = {'session_key': args.replay, 'speed': args.speed, 'started': time.monotonic(),
+                          'date_start': datetime.fromisoformat(session['date_start'])}
+        # Wall-clock dates, as OpenF1 would list a session running now
+        now = datetime.now(timezone.utc)
+        duration = (datetime.fromisoformat(session['date_end']) - Handler.replay['date_start']) / args.speed
+        session.update(date_start=now.isoformat(), date_end=(now + duration).isoformat())
+        print(f"Replaying session {args.replay} ({session['session_name']}) at {args.speed}x")
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), Handler)
+    print(f"Fake OpenF1 serving {args.meetings} meetings on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
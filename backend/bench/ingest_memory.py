@@ -0,0 +1,99 @@
+# backend/bench/ingest_memory.py
+"""
+Checks that ingesting a large endpoint keeps peak memory flat (see streaming.py).
+
+    MONGO_URI=mongodb://localhost:27017 python bench/ingest_memory.py --samples 5000 --max-peak-mb 24
+
+The script starts a fake OpenF1 server (bench/fake_openf1.py) in a subprocess, so the server's
+own memory is not counted. The server has `--samples` position rows per driver. The script
+then compares tracemalloc's peak for two runs over the race:
+
+* Decoding the whole payload with `response.json()`, as the ingestor used to.
+* Streaming the same payload through `ingest_session_endpoint` into a scratch database.
+
+The scratch database is dropped afterwards. The script exits with status 1 if the streamed
+peak exceeds `--max-peak-mb`. Run it at two sizes to see that the streamed peak does not grow
+with the payload.
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_ingestor
+from denormalize import session_attributes
+from openf1_client import OpenF1Client
+from schema import session_filter
+
+SCRATCH_DATABASE = 'f1_bench_ingest_memory'
+
+
+def start_server(samples):
+    """Starts the fake OpenF1 server on a free port; returns (process, base URL)."""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_openf1.py')
+    process = subprocess.Popen([sys.executable, script, '--port', str(port), '--meetings', '1', '--laps', '1',
+                                '--samples', str(samples), '--latency', '0'], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, f'http://127.0.0.1:{port}/v1'
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit("The fake OpenF1 server did not start.")
+
+
+def traced(call):
+    """Runs `call` under tracemalloc; returns (peak MiB, seconds)."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2 ** 20, time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure peak memory while ingesting a large endpoint.")
+    parser.add_argument('--samples', type=int, default=5000, help="Position rows per driver.")
+    parser.add_argument('--max-peak-mb', type=float, default=24.0, help="Fail if the streamed peak exceeds this.")
+    args = parser.parse_args()
+
+    process, base_url = start_server(args.samples)
+    api = OpenF1Client(base_url, rate_limit=0)
+    race = next(s for s in api.get('sessions') if s['session_name'] == 'Race')
+    data_ingestor.db = data_ingestor.client[SCRATCH_DATABASE]
+    params = {'session_key': race['session_key']}
+    try:
+        received = api.stats['bytes']
+        rows = len(api.get('position', params))
+        payload_mb = (api.stats['bytes'] - received) / 2 ** 20
+        materialized_mb, materialized_s = traced(lambda: api.get('position', params))
+        streamed_mb, streamed_s = traced(lambda: data_ingestor.ingest_session_endpoint(
+            api, race['session_key'], 'position', None, session_attributes(race), True, data_ingestor.IngestReport()))
+        stored = data_ingestor.db.position.count_documents(session_filter('position', race['session_key']))
+    finally:
+        data_ingestor.client.drop_database(SCRATCH_DATABASE)
+        data_ingestor.client.close()
+        api.close()
+        process.terminate()
+
+    print(f"{rows} position rows ({payload_mb:.1f} MiB of JSON)")
+    print(f"  response.json()        peak {materialized_mb:>7.1f} MiB   {materialized_s:>6.2f}s (fetch and decode)")
+    print(f"  streamed ingest        peak {streamed_mb:>7.1f} MiB   {streamed_s:>6.2f}s ({stored} stored)")
+    if stored != rows:
+        raise SystemExit(f"Stored {stored} of {rows} rows.")
+    if streamed_mb > args.max_peak_mb:
+        print(f"Streamed peak exceeds {args.max_peak_mb} MiB.")
+        sys.exit(1)
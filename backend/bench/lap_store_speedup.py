@@ -0,0 +1,97 @@
+# backend/bench/lap_store_speedup.py
+"""
+Times analytical lap queries in MongoDB against the columnar lap store (lap_store.py).
+
+    python bench/synthetic.py --seasons 20 --drop
+    python bench/lap_store_speedup.py --repeat 5
+
+The script exports every season to a temporary store and then runs each query both ways:
+
+* The best lap per driver at every circuit, as in the track branch of `/api/analysis`.
+* Lap time statistics per driver and season.
+
+It checks that both sides return the same best laps, then prints the median times and the speedup.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import statistics
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import MongoClient
+
+import queries
+from generation import read_generation
+from lap_store import LapStoreSnapshot, export_seasons, read_manifest
+
+
+def timed(call, repeat):
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = call()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), result
+
+
+def mongo_best_laps(db, drivers, circuits):
+    return {circuit: {r['driver_number']: r['best_lap_time']['fastest_lap']
+                      for r in db.laps.aggregate(queries.track_analysis_pipeline(drivers, circuit))}
+            for circuit in circuits}
+
+
+def store_best_laps(store, drivers, circuits):
+    return {circuit: {driver: best[0] for driver, best in store.best_laps(drivers, circuit).items()}
+            for circuit in circuits}
+
+
+def mongo_season_stats(db, years):
+    return {year: list(db.laps.aggregate([
+        {'$match': {'year': year, 'lap_duration': {'$ne': None}}},
+        {'$group': {'_id': '$driver_number', 'count': {'$sum': 1}, 'mean': {'$avg': '$lap_duration'},
+                    'min': {'$min': '$lap_duration'}, 'max': {'$max': '$lap_duration'},
+                    'stddev': {'$stdDevPop': '$lap_duration'}}},
+    ])) for year in years}
+
+
+def store_season_stats(store, years):
+    return {year: store.aggregate(by='driver', years=[year]) for year in years}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare analytical lap queries in MongoDB and the lap store.")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ['MONGO_URI'])
+    db = client['f1_data']
+    directory = tempfile.mkdtemp(prefix='lap_store_bench')
+    try:
+        started = time.perf_counter()
+        export_seasons(db, directory, None, read_generation(db))
+        manifest = read_manifest(directory)
+        print(f"Exported {sum(manifest['seasons'].values())} laps in {len(manifest['seasons'])} seasons "
+              f"in {time.perf_counter() - started:.1f}s\n")
+        store = LapStoreSnapshot(directory, manifest)
+        drivers = sorted(db.drivers.distinct('_id'))
+        circuits = sorted(c for c in db.meetings.distinct('circuit_key') if c is not None)
+        years = store.years
+
+        mongo_ms, expected = timed(lambda: mongo_best_laps(db, drivers, circuits), args.repeat)
+        store_ms, actual = timed(lambda: store_best_laps(store, drivers, circuits), args.repeat)
+        if expected != actual:
+            raise SystemExit("Best laps from the lap store do not match MongoDB.")
+        print(f"best lap per driver, {len(circuits)} circuits   mongo {mongo_ms:>9.1f} ms   "
+              f"store {store_ms:>8.1f} ms   {mongo_ms / store_ms:>6.1f}x")
+
+        mongo_ms, _ = timed(lambda: mongo_season_stats(db, years), args.repeat)
+        store_ms, _ = timed(lambda: store_season_stats(store, years), args.repeat)
+        print(f"lap stats per driver, {len(years)} seasons     mongo {mongo_ms:>9.1f} ms   "
+              f"store {store_ms:>8.1f} ms   {mongo_ms / store_ms:>6.1f}x")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+        client.close()
@@ -0,0 +1,58 @@
+# backend/bench/laps_formats.py
+"""
+Payload size and server time of /api/laps in each output mode, for a race and a practice session.
+
+    MONGO_URI=... python bench/laps_formats.py --repeat 20
+
+Requests go through the Flask test client with the response cache disabled, so the timings
+are query plus encoding and exclude the network.
+"""
+import os
+import sys
+import argparse
+import statistics
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['RESPONSE_CACHE_ENABLED'] = 'false'
+
+from pymongo import DESCENDING
+
+from app import app, db
+
+MODES = {
+    'rows': '',
+    'rows, 500 per page': '&limit=500',
+    'columnar': '&format=columnar',
+    'columnar, 500 per page': '&format=columnar&limit=500',
+}
+
+
+def measure(client, path, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = client.get(path).get_data()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), len(body)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare /api/laps output modes.")
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    for session_name in ('Race', 'Practice 1'):
+        session = db.sessions.find_one({'session_name': session_name}, sort=[('date_start', DESCENDING)])
+        if not session:
+            print(f"No {session_name} session found; skipping.")
+            continue
+        laps = db.laps.count_documents({'session_key': session['_id']})
+        print(f"{session_name} {session['_id']} ({laps} laps)")
+        baseline = None
+        for mode, query in MODES.items():
+            elapsed, size = measure(client, f"/api/laps?session_key={session['_id']}{query}", args.repeat)
+            baseline = baseline or (elapsed, size)
+            print(f"  {mode:<24} {size / 1024:8.1f} KiB ({size / baseline[1]:5.0%})   "
+                  f"{elapsed:7.2f} ms ({elapsed / baseline[0]:5.0%})")
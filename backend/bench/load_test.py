@@ -0,0 +1,105 @@
+# backend/bench/load_test.py
+"""
+Closed-loop load test of the consolidated endpoints against a running API.
+
+Start the API with the response cache off, once per mode, and run the test against each:
+
+    RESPONSE_CACHE_ENABLED=false QUERY_CONCURRENCY=false gunicorn -w 4 -b 127.0.0.1:5000 app:app
+    python bench/load_test.py --clients 16 --duration 30 --output serial.json
+
+    RESPONSE_CACHE_ENABLED=false gunicorn -w 4 -b 127.0.0.1:5000 app:app
+    python bench/load_test.py --clients 16 --duration 30 --compare serial.json
+
+Each client sends its next request as soon as the previous one returns, cycling through the paths.
+"""
+import json
+import argparse
+import statistics
+import threading
+import time
+
+import requests
+
+
+def discover_paths(base_url):
+    """Builds the endpoint paths from keys the API itself reports."""
+    year = requests.get(f"{base_url}/api/years", timeout=30).json()[0]
+    meeting = requests.get(f"{base_url}/api/meetings", timeout=30).json()[0]
+    details = requests.get(f"{base_url}/api/meetings/{meeting['_id']}/details", timeout=30).json()
+    race = next((s for s in details['sessions'] if s['session_name'] == 'Race'), details['sessions'][0])
+    positions = requests.get(f"{base_url}/api/sessions/{race['_id']}/positions", timeout=30).json()
+    drivers = ','.join(str(p['driver_number']) for p in positions[:3])
+    return [
+        f"/api/sessions/{race['_id']}/details",
+        f"/api/records?year={year}",
+        f"/api/sessions/{race['_id']}/compare?drivers={drivers}",
+    ]
+
+
+def client_loop(base_url, paths, deadline, offset, timings, errors):
+    session = requests.Session()
+    i = offset
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        started = time.perf_counter()
+        try:
+            ok = session.get(base_url + path, timeout=30).status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = (time.perf_counter() - started) * 1000
+        (timings if ok else errors).setdefault(path, []).append(elapsed)
+        i += 1
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run(base_url, paths, clients, duration):
+    timings, errors = {}, {}
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client_loop, args=(base_url, paths, deadline, n, timings, errors))
+               for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results = {}
+    for path in paths:
+        samples = timings.get(path, [])
+        results[path] = {
+            'requests': len(samples), 'errors': len(errors.get(path, [])),
+            'rps': round(len(samples) / duration, 1),
+            'p50_ms': round(statistics.median(samples), 2) if samples else None,
+            'p99_ms': round(percentile(samples, 0.99), 2) if samples else None,
+        }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the consolidated endpoints.")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to run.")
+    parser.add_argument('--path', action='append', help="Path to request (repeatable). Defaults to the consolidated endpoints.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--compare', help="Print the change against an earlier JSON output.")
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip('/')
+    paths = args.path or discover_paths(base_url)
+    results = run(base_url, paths, args.clients, args.duration)
+    baseline = json.load(open(args.compare)) if args.compare else {}
+    total = sum(r['rps'] for r in results.values())
+    for path, result in results.items():
+        line = (f"{path:<48} {result['rps']:>7.1f} req/s   p50 {result['p50_ms'] or 0:>8.2f} ms   "
+                f"p99 {result['p99_ms'] or 0:>8.2f} ms   errors {result['errors']}")
+        previous = baseline.get(path)
+        if previous and previous['p50_ms']:
+            line += f"   (was {previous['rps']:.1f} req/s, p50 {previous['p50_ms']:.2f}, p99 {previous['p99_ms']:.2f})"
+        print(line)
+    print(f"{'total':<48} {total:>7.1f} req/s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
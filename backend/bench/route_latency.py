@@ -0,0 +1,70 @@
+# backend/bench/route_latency.py
+"""
+Times every route query from `queries.route_queries` directly against MongoDB.
+
+    python bench/route_latency.py --repeat 20 --output before.json
+    python bench/route_latency.py --repeat 20 --output after.json --compare before.json
+
+Run it before and after a schema or index change on the same dataset to record the difference.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import MongoClient
+
+import queries
+from indexes import sample_keys
+
+
+def run_query(db, collection, operation, spec):
+    if operation == 'aggregate':
+        return list(db[collection].aggregate(spec))
+    if operation == 'find':
+        return list(db[collection].find(spec['filter'], sort=list(spec.get('sort', {}).items()) or None))
+    if operation == 'count':
+        return db[collection].count_documents(spec['query'])
+    return db[collection].distinct(spec['key'], spec['query'])
+
+
+def time_queries(db, repeat):
+    results = {}
+    for name, collection, operation, spec in queries.route_queries(sample_keys(db)):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run_query(db, collection, operation, spec)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[name] = {
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the API's Mongo queries.")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help="Write the timings to this JSON file.")
+    parser.add_argument('--compare', help="Print the change against an earlier JSON output.")
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ['MONGO_URI'])
+    results = time_queries(client['f1_data'], args.repeat)
+    client.close()
+
+    baseline = json.load(open(args.compare)) if args.compare else {}
+    for name, timing in results.items():
+        line = f"{name:<28} p50 {timing['p50_ms']:>9.2f} ms   p95 {timing['p95_ms']:>9.2f} ms"
+        if name in baseline:
+            line += f"   (was p50 {baseline[name]['p50_ms']:.2f} ms)"
+        print(line)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,201 @@
+# backend/bench/run_benchmarks.py
+"""
+Endpoint and ingestion benchmark suite with a JSON baseline and regression check.
+
+    MONGO_URI=mongodb://localhost:27017 python bench/synthetic.py --seasons 5 --drop
+    MONGO_URI=mongodb://localhost:27017 python bench/run_benchmarks.py --output baseline.json
+    ... change something ...
+    MONGO_URI=mongodb://localhost:27017 python bench/run_benchmarks.py --baseline baseline.json
+
+Every route registered on the app is requested through Flask's test client with the response
+cache off, so the timings cover routing, queries and serialization but not the network. Keys
+come from the loaded data (see `indexes.sample_keys`). A route the suite has no request for
+is reported, so new routes are not silently left out. A full `populate_all_data` run then
+ingests from an in-process fake OpenF1 server (bench/fake_openf1.py) into a scratch database,
+lap store and snapshot directory that are removed afterwards, so the benchmark data and the
+published snapshots are left untouched.
+
+Results hold p50/p95/p99 latency and requests per second. With `--baseline`, a p50 or p95
+that grew by more than `--threshold` (and by at least 1 ms) is a regression, and the script
+exits with status 1.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import contextlib
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['RESPONSE_CACHE_ENABLED'] = 'false'
+
+# Flask routes that are not part of the API, and routes that cannot be timed per request
+SKIPPED_RULES = {
+    '/static/<path:filename>': "not an API route",
+    '/api/live/stream': "an open-ended event stream",
+}
+INGEST_DATABASE = 'f1_bench_ingest'
+
+
+def route_requests(keys):
+    """Rule -> (method, path, JSON body) for every API route, built from real keys."""
+    session, meeting, year = keys['session_key'], keys['meeting_key'], keys['year']
+    driver, drivers = keys['driver_number'], ','.join(str(n) for n in keys['drivers'])
+    columns = [{'id': f'c{n}', 'sessionKey': session, 'driverNumber': n} for n in keys['drivers']]
+    return {
+        '/api/status': ('GET', '/api/status', None),
+        '/api/healthz': ('GET', '/api/healthz', None),
+        '/api/readyz': ('GET', '/api/readyz', None),
+        '/api/cache/stats': ('GET', '/api/cache/stats', None),
+        '/api/metrics': ('GET', '/api/metrics', None),
+        '/api/years': ('GET', '/api/years', None),
+        '/api/records': ('GET', f'/api/records?year={year}', None),
+        '/api/meetings': ('GET', '/api/meetings', None),
+        '/api/meetings/<int:meeting_key>': ('GET', f'/api/meetings/{meeting}', None),
+        '/api/meetings/<int:meeting_key>/details': ('GET', f'/api/meetings/{meeting}/details', None),
+        '/api/meetings/<int:meeting_key>/sessions': ('GET', f'/api/meetings/{meeting}/sessions', None),
+        '/api/sessions/<int:session_key>': ('GET', f'/api/sessions/{session}', None),
+        '/api/sessions/<int:session_key>/details': ('GET', f'/api/sessions/{session}/details', None),
+        '/api/sessions/<int:session_key>/positions': ('GET', f'/api/sessions/{session}/positions', None),
+        '/api/sessions/<int:session_key>/positions/timeline': ('GET', f'/api/sessions/{session}/positions/timeline', None),
+        '/api/sessions/<int:session_key>/intervals': ('GET', f'/api/sessions/{session}/intervals', None),
+        '/api/sessions/<int:session_key>/race-trace': ('GET', f'/api/sessions/{session}/race-trace', None),
+        '/api/sessions/<int:session_key>/stints/analysis': ('GET', f'/api/sessions/{session}/stints/analysis', None),
+        '/api/sessions/<int:session_key>/compare': ('GET', f'/api/sessions/{session}/compare?drivers={drivers}', None),
+        '/api/laps': ('GET', f'/api/laps?session_key={session}', None),
+        '/api/drivers/all': ('GET', '/api/drivers/all', None),
+        '/api/drivers': ('GET', f'/api/drivers?session_key={session}', None),
+        '/api/drivers/<int:driver_number>/stats': ('GET', f'/api/drivers/{driver}/stats', None),
+        '/api/stats/season/<int:year>': ('GET', f'/api/stats/season/{year}', None),
+        '/api/analysis': ('GET', f'/api/analysis?type=season&year={year}&drivers={drivers}', None),
+        '/api/comparison/laps': ('POST', '/api/comparison/laps?analysis=true', columns),
+        '/api/batch': ('POST', '/api/batch', {'requests': [
+            f'/api/sessions/{session}/details', f'/api/drivers?session_key={session}',
+            f'/api/laps?session_key={session}', f'/api/laps?session_key={session}&sort=fastest',
+        ]}),
+    }
+
+
+def summarize(timings, elapsed):
+    timings = sorted(timings)
+    at = lambda q: round(timings[min(len(timings) - 1, int(len(timings) * q))], 2)
+    return {'requests': len(timings), 'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': at(0.50), 'p95_ms': at(0.95), 'p99_ms': at(0.99)}
+
+
+def bench_routes(app, keys, repeat):
+    client = app.test_client()
+    requests = route_requests(keys)
+    uncovered = sorted(rule.rule for rule in app.url_map.iter_rules()
+                       if rule.rule not in requests and rule.rule not in SKIPPED_RULES)
+    results = {}
+    for rule, (method, path, body) in requests.items():
+        response = client.open(path, method=method, json=body)
+        if response.status_code != 200:
+            print(f"  !! {method} {path} returned {response.status_code}; skipped")
+            continue
+        if rule == '/api/batch' and not response.get_json()['shared_hits']:
+            # The session page's sub-requests must load the session and its drivers once between them
+            raise SystemExit("The session page batch shared no loads between its requests")
+        timings = []
+        started = time.perf_counter()
+        for _ in range(repeat):
+            request_started = time.perf_counter()
+            client.open(path, method=method, json=body).get_data()
+            timings.append((time.perf_counter() - request_started) * 1000)
+        results[f'{method} {rule}'] = summarize(timings, time.perf_counter() - started)
+    return results, uncovered
+
+
+def bench_ingest(meetings, laps, samples, latency):
+    """Times one full ingest from an in-process fake OpenF1 server into a scratch database."""
+    import data_ingestor
+    from fake_openf1 import Handler, build_dataset
+
+    Handler.dataset = build_dataset(meetings, laps, samples)
+    Handler.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    data_ingestor.db = data_ingestor.client[INGEST_DATABASE]
+    data_ingestor.client.drop_database(INGEST_DATABASE)
+    data_ingestor.LAP_STORE_DIR = tempfile.mkdtemp(prefix='f1_bench_lap_store')
+    data_ingestor.SNAPSHOT_DIR = tempfile.mkdtemp(prefix='f1_bench_snapshots')
+    try:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            # Without the raw response cache, so every run downloads everything
+            data_ingestor.populate_all_data(rate_limit=0, api_base=f'http://127.0.0.1:{server.server_port}/v1',
+                                            cache=False)
+        elapsed = time.perf_counter() - started
+        documents = sum(data_ingestor.db[name].estimated_document_count()
+                        for name in ('laps', 'position', 'intervals', 'session_results', 'stints', 'pit_stops'))
+    finally:
+        server.shutdown()
+        # populate_all_data closes its client when it finishes, so the cleanup uses a fresh one
+        from pymongo import MongoClient
+        cleanup = MongoClient(os.environ['MONGO_URI'])
+        cleanup.drop_database(INGEST_DATABASE)
+        cleanup.close()
+        shutil.rmtree(data_ingestor.LAP_STORE_DIR, ignore_errors=True)
+        shutil.rmtree(data_ingestor.SNAPSHOT_DIR, ignore_errors=True)
+    return {'seconds': round(elapsed, 2), 'documents': documents, 'documents_per_second': round(documents / elapsed, 1)}
+
+
+def regressions(results, baseline, threshold):
+    """Lines describing every route whose p50 or p95 grew beyond the threshold."""
+    found = []
+    for name, result in results.get('routes', {}).items():
+        previous = baseline.get('routes', {}).get(name)
+        for metric in ('p50_ms', 'p95_ms'):
+            if previous and result[metric] - previous[metric] > max(1.0, previous[metric] * threshold):
+                found.append(f"{name} {metric} {previous[metric]:.2f} -> {result[metric]:.2f} ms")
+    ingest, previous = results.get('ingest'), baseline.get('ingest')
+    if ingest and previous and ingest['seconds'] > previous['seconds'] * (1 + threshold):
+        found.append(f"ingest {previous['seconds']:.2f} -> {ingest['seconds']:.2f} s")
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark every API route and a full ingest.")
+    parser.add_argument('--repeat', type=int, default=50, help="Requests per route.")
+    parser.add_argument('--skip-ingest', action='store_true')
+    parser.add_argument('--ingest-meetings', type=int, default=4)
+    parser.add_argument('--ingest-laps', type=int, default=50)
+    parser.add_argument('--ingest-samples', type=int, default=200)
+    parser.add_argument('--ingest-latency', type=float, default=0.0, help="Simulated OpenF1 latency per request.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--baseline', help="Compare against an earlier JSON output and exit 1 on a regression.")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed relative slowdown.")
+    args = parser.parse_args()
+
+    from app import app, db
+    from indexes import sample_keys
+
+    keys = sample_keys(db)
+    keys['drivers'] = [r['driver_number'] for r in
+                       db.session_results.find({'session_key': keys['session_key']}).sort('position', 1).limit(3)]
+    results = {'keys': {k: keys[k] for k in ('session_key', 'meeting_key', 'year', 'driver_number')}}
+    results['routes'], uncovered = bench_routes(app, keys, args.repeat)
+    for name, result in results['routes'].items():
+        print(f"{name:<58} {result['rps']:>8.1f} req/s   p50 {result['p50_ms']:>8.2f}   "
+              f"p95 {result['p95_ms']:>8.2f}   p99 {result['p99_ms']:>8.2f} ms")
+    for rule in uncovered:
+        print(f"  !! No benchmark request for {rule}; add one to route_requests()")
+    if not args.skip_ingest:
+        results['ingest'] = bench_ingest(args.ingest_meetings, args.ingest_laps, args.ingest_samples,
+                                         args.ingest_latency)
+        print(f"{'populate_all_data':<58} {results['ingest']['seconds']:>8.2f} s   "
+              f"{results['ingest']['documents_per_second']:>10.1f} docs/s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        found = regressions(results, json.load(open(args.baseline)), args.threshold)
+        for line in found:
+            print(f"REGRESSION: {line}")
+        sys.exit(1 if found else 0)
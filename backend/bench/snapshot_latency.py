@@ -0,0 +1,94 @@
+# backend/bench/snapshot_latency.py
+"""
+Bytes on the wire and time to first byte of a settled session's pages, from the published
+snapshots and from the live routes.
+
+    SNAPSHOT_ENABLED=false RESPONSE_CACHE_ENABLED=false gunicorn -b 127.0.0.1:5001 app:app
+    gunicorn -b 127.0.0.1:5000 app:app
+    python bench/snapshot_latency.py --live-url http://127.0.0.1:5001 --requests 50
+
+Both servers read the same database. The first runs every request through its queries, the
+second answers published paths from the snapshot files (see snapshots.py). Every request
+sends `Accept-Encoding: br, gzip`, as a browser would. Bytes are counted as they arrive,
+before any decoding. The session defaults to the race of the first meeting that has a
+snapshot; pass `--session-key` to pick one.
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+HEADERS = {'Accept-Encoding': 'br, gzip'}
+
+
+def page_paths(session_key, meeting_key):
+    return [
+        f"/api/sessions/{session_key}/details",
+        f"/api/laps?session_key={session_key}",
+        f"/api/meetings/{meeting_key}/details",
+    ]
+
+
+def find_session(base_url):
+    """(session_key, meeting_key) of the race of the first meeting served from a snapshot."""
+    for meeting in requests.get(f"{base_url}/api/meetings", timeout=30).json():
+        response = requests.get(f"{base_url}/api/meetings/{meeting['_id']}/details", headers=HEADERS, timeout=30)
+        if response.headers.get('X-Cache') == 'SNAPSHOT':
+            sessions = response.json()['sessions']
+            race = next((s for s in sessions if s['session_name'] == 'Race'), sessions[0])
+            return race['_id'], meeting['_id']
+    raise SystemExit("No meeting is served from a snapshot; run `python snapshots.py` first.")
+
+
+def fetch(session, url):
+    """(seconds to the first byte, total seconds, bytes received, X-Cache) of one GET."""
+    started = time.perf_counter()
+    with session.get(url, headers=HEADERS, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        first = None
+        size = 0
+        for chunk in response.raw.stream(64 * 1024, decode_content=False):
+            if first is None:
+                first = time.perf_counter()
+            size += len(chunk)
+        finished = time.perf_counter()
+        return (first or finished) - started, finished - started, size, response.headers.get('X-Cache')
+
+
+def measure(base_url, path, count):
+    with requests.Session() as session:
+        # One untimed request opens the connection and warms the server
+        fetch(session, base_url + path)
+        results = [fetch(session, base_url + path) for _ in range(count)]
+    ttfb = sorted(result[0] * 1000 for result in results)
+    total = sorted(result[1] * 1000 for result in results)
+    return {
+        'ttfb_p50_ms': round(statistics.median(ttfb), 2),
+        'ttfb_p95_ms': round(ttfb[min(len(ttfb) - 1, int(len(ttfb) * 0.95))], 2),
+        'total_p50_ms': round(statistics.median(total), 2),
+        'bytes': results[-1][2],
+        'source': results[-1][3] or 'LIVE',
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare snapshot and live responses for a settled session.")
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000', help="API serving snapshots.")
+    parser.add_argument('--live-url', default='http://127.0.0.1:5001', help="API with SNAPSHOT_ENABLED=false.")
+    parser.add_argument('--session-key', type=int)
+    parser.add_argument('--requests', type=int, default=50, help="Timed requests per path and server.")
+    args = parser.parse_args()
+
+    if args.session_key:
+        session = requests.get(f"{args.base_url}/api/sessions/{args.session_key}", timeout=30).json()
+        session_key, meeting_key = args.session_key, session['meeting_key']
+    else:
+        session_key, meeting_key = find_session(args.base_url)
+    print(f"Session {session_key}, meeting {meeting_key}")
+    print(f"{'path':<40} {'source':<9} {'bytes':>10} {'ttfb p50':>9} {'ttfb p95':>9} {'total p50':>10}")
+    for path in page_paths(session_key, meeting_key):
+        for url in (args.live_url, args.base_url):
+            result = measure(url, path, args.requests)
+            print(f"{path:<40} {result['source']:<9} {result['bytes']:>10} {result['ttfb_p50_ms']:>9} "
+                  f"{result['ttfb_p95_ms']:>9} {result['total_p50_ms']:>10}")
@@ -0,0 +1,235 @@
+# backend/bench/synthetic.py
+"""
+Deterministic multi-season dataset generator, loaded straight into MongoDB.
+
+    MONGO_URI=mongodb://localhost:27017 python bench/synthetic.py --seasons 5 --drop
+
+Documents have the shapes the ingestor stores, including the denormalized session
+attributes. Lap times come from a simple race model, so orderings, gaps and pit stops
+behave plausibly for queries and charts. The model uses a pace per driver and circuit,
+tyre degradation, fuel burn, pit stops and noise. The same seed always produces the same
+data. After loading, the indexes, materialized standings, race traces and ingestion generation are set
+up as an ingest would leave them.
+
+Rough sizes per season (22 meetings): 60k laps and 21k samples each of position and intervals.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import ReplaceOne
+
+from denormalize import session_attributes
+from schema import compact_batch
+
+DRIVERS = [
+    (1, 'Max VERSTAPPEN', 'Red Bull Racing', '3671C6'), (11, 'Sergio PEREZ', 'Red Bull Racing', '3671C6'),
+    (16, 'Charles LECLERC', 'Ferrari', 'E8002D'), (55, 'Carlos SAINZ', 'Ferrari', 'E8002D'),
+    (44, 'Lewis HAMILTON', 'Mercedes', '27F4D2'), (63, 'George RUSSELL', 'Mercedes', '27F4D2'),
+    (4, 'Lando NORRIS', 'McLaren', 'FF8000'), (81, 'Oscar PIASTRI', 'McLaren', 'FF8000'),
+    (14, 'Fernando ALONSO', 'Aston Martin', '229971'), (18, 'Lance STROLL', 'Aston Martin', '229971'),
+    (10, 'Pierre GASLY', 'Alpine', 'FF87BC'), (31, 'Esteban OCON', 'Alpine', 'FF87BC'),
+    (23, 'Alexander ALBON', 'Williams', '64C4FF'), (2, 'Logan SARGEANT', 'Williams', '64C4FF'),
+    (22, 'Yuki TSUNODA', 'RB', '6692FF'), (3, 'Daniel RICCIARDO', 'RB', '6692FF'),
+    (77, 'Valtteri BOTTAS', 'Kick Sauber', '52E252'), (24, 'Zhou GUANYU', 'Kick Sauber', '52E252'),
+    (20, 'Kevin MAGNUSSEN', 'Haas F1 Team', 'B6BABD'), (27, 'Nico HULKENBERG', 'Haas F1 Team', 'B6BABD'),
+]
+SESSIONS = [('Practice 1', 'Practice', 0, 60), ('Practice 2', 'Practice', 0, 60), ('Practice 3', 'Practice', 1, 60),
+            ('Qualifying', 'Qualifying', 1, 60), ('Race', 'Race', 2, 120)]
+POINTS = [25, 18, 15, 12, 10, 8, 6, 4, 2, 1]
+COMPOUNDS = {'SOFT': (0.0, 0.09), 'MEDIUM': (0.5, 0.05), 'HARD': (0.9, 0.03)}  # (pace offset, degradation per lap)
+MEETING_KEY_BASE = 5000
+SESSION_KEY_BASE = 50000
+
+
+def _iso(moment):
+    return moment.isoformat(timespec='milliseconds')
+
+
+class SeasonGenerator:
+    """Generates one season at a time; every random draw comes from a seed derived from the season."""
+
+    def __init__(self, start_year, meetings_per_season=22, practice_laps=25, seed=1):
+        self.start_year = start_year
+        self.meetings_per_season = meetings_per_season
+        self.practice_laps = practice_laps
+        self.seed = seed
+
+    def drivers(self):
+        return [{'_id': number, 'driver_number': number, 'full_name': name, 'team_name': team, 'team_colour': colour,
+                 'name_acronym': name.split()[-1][:3].upper(), 'headshot_url': None}
+                for number, name, team, colour in DRIVERS]
+
+    def season(self, index):
+        """Yields (collection, documents) batches for season `index`, one meeting at a time."""
+        rng = random.Random(self.seed * 1000 + index)
+        year = self.start_year + index
+        # Car pace changes from year to year; driver skill is fixed
+        team_pace = {team: rng.gauss(0, 0.5) for _, _, team, _ in DRIVERS}
+        pace = {number: team_pace[team] + (number % 7) * 0.05 for number, _, team, _ in DRIVERS}
+        season_start = datetime(year, 3, 1, tzinfo=timezone.utc)
+        yield 'drivers', self.drivers()
+        for m in range(self.meetings_per_season):
+            meeting_key = MEETING_KEY_BASE + index * 100 + m
+            circuit_key = 1 + m
+            start = season_start + timedelta(days=14 * m)
+            base_lap = 75 + (circuit_key * 7) % 25
+            race_laps = int(4200 / base_lap) + 1
+            meeting = {
+                '_id': meeting_key, 'meeting_key': meeting_key, 'meeting_name': f'Grand Prix {circuit_key}',
+                'meeting_official_name': f'FORMULA 1 GRAND PRIX {circuit_key} {year}', 'year': year,
+                'circuit_key': circuit_key, 'circuit_short_name': f'Circuit {circuit_key}',
+                'country_name': f'Country {circuit_key}', 'country_code': f'C{circuit_key:02d}',
+                'location': f'City {circuit_key}', 'date_start': _iso(start),
+            }
+            yield 'meetings', [meeting]
+            for s, (name, session_type, day, minutes) in enumerate(SESSIONS):
+                session_key = SESSION_KEY_BASE + (index * self.meetings_per_season + m) * len(SESSIONS) + s
+                date_start = start + timedelta(days=day, hours=11 + 3 * (s % 2))
+                session = {
+                    '_id': session_key, 'session_key': session_key, 'meeting_key': meeting_key,
+                    'session_name': name, 'session_type': session_type, 'year': year,
+                    'circuit_key': circuit_key, 'circuit_short_name': meeting['circuit_short_name'],
+                    'date_start': _iso(date_start), 'date_end': _iso(date_start + timedelta(minutes=minutes)),
+                }
+                yield 'sessions', [session]
+                yield from self._session(rng, session, meeting, pace, base_lap,
+                                         race_laps if name == 'Race' else 12 if name == 'Qualifying' else self.practice_laps)
+
+    def _session(self, rng, session, meeting, pace, base_lap, laps):
+        attributes = session_attributes(session, meeting)
+        common = {'session_key': session['session_key'], 'meeting_key': session['meeting_key']}
+        date_start = datetime.fromisoformat(session['date_start'])
+        is_race = session['session_name'] == 'Race'
+        lap_docs, pit_docs, stint_docs, elapsed, best = [], [], [], {}, {}
+        for number, *_ in DRIVERS:
+            compound = rng.choice(['SOFT', 'MEDIUM']) if is_race else 'SOFT'
+            pit_lap = rng.randint(laps // 3, 2 * laps // 3) if is_race else None
+            stint, stint_start, tyre_age, clock = 1, 1, 0, 0.0
+            dnf_lap = rng.randint(1, laps) if is_race and rng.random() < 0.05 else None
+            for lap in range(1, (dnf_lap or laps) + 1):
+                offset, degradation = COMPOUNDS[compound]
+                fuel = (laps - lap) * 0.03 if is_race else 0.0
+                duration = base_lap + pace[number] + offset + degradation * tyre_age + fuel + abs(rng.gauss(0, 0.25))
+                pit_out = lap == 1 or (pit_lap is not None and lap == pit_lap + 1)
+                if pit_lap is not None and lap == pit_lap + 1:
+                    duration += 21.5
+                split = (0.31 + rng.uniform(-0.01, 0.01), 0.37 + rng.uniform(-0.01, 0.01))
+                lap_docs.append({
+                    **common, **attributes, 'driver_number': number, 'lap_number': lap,
+                    'lap_duration': round(duration, 3), 'duration_sector_1': round(duration * split[0], 3),
+                    'duration_sector_2': round(duration * split[1], 3),
+                    'duration_sector_3': round(duration * (1 - split[0] - split[1]), 3),
+                    'is_pit_out_lap': pit_out, 'date_start': _iso(date_start + timedelta(seconds=clock)),
+                })
+                clock += duration
+                elapsed.setdefault(number, []).append(clock)
+                best[number] = min(best.get(number, duration), duration)
+                tyre_age += 1
+                if pit_lap is not None and lap == pit_lap:
+                    stint_docs.append({**common, 'driver_number': number, 'stint_number': stint, 'compound': compound,
+                                       'lap_start': stint_start, 'lap_end': lap, 'tyre_age_at_start': 0})
+                    pit_docs.append({**common, 'driver_number': number, 'lap_number': lap,
+                                     'pit_duration': round(rng.uniform(20.5, 24.0), 1),
+                                     'date': _iso(date_start + timedelta(seconds=clock))})
+                    compound, stint, stint_start, tyre_age = 'HARD', stint + 1, lap + 1, 0
+            stint_docs.append({**common, 'driver_number': number, 'stint_number': stint, 'compound': compound,
+                               'lap_start': stint_start, 'lap_end': dnf_lap or laps, 'tyre_age_at_start': 0})
+
+        if is_race:
+            # Classified by laps completed, then by total time
+            order = sorted(elapsed, key=lambda n: (-len(elapsed[n]), elapsed[n][-1]))
+        else:
+            order = sorted(best, key=lambda n: best[n])
+        results = [{
+            **common, **attributes, 'driver_number': number, 'position': position,
+            'number_of_laps': len(elapsed[number]), 'dnf': is_race and len(elapsed[number]) < laps,
+            'points': (POINTS[position - 1] if position <= len(POINTS) else 0) if is_race else None,
+            'gap_to_leader': 0 if position == 1 else round(
+                elapsed[number][-1] - elapsed[order[0]][-1] if is_race else best[number] - best[order[0]], 3),
+        } for position, number in enumerate(order, start=1)]
+
+        yield 'laps', lap_docs
+        yield 'session_results', results
+        yield 'stints', stint_docs
+        if pit_docs:
+            yield 'pit_stops', pit_docs
+        if is_race:
+            yield from self._timing(common, date_start, elapsed, laps)
+
+    def _timing(self, common, date_start, elapsed, laps):
+        """Position and interval samples at every lap end, ranked by laps completed and time."""
+        position_docs, interval_docs = [], []
+        for lap in range(1, laps + 1):
+            running = [(n, times[lap - 1]) for n, times in elapsed.items() if len(times) >= lap]
+            running.sort(key=lambda item: item[1])
+            leader = running[0][1]
+            for rank, (number, clock) in enumerate(running, start=1):
+                date = _iso(date_start + timedelta(seconds=clock))
+                position_docs.append({**common, 'driver_number': number, 'position': rank, 'date': date})
+                interval_docs.append({**common, 'driver_number': number, 'date': date,
+                                      'gap_to_leader': round(clock - leader, 3),
+                                      'interval': round(clock - running[rank - 2][1], 3) if rank > 1 else 0})
+        yield 'position', position_docs
+        yield 'intervals', interval_docs
+
+
+def load(db, generator, seasons, batch_size=5000):
+    """Inserts every season into `db`; returns document counts per collection."""
+    counts = {}
+    for index in range(seasons):
+        for collection, documents in generator.season(index):
+            if collection in ('meetings', 'sessions', 'drivers'):
+                # Keyed documents are upserted, as in an ingest
+                db[collection].bulk_write([ReplaceOne({'_id': d['_id']}, d, upsert=True) for d in documents],
+                                          ordered=False)
+            else:
+                # Stored in the compact layout the ingestor writes
+                documents = compact_batch(collection, documents)
+                for start in range(0, len(documents), batch_size):
+                    db[collection].insert_many(documents[start:start + batch_size], ordered=False)
+            counts[collection] = counts.get(collection, 0) + len(documents)
+        print(f"  -> Loaded season {generator.start_year + index}.")
+    return counts
+
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+
+    from conditions import annotate_sessions
+    from generation import bump_generation
+    from indexes import ensure_indexes
+    from race_trace import rebuild_race_traces
+    from standings import rebuild_standings
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic multi-season dataset into MongoDB.")
+    parser.add_argument('--seasons', type=int, default=1)
+    parser.add_argument('--start-year', type=int, default=2005)
+    parser.add_argument('--meetings', type=int, default=22, help="Meetings per season.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', default='f1_data')
+    parser.add_argument('--drop', action='store_true', help="Drop the database before loading.")
+    args = parser.parse_args()
+
+    MONGO_URI = os.environ.get('MONGO_URI')
+    if not MONGO_URI:
+        raise Exception("MONGO_URI environment variable not set!")
+    client = MongoClient(MONGO_URI)
+    if args.drop:
+        client.drop_database(args.database)
+    db = client[args.database]
+    ensure_indexes(db)
+    started = time.perf_counter()
+    counts = load(db, SeasonGenerator(args.start_year, args.meetings, seed=args.seed), args.seasons)
+    print(f"Loaded {sum(counts.values())} documents in {time.perf_counter() - started:.1f}s: "
+          + ', '.join(f"{name} {count}" for name, count in sorted(counts.items())))
+    annotate_sessions(db, db.sessions.distinct('_id'))
+    rebuild_standings(db)
+    rebuild_race_traces(db)
+    bump_generation(db)
+    client.close()
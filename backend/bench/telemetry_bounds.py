@@ -0,0 +1,76 @@
+# backend/bench/telemetry_bounds.py
+"""
+Checks the telemetry downsampling bounds on synthetic streams far longer than a real session.
+
+    python bench/telemetry_bounds.py --drivers 20 --samples 50000 --points 500
+
+It exits non-zero if any driver's series exceeds the point budget, or if peak memory grows
+with the number of drivers rather than staying at about one driver's series.
+"""
+import os
+import sys
+import argparse
+import math
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telemetry
+
+
+def synthetic_cursor(stream, drivers, samples, seed=1):
+    """Yields samples in (driver_number, date) order, as the route's pipeline returns them."""
+    rng = random.Random(seed)
+    start = datetime(2024, 3, 2, 15, tzinfo=timezone.utc)
+    for driver_number in range(1, drivers + 1):
+        position = driver_number
+        for i in range(samples):
+            date = (start + timedelta(milliseconds=270 * i)).isoformat()
+            if stream == 'position':
+                if rng.random() < 0.002:
+                    position = max(1, min(drivers, position + rng.choice([-1, 1])))
+                yield {'driver_number': driver_number, 'date': date, 'position': position}
+            else:
+                gap = driver_number * 1.3 + math.sin(i / 500) + rng.random() * 0.2
+                yield {'driver_number': driver_number, 'date': date,
+                       'gap_to_leader': '+1 LAP' if rng.random() < 0.001 else round(gap, 3),
+                       'interval': round(rng.uniform(0.2, 2.0), 3)}
+
+
+def run(stream, drivers, samples, points):
+    # Timed without tracing first, since tracemalloc slows allocation-heavy code several times over
+    started = time.perf_counter()
+    telemetry.downsample_stream(synthetic_cursor(stream, drivers, samples), stream, points)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    series = telemetry.downsample_stream(synthetic_cursor(stream, drivers, samples), stream, points)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return series, elapsed, peak
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check telemetry downsampling output size and memory.")
+    parser.add_argument('--drivers', type=int, default=20)
+    parser.add_argument('--samples', type=int, default=50000, help="Samples per driver.")
+    parser.add_argument('--points', type=int, default=500)
+    args = parser.parse_args()
+
+    failures = []
+    for stream in telemetry.STREAMS:
+        _, _, single_peak = run(stream, 1, args.samples, args.points)
+        series, elapsed, peak = run(stream, args.drivers, args.samples, args.points)
+        longest = max(len(columns['date']) for columns in series.values())
+        print(f"{stream:<10} {args.drivers} x {args.samples} samples -> at most {longest} points per driver "
+              f"in {elapsed:.2f} s, peak {peak / 2**20:.1f} MiB (one driver {single_peak / 2**20:.1f} MiB)")
+        if longest > args.points or len(series) != args.drivers:
+            failures.append(f"{stream}: {longest} points for a budget of {args.points}")
+        # Drivers are processed one at a time, so more of them must not raise the peak much
+        if peak > 1.5 * single_peak:
+            failures.append(f"{stream}: peak memory {peak} bytes grows with the driver count")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,99 @@
+# backend/bench/worker_startup.py
+"""
+Measures gunicorn worker startup time and memory with and without the preloaded warm state.
+
+    MONGO_URI=mongodb://localhost:27017 python bench/worker_startup.py --workers 4
+
+For each mode the script starts gunicorn from the backend directory (so gunicorn.conf.py
+applies) on a free port:
+
+* `per-worker`: GUNICORN_PRELOAD=false. Each worker imports the app and warms itself, as every
+  worker did when app.py connected and loaded the catalog at import time.
+* `preloaded`: the master warms the state once and forks the workers from it.
+
+Startup time is from launching gunicorn until every worker has answered `/api/readyz` with
+200. Memory is read from /proc/<pid>/smaps_rollup, so it needs Linux. PSS charges shared
+pages to the processes sharing them, and USS counts only the pages private to a worker.
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import statistics
+
+import requests
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def memory(pid):
+    """(RSS, PSS, USS) in MiB of one process."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def start(workers, preload, timeout):
+    """Starts gunicorn and waits for every worker to be ready; returns (process, seconds, worker pids)."""
+    port = free_port()
+    env = {**os.environ, 'GUNICORN_BIND': f'127.0.0.1:{port}', 'WEB_CONCURRENCY': str(workers),
+           'GUNICORN_PRELOAD': 'true' if preload else 'false'}
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app'], cwd=BACKEND, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    ready = set()
+    deadline = time.monotonic() + timeout
+    while len(ready) < workers:
+        if time.monotonic() > deadline or process.poll() is not None:
+            process.kill()
+            raise SystemExit(f"gunicorn did not get {workers} workers ready within {timeout}s.")
+        try:
+            # A new connection per probe, so the probes spread over the workers
+            response = requests.get(f'http://127.0.0.1:{port}/api/readyz', timeout=timeout,
+                                    headers={'Connection': 'close'})
+            if response.status_code == 200:
+                ready.add(response.json()['pid'])
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.05)
+    return process, time.perf_counter() - started, sorted(ready)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare gunicorn worker startup with and without preloading.")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+    if not os.environ.get('MONGO_URI'):
+        raise SystemExit("MONGO_URI environment variable not set!")
+
+    print(f"{'mode':<12} {'ready in':>9} {'worker RSS':>11} {'worker PSS':>11} {'worker USS':>11} {'total PSS':>10}")
+    for name, preload in (('per-worker', False), ('preloaded', True)):
+        process, seconds, pids = start(args.workers, preload, args.timeout)
+        try:
+            if set(pids) != set(children(process.pid)):
+                raise SystemExit("The ready workers are not gunicorn's current workers.")
+            usage = [memory(pid) for pid in pids]
+            master_pss = memory(process.pid)[1]
+        finally:
+            process.terminate()
+            process.wait()
+        rss, pss, uss = (statistics.mean(column) for column in zip(*usage))
+        total = master_pss + sum(u[1] for u in usage)
+        print(f"{name:<12} {seconds:>8.2f}s {rss:>8.1f} MiB {pss:>8.1f} MiB {uss:>8.1f} MiB {total:>6.1f} MiB")
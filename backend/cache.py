@@ -0,0 +1,157 @@
+# backend/cache.py
+"""
+In-process response cache for the read-only API routes.
+
+Entries are keyed by route path and normalized query arguments, bounded by count and bytes
+with LRU eviction, and dropped wholesale whenever the ingestion generation (see
+generation.py) moves on. When a session's live generation moves on, only the entries for
+that session are dropped: those of a route with a `session_key` path parameter or query
+argument. Each entry is stamped with the generations it was rendered under, so a response
+rendered while a commit replaced its data is neither stored nor served. Every cached
+response carries a strong ETag, so clients that send If-None-Match get a 304 without a body.
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, make_response
+
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'off', 'no')
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '512'))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+RESPONSE_CACHE_GENERATION_TTL = float(os.environ.get('RESPONSE_CACHE_GENERATION_TTL', '5'))
+
+
+class ResponseCache:
+    """Bounded LRU of rendered responses, invalidated by the ingestion generation and per session by live generations."""
+
+    def __init__(self, generation_loader, live_generation_loader=None, enabled=RESPONSE_CACHE_ENABLED,
+                 max_entries=RESPONSE_CACHE_SIZE, max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                 generation_ttl=RESPONSE_CACHE_GENERATION_TTL):
+        self.generation_loader = generation_loader
+        self.live_generation_loader = live_generation_loader
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.generation_ttl = generation_ttl
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = None
+        self.live_generations = {}
+        self.generation_checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def current_generation(self):
+        """The ingestion generation, re-read with the live generations at most every `generation_ttl` seconds."""
+        now = time.monotonic()
+        if self.generation is None or now - self.generation_checked_at > self.generation_ttl:
+            generation = self.generation_loader()
+            live_generations = self.live_generation_loader() if self.live_generation_loader else {}
+            with self.lock:
+                if generation != self.generation:
+                    self.entries.clear()
+                    self.bytes = 0
+                    self.generation = generation
+                else:
+                    changed = {key for key in live_generations.keys() | self.live_generations.keys()
+                               if live_generations.get(key) != self.live_generations.get(key)}
+                    if changed:
+                        self._drop_sessions(changed)
+                self.live_generations = live_generations
+                self.generation_checked_at = now
+        return self.generation
+
+    def _drop_sessions(self, session_keys):
+        """Drops the entries of the given sessions; the caller holds the lock."""
+        for key in [key for key in self.entries if key[2] in session_keys]:
+            self.bytes -= len(self.entries.pop(key)['body'])
+
+    def _stamp(self, session_key):
+        """The generations a response for the session is rendered under; the caller holds the lock."""
+        return self.generation, self.live_generations.get(session_key)
+
+    def stamp(self, session_key):
+        with self.lock:
+            return self._stamp(session_key)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry['stamp'] != self._stamp(key[2]):
+                # Stored by a request that finished after the generation moved on
+                self.bytes -= len(self.entries.pop(key)['body'])
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        size = len(entry['body'])
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if entry['stamp'] != self._stamp(key[2]):
+                # The data changed while the view ran; its body may predate the commit
+                return
+            previous = self.entries.pop(key, None)
+            if previous:
+                self.bytes -= len(previous['body'])
+            self.entries[key] = entry
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= len(evicted['body'])
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled, 'generation': self.generation, 'entries': len(self.entries),
+                'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
+
+    def route(self, view):
+        """Decorator caching a view's successful responses and answering conditional requests."""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # An app serving another database (see app.create_app) turns the cache off in its config
+            if not self.enabled or not current_app.config.get('RESPONSE_CACHE_ENABLED', True):
+                return view(*args, **kwargs)
+            # The session, if any, lets a live generation drop just this session's entries
+            session_key = kwargs.get('session_key', request.args.get('session_key', type=int))
+            key = (request.path, tuple(sorted(request.args.items(multi=True))), session_key)
+            self.current_generation()
+            entry = self.get(key)
+            if entry is None:
+                # Taken before the view reads anything, so a commit during the render changes it
+                stamp = self.stamp(session_key)
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                entry = {
+                    'body': body, 'mimetype': response.mimetype,
+                    'etag': hashlib.blake2b(body, digest_size=16).hexdigest(), 'stamp': stamp
+                }
+                self.put(key, entry)
+                cache_status = 'MISS'
+            else:
+                cache_status = 'HIT'
+            response = make_response(entry['body'])
+            response.mimetype = entry['mimetype']
+            response.set_etag(entry['etag'])
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['X-Cache'] = cache_status
+            return response.make_conditional(request)
+        return wrapper
@@ -0,0 +1,153 @@
+# backend/catalog.py
+"""
+In-process catalog of sessions and meetings.
+
+Routes that only need a session's year, name, meeting or circuit read them from here
+instead of querying `sessions` on every request. The catalog is a set of NumPy columns
+sorted by session key, with position indexes by year, session name and session type, so
+lookups are a binary search or an index intersection, at well under a hundred bytes per session.
+
+`ReferenceData` holds the other small, read-mostly documents the API serves whole: every
+driver and the meetings list. `CatalogStore` loads either at startup and reloads it when the
+ingestion generation (see generation.py) changes. Under gunicorn both are loaded before the
+workers fork, so every worker starts with them (see gunicorn.conf.py).
+"""
+import os
+import time
+import threading
+
+import numpy as np
+
+import queries
+
+CATALOG_GENERATION_TTL = float(os.environ.get('CATALOG_GENERATION_TTL', '5'))
+MISSING = -1
+
+
+def _column(values):
+    return np.array([MISSING if v is None else v for v in values], dtype=np.int64)
+
+
+def _categorical(values):
+    """Dictionary-encodes strings: returns (codes, labels)."""
+    labels = sorted({v for v in values if v is not None})
+    lookup = {label: code for code, label in enumerate(labels)}
+    return np.array([lookup.get(v, MISSING) for v in values], dtype=np.int16), labels
+
+
+def _positions_by(codes, labels=None):
+    """Maps each distinct value (or its label) to the sorted row positions holding it."""
+    order = np.argsort(codes, kind='stable')
+    values, starts = np.unique(codes[order], return_index=True)
+    groups = np.split(order, starts[1:])
+    return {
+        (labels[value] if labels is not None else int(value)): np.sort(group)
+        for value, group in zip(values, groups) if value != MISSING
+    }
+
+
+class SessionCatalog:
+    """Immutable snapshot of every session's key, year, name, type, meeting and circuit."""
+
+    def __init__(self, sessions, meetings):
+        sessions = sorted(sessions, key=lambda s: s['_id'])
+        meeting_circuits = {m['_id']: m.get('circuit_key') for m in meetings}
+        self.keys = _column([s['_id'] for s in sessions])
+        self.years = _column([s.get('year') for s in sessions])
+        self.meeting_keys = _column([s.get('meeting_key') for s in sessions])
+        self.circuit_keys = _column([
+            s.get('circuit_key') if s.get('circuit_key') is not None else meeting_circuits.get(s.get('meeting_key'))
+            for s in sessions
+        ])
+        self.name_codes, self.names = _categorical([s.get('session_name') for s in sessions])
+        self.type_codes, self.types = _categorical([s.get('session_type') for s in sessions])
+        self.by_year = _positions_by(self.years)
+        self.by_name = _positions_by(self.name_codes, self.names)
+        self.by_type = _positions_by(self.type_codes, self.types)
+        self.meeting_count = len(meetings)
+
+    @classmethod
+    def load(cls, db):
+        fields = {'year': 1, 'session_name': 1, 'session_type': 1, 'meeting_key': 1, 'circuit_key': 1}
+        return cls(list(db.sessions.find({}, fields)), list(db.meetings.find({}, {'circuit_key': 1})))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _row(self, session_key):
+        position = int(np.searchsorted(self.keys, session_key))
+        return position if position < len(self.keys) and self.keys[position] == session_key else None
+
+    def get(self, session_key):
+        """The catalog entry for a session, or None if it is not in the catalog."""
+        row = self._row(session_key)
+        if row is None:
+            return None
+        value = lambda column: None if column[row] == MISSING else int(column[row])
+        return {
+            'session_key': int(self.keys[row]), 'year': value(self.years),
+            'session_name': self.names[self.name_codes[row]] if self.name_codes[row] != MISSING else None,
+            'session_type': self.types[self.type_codes[row]] if self.type_codes[row] != MISSING else None,
+            'meeting_key': value(self.meeting_keys), 'circuit_key': value(self.circuit_keys),
+        }
+
+    def session_keys(self, year=None, session_name=None, session_type=None):
+        """Keys of the sessions matching every given attribute, in key order."""
+        selections = [
+            index.get(value, np.arange(0)) for index, value in
+            ((self.by_year, year), (self.by_name, session_name), (self.by_type, session_type)) if value is not None
+        ]
+        if not selections:
+            return self.keys.tolist()
+        rows = selections[0]
+        for selection in selections[1:]:
+            rows = np.intersect1d(rows, selection, assume_unique=True)
+        return self.keys[rows].tolist()
+
+    def years_available(self):
+        return sorted(self.by_year, reverse=True)
+
+
+class ReferenceData:
+    """Immutable snapshot of the drivers and meetings, in the order their routes return them."""
+
+    def __init__(self, drivers, meetings, all_meetings):
+        self.drivers = drivers
+        self.meetings = meetings
+        self.meetings_by_key = {m['_id']: m for m in all_meetings}
+
+    @classmethod
+    def load(cls, db):
+        return cls(list(db.drivers.find().sort('full_name', 1)), list(db.meetings.aggregate(queries.meetings_pipeline())),
+                   list(db.meetings.find()))
+
+    def __len__(self):
+        return len(self.drivers) + len(self.meetings_by_key)
+
+
+class CatalogStore:
+    """Holds the current catalog (or another snapshot `loader` builds) and reloads it when the ingestion generation moves on."""
+
+    def __init__(self, db, generation_loader, generation_ttl=CATALOG_GENERATION_TTL, loader=SessionCatalog.load):
+        self.db = db
+        self.loader = loader
+        self.generation_loader = generation_loader
+        self.generation_ttl = generation_ttl
+        self.catalog = None
+        self.generation = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def current(self):
+        """The catalog for the current generation; the generation is re-read at most every `generation_ttl` seconds."""
+        now = time.monotonic()
+        if self.catalog is not None and now - self.checked_at <= self.generation_ttl:
+            return self.catalog
+        with self.lock:
+            if self.catalog is None or now - self.checked_at > self.generation_ttl:
+                generation = self.generation_loader()
+                if self.catalog is None or generation != self.generation:
+                    self.catalog = self.loader(self.db)
+                    self.generation = generation
+                self.checked_at = now
+        return self.catalog
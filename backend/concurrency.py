@@ -0,0 +1,64 @@
+# backend/concurrency.py
+"""
+Runs a request's independent queries concurrently on a bounded, process-wide thread pool.
+
+pymongo releases the GIL while it waits on the server, so a handful of threads turns an
+endpoint's latency from the sum of its queries into the longest of them. The pool is shared
+by every request in the process and bounded by QUERY_WORKERS. When it is saturated the
+remaining calls run inline on the request thread, so load degrades to the old serial
+behaviour instead of queueing. The pool is created on first use in each process, since a pool
+created before gunicorn forks its workers would have lost its threads. Each call runs in a copy of the caller's context, so context
+variables such as the route that metrics.py attributes queries to carry over to the pool.
+"""
+import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+QUERY_CONCURRENCY = os.environ.get('QUERY_CONCURRENCY', 'true').lower() not in ('0', 'false', 'off', 'no')
+QUERY_WORKERS = int(os.environ.get('QUERY_WORKERS', 16))
+
+_executor = None
+_slots = None
+_pid = None
+_lock = threading.Lock()
+
+
+def _pool():
+    """This process's executor and free-slot semaphore, created on first use."""
+    global _executor, _slots, _pid
+    pid = os.getpid()
+    if _executor is None or _pid != pid:
+        with _lock:
+            if _executor is None or _pid != pid:
+                # An executor inherited from the parent is dropped, not shut down: its threads did not survive the fork
+                _executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix='query')
+                _slots = threading.BoundedSemaphore(QUERY_WORKERS)
+                _pid = pid
+    return _executor, _slots
+
+
+def _release_after(slots, context, call):
+    try:
+        return context.run(call)
+    finally:
+        slots.release()
+
+
+def run_parallel(*calls):
+    """
+    Calls each zero-argument callable and returns their results in order. The first runs on
+    the calling thread while the rest run on the pool; an exception from any is re-raised.
+    """
+    if not QUERY_CONCURRENCY or len(calls) < 2:
+        return [call() for call in calls]
+    executor, slots = _pool()
+    # None marks a call that found the pool full and runs inline after the first
+    futures = [
+        executor.submit(_release_after, slots, contextvars.copy_context(), call) if slots.acquire(blocking=False) else None
+        for call in calls[1:]
+    ]
+    first = calls[0]()
+    return [first] + [
+        future.result() if future else call() for future, call in zip(futures, calls[1:])
+    ]
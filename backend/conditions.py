@@ -0,0 +1,215 @@
+# backend/conditions.py
+"""
+Track conditions joined onto laps: weather and race-control state at the time of each lap.
+
+After a session's endpoints are stored, the ingestor runs an as-of join per session:
+
+* Weather samples, sorted by time, are matched to each lap's `date_start` with a binary
+  search: the lap gets the latest sample at or before it (the first sample if the lap
+  starts before any). That sets `track_temperature`, `air_temperature` and `rainfall`.
+* Race-control messages are replayed in order into a piecewise-constant track status:
+  GREEN, YELLOW (any yellow or double yellow flag), VSC, SC or RED. A lap gets the most
+  severe status in force at any point between its start and its end, so a lap on which the
+  safety car was deployed counts as an SC lap. The status series is searched once per lap
+  boundary, and the most severe status over each lap comes from cumulative counts per status.
+
+Both sides are sorted NumPy arrays of epoch milliseconds, so a session costs a few
+`searchsorted` calls rather than a lookup per lap. Laps with the same conditions are
+written with one update. `/api/laps` and the track branch of `/api/analysis` filter on these
+fields (see `condition_filter`), using the `track_status` indexes in indexes.py.
+
+    python conditions.py                  # annotate the laps of every session
+    python conditions.py --year 2024
+"""
+import os
+import argparse
+from datetime import timezone
+
+import numpy as np
+from pymongo import UpdateMany
+
+from generation import bump_generation
+from schema import session_filter, to_datetime
+from snapshots import SNAPSHOT_DIR, publish_snapshots
+
+CONDITION_FIELDS = ['track_status', 'rainfall', 'track_temperature', 'air_temperature']
+# In increasing severity; a lap's status is the most severe one during the lap
+TRACK_STATUSES = ['GREEN', 'YELLOW', 'VSC', 'SC', 'RED']
+GREEN, YELLOW, VSC, SC, RED = range(len(TRACK_STATUSES))
+
+
+def _epoch_ms(value):
+    """Milliseconds since the epoch of an ISO string or a stored datetime (naive ones are UTC); NaN for None."""
+    if not value:
+        return np.nan
+    moment = to_datetime(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp() * 1000
+
+
+def _epoch_ms_array(values):
+    return np.array([_epoch_ms(value) for value in values], dtype=float)
+
+
+def track_status_series(messages):
+    """(times, statuses): the status code in force from each time on, starting GREEN, from race_control rows."""
+    red = safety_car = virtual = False
+    yellows = set()
+    times, statuses = [-np.inf], [GREEN]
+    for message in sorted((m for m in messages if m.get('date')), key=lambda m: _epoch_ms(m['date'])):
+        category, flag = message.get('category'), (message.get('flag') or '').upper()
+        text, scope = (message.get('message') or '').upper(), message.get('scope')
+        if category == 'SafetyCar':
+            if 'VIRTUAL' in text:
+                virtual = 'DEPLOYED' in text
+            elif 'DEPLOYED' in text:
+                safety_car = True
+        elif category == 'Flag' and scope != 'Driver':
+            if flag == 'RED':
+                red = True
+            elif flag in ('YELLOW', 'DOUBLE YELLOW'):
+                yellows.add(message.get('sector') if scope == 'Sector' else 'track')
+            elif flag == 'CLEAR' and scope == 'Sector':
+                yellows.discard(message.get('sector'))
+            elif flag in ('GREEN', 'CLEAR'):
+                # Track clear ends the safety car, a red flag and every yellow
+                red = safety_car = virtual = False
+                yellows.clear()
+        else:
+            continue
+        times.append(_epoch_ms(message['date']))
+        statuses.append(RED if red else SC if safety_car else VSC if virtual else YELLOW if yellows else GREEN)
+    return np.array(times, dtype=float), np.array(statuses, dtype=np.int64)
+
+
+def lap_track_status(starts, ends, times, statuses):
+    """The most severe status in force during each [start, end] lap; ends may be NaN for the start alone."""
+    first = np.searchsorted(times, starts, side='right') - 1
+    last = np.searchsorted(times, np.where(np.isnan(ends), starts, ends), side='right') - 1
+    worst = np.zeros(len(starts), dtype=np.int64)
+    for status in range(YELLOW, len(TRACK_STATUSES)):
+        # Segments at or above this severity up to each index
+        at_least = np.cumsum(statuses >= status)
+        before = np.where(first > 0, at_least[np.maximum(first - 1, 0)], 0)
+        worst += (at_least[last] - before) > 0
+    return worst
+
+
+def join_conditions(laps, weather, race_control):
+    """Condition fields for each lap, in order; laps without a `date_start` get none."""
+    starts = _epoch_ms_array([lap.get('date_start') for lap in laps])
+    durations = np.array([lap.get('lap_duration') for lap in laps], dtype=float)
+    ends = starts + durations * 1000
+    timed = ~np.isnan(starts)
+
+    times, statuses = track_status_series(race_control)
+    status = lap_track_status(starts, ends, times, statuses)
+
+    weather = sorted((w for w in weather if w.get('date')), key=lambda w: _epoch_ms(w['date']))
+    sample = None
+    if weather:
+        sample_times = _epoch_ms_array([w['date'] for w in weather])
+        sample = np.maximum(np.searchsorted(sample_times, starts, side='right') - 1, 0)
+
+    results = []
+    for index in range(len(laps)):
+        if not timed[index]:
+            results.append(None)
+            continue
+        reading = weather[sample[index]] if sample is not None else {}
+        rainfall = reading.get('rainfall')
+        results.append({
+            'track_status': TRACK_STATUSES[status[index]],
+            'rainfall': None if rainfall is None else bool(rainfall),
+            'track_temperature': reading.get('track_temperature'),
+            'air_temperature': reading.get('air_temperature'),
+        })
+    return results
+
+
+def annotate_session(db, session_key):
+    """Writes the condition fields onto one session's laps; returns the number of laps annotated."""
+    laps = list(db.laps.find({'session_key': session_key}, {'_id': 1, 'date_start': 1, 'lap_duration': 1}))
+    if not laps:
+        return 0
+    weather = list(db.weather.find(session_filter('weather', session_key),
+                                   {'_id': 0, 'date': 1, 'rainfall': 1, 'track_temperature': 1, 'air_temperature': 1}))
+    race_control = list(db.race_control.find({'session_key': session_key},
+                                             {'_id': 0, 'date': 1, 'category': 1, 'flag': 1, 'scope': 1,
+                                              'sector': 1, 'message': 1}))
+    groups = {}
+    for lap, conditions in zip(laps, join_conditions(laps, weather, race_control)):
+        if conditions is not None:
+            groups.setdefault(tuple(conditions[field] for field in CONDITION_FIELDS), []).append(lap['_id'])
+    if groups:
+        db.laps.bulk_write([
+            UpdateMany({'_id': {'$in': ids}}, {'$set': dict(zip(CONDITION_FIELDS, values))})
+            for values, ids in groups.items()
+        ], ordered=False)
+    return sum(len(ids) for ids in groups.values())
+
+
+def annotate_sessions(db, session_keys):
+    """Annotates the laps of each session; a session that fails is reported and skipped."""
+    annotated = 0
+    for session_key in session_keys:
+        try:
+            annotated += annotate_session(db, session_key)
+        except Exception as e:
+            print(f"  -> Could not join conditions onto the laps of session {session_key}: {e}")
+    print(f"  -> Joined weather and track status onto {annotated} laps of {len(session_keys)} sessions.")
+    return annotated
+
+
+def condition_filter(args):
+    """
+    Lap predicates from query parameters: `track_status` (comma-separated, e.g. GREEN,YELLOW),
+    `rainfall` (true or false) and `min_track_temperature` / `max_track_temperature`.
+    Raises ValueError for an invalid value.
+    """
+    match = {}
+    if args.get('track_status'):
+        values = [value.strip().upper() for value in args['track_status'].split(',')]
+        unknown = [value for value in values if value not in TRACK_STATUSES]
+        if unknown:
+            raise ValueError(f"track_status must be one of {', '.join(TRACK_STATUSES)}")
+        match['track_status'] = values[0] if len(values) == 1 else {'$in': values}
+    if args.get('rainfall'):
+        if args['rainfall'].lower() not in ('true', 'false'):
+            raise ValueError("rainfall must be true or false")
+        match['rainfall'] = args['rainfall'].lower() == 'true'
+    temperature = {}
+    try:
+        if args.get('min_track_temperature'):
+            temperature['$gte'] = float(args['min_track_temperature'])
+        if args.get('max_track_temperature'):
+            temperature['$lte'] = float(args['max_track_temperature'])
+    except ValueError:
+        raise ValueError("min_track_temperature and max_track_temperature must be numbers")
+    if temperature:
+        match['track_temperature'] = temperature
+    return match
+
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Join weather and race-control state onto stored laps.")
+    parser.add_argument('--session', type=int, action='append', help="Session to annotate (repeatable).")
+    parser.add_argument('--year', type=int, action='append', help="Season to annotate (repeatable).")
+    args = parser.parse_args()
+
+    MONGO_URI = os.environ.get('MONGO_URI')
+    if not MONGO_URI:
+        raise Exception("MONGO_URI environment variable not set!")
+    client = MongoClient(MONGO_URI)
+    db = client['f1_data']
+    keys = args.session
+    if args.year:
+        keys = (keys or []) + db.sessions.distinct('_id', {'year': {'$in': args.year}})
+    annotate_sessions(db, keys if keys is not None else db.sessions.distinct('_id'))
+    bump_generation(db)
+    # The laps of published sessions changed
+    publish_snapshots(db, SNAPSHOT_DIR, keys)
+    client.close()
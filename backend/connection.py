@@ -0,0 +1,58 @@
+# backend/connection.py
+"""
+Lazily created, per-process MongoDB connection for the API.
+
+`Connection.database` returns the `f1_data` database of a MongoClient that is created on
+first use, and created again in any process forked after that: a MongoClient must not be
+used across a fork. Importing the API therefore opens no connection. A gunicorn master
+that preloads the warm state closes its client before forking, and each worker opens its
+own pool on its first query. Pool sizing comes from MONGO_MAX_POOL_SIZE (with gthread
+workers, at least the thread count), MONGO_MIN_POOL_SIZE and MONGO_SERVER_SELECTION_TIMEOUT_MS.
+"""
+import os
+import threading
+
+from pymongo import MongoClient
+
+DB_NAME = 'f1_data'
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '30000'))
+
+
+class Connection:
+    """One MongoClient per process, created on first use. `on_connect` is called with each new client."""
+
+    def __init__(self, uri, event_listeners=(), on_connect=None, max_pool_size=MONGO_MAX_POOL_SIZE,
+                 min_pool_size=MONGO_MIN_POOL_SIZE, server_selection_timeout_ms=MONGO_SERVER_SELECTION_TIMEOUT_MS):
+        self.uri = uri
+        self.event_listeners = list(event_listeners)
+        self.on_connect = on_connect
+        self.options = {
+            'maxPoolSize': max_pool_size, 'minPoolSize': min_pool_size,
+            'serverSelectionTimeoutMS': server_selection_timeout_ms,
+        }
+        self.client = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def database(self):
+        pid = os.getpid()
+        if self.client is None or self.pid != pid:
+            with self.lock:
+                if self.client is None or self.pid != pid:
+                    if not self.uri:
+                        raise Exception("MONGO_URI environment variable not set!")
+                    # A client inherited from the parent process is dropped, not closed: its sockets are the parent's
+                    self.client = MongoClient(self.uri, event_listeners=self.event_listeners, **self.options)
+                    self.pid = pid
+                    if self.on_connect:
+                        self.on_connect(self.client)
+        return self.client[DB_NAME]
+
+    def close(self):
+        """Closes this process's client; the next query opens a new one."""
+        with self.lock:
+            if self.client is not None and self.pid == os.getpid():
+                self.client.close()
+            self.client = None
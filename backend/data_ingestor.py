@@ -1,9 +1,27 @@
 # backend/data_ingestor.py
 import os
-import requests
+import argparse
+import hashlib
+import json
 import time
-from datetime import datetime, timezone
-from pymongo import MongoClient, ReplaceOne
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from pymongo import MongoClient, ReplaceOne, ReturnDocument
+
+from conditions import annotate_sessions
+from generation import bump_generation
+from denormalize import DENORMALIZED_COLLECTIONS, session_attributes
+from indexes import ensure_indexes
+from lap_store import LAP_STORE_DIR, export_seasons
+from openf1_client import OpenF1Client, OPENF1_API_BASE, OPENF1_RATE_LIMIT
+from raw_cache import RAW_CACHE_DIR, RAW_CACHE_SETTLED_DAYS, CacheMiss, RawCache
+from race_trace import rebuild_race_traces
+from schema import compact_batch, migrate, session_filter
+from snapshots import SNAPSHOT_DIR, publish_snapshots
+from standings import rebuild_standings
+from streaming import SpooledPayload
 
 # --- Configuration ---
 MONGO_URI = os.environ.get('MONGO_URI')
@@ -11,113 +29,334 @@ if not MONGO_URI:
     raise Exception("MONGO_URI environment variable not set!")
 
 DB_NAME = 'f1_data'
-OPENF1_API_BASE = 'https://api.openf1.org/v1'
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', '8'))
+
+SESSION_ENDPOINTS = [
+    'drivers', 'intervals', 'laps', 'pit', 'position',
+    'race_control', 'session_result', 'stints', 'weather'
+]
+COLLECTION_NAMES = {'pit': 'pit_stops', 'session_result': 'session_results'}
 
 # --- Database Connection ---
 client = MongoClient(MONGO_URI)
 db = client[DB_NAME]
 
-def fetch_data(endpoint, params):
+def fetch_data(api, endpoint, params, max_age=0):
     """Generic function to fetch data from an endpoint."""
     try:
-        response = requests.get(f"{OPENF1_API_BASE}/{endpoint}", params=params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        return api.get(endpoint, params, max_age=max_age)
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            return []  # OpenF1 answers 404 when a query has no results
+        print(f"  -> Could not fetch {endpoint} for params {params}: {e}")
+        return None
+    except (requests.exceptions.RequestException, CacheMiss) as e:
         print(f"  -> Could not fetch {endpoint} for params {params}: {e}")
         return None
     except json.JSONDecodeError:
         print(f"  -> Failed to decode JSON from {endpoint} for params {params}")
         return None
 
-def populate_all_data():
+def payload_hash(data):
+    """Stable content hash of an OpenF1 payload, used to detect upstream changes."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+class IngestReport:
+    """Thread-safe counters for sessions and documents handled during a run."""
+
+    def __init__(self):
+        self.documents = 0
+        self.unchanged_endpoints = 0
+        self.sessions = {'skipped': 0, 'refreshed': 0, 'added': 0}
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    def add(self, count):
+        with self.lock:
+            self.documents += count
+
+    def unchanged(self):
+        with self.lock:
+            self.unchanged_endpoints += 1
+
+    def summary(self, api):
+        elapsed = time.perf_counter() - self.started
+        rate = self.documents / elapsed if elapsed else 0.0
+        return (f"Sessions: {self.sessions['added']} added, {self.sessions['refreshed']} refreshed, "
+                f"{self.sessions['skipped']} skipped ({self.unchanged_endpoints} endpoints unchanged upstream).\n"
+                f"Wrote {self.documents} documents in {elapsed:.1f}s ({rate:.0f} docs/sec) "
+                f"using {api.stats['requests']} requests, {api.stats['retries']} retries, "
+                f"{api.stats['bytes'] / 1e6:.1f} MB downloaded.")
+
+def classify_session(session, state, full):
+    """Decides whether a session is new, needs refreshing or can be skipped, and which endpoints are pending."""
+    if state is None:
+        return 'added', list(SESSION_ENDPOINTS)
+    if full or state.get('session_hash') != payload_hash(session):
+        return 'refreshed', list(SESSION_ENDPOINTS)
+    if not state.get('complete'):
+        # A previous run stopped partway through this session; resume with what is left
+        return 'refreshed', state.get('pending') or list(SESSION_ENDPOINTS)
+    return 'skipped', []
+
+def fetch_payload(api, endpoint, params, max_age=0):
+    """Streams an endpoint's body into a SpooledPayload (see streaming.py); None if the fetch failed."""
+    try:
+        return SpooledPayload(api.stream(endpoint, params, max_age=max_age))
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            return SpooledPayload([b'[]'])  # OpenF1 answers 404 when a query has no results
+        print(f"  -> Could not fetch {endpoint} for params {params}: {e}")
+        return None
+    except (requests.exceptions.RequestException, CacheMiss) as e:
+        print(f"  -> Could not fetch {endpoint} for params {params}: {e}")
+        return None
+    except ValueError as e:
+        print(f"  -> Failed to decode JSON from {endpoint} for params {params}: {e}")
+        return None
+
+def ingest_session_endpoint(api, session_key, endpoint, previous_hash, attributes, force, report, max_age=0):
     """
-    Main function to re-ingest a comprehensive dataset from the OpenF1 API.
-    This version is more robust and clears data on a per-session basis.
+    Fetches one endpoint for one session, replaces its documents if the payload changed and checkpoints it.
+    Laps and results are stamped with the session's `attributes` so queries need not join sessions.
+    The payload is streamed and written in batches, so memory does not grow with its size.
+    A raw cached response younger than `max_age` seconds is used without asking OpenF1.
     """
+    payload = fetch_payload(api, endpoint, {'session_key': session_key}, max_age)
+    if payload is None:
+        return  # Left pending, so the next run retries it
+    with payload:
+        collection_name = COLLECTION_NAMES.get(endpoint, endpoint)
+        if not force and payload.hash == previous_hash:
+            report.unchanged()
+            if collection_name in DENORMALIZED_COLLECTIONS:
+                # The session itself may have changed even though this payload did not
+                db[collection_name].update_many({'session_key': session_key}, {'$set': attributes})
+        elif endpoint == 'drivers':
+            for batch in payload.batches():
+                driver_updates = [ReplaceOne({'_id': d['driver_number']}, {**d, '_id': d['driver_number']}, upsert=True) for d in batch]
+                db.drivers.bulk_write(driver_updates, ordered=False)
+            if payload.count:
+                print(f"  -> [{session_key}] Upserted {payload.count} drivers.")
+                report.add(payload.count)
+        else:
+            # Clear existing data for this session only once the replacement has arrived
+            db[collection_name].delete_many(session_filter(collection_name, session_key))
+            for batch in payload.batches():
+                if collection_name in DENORMALIZED_COLLECTIONS:
+                    batch = [{**d, **attributes} for d in batch]
+                batch = compact_batch(collection_name, batch)
+                if batch:
+                    db[collection_name].insert_many(batch, ordered=False)
+            if payload.count:
+                print(f"  -> [{session_key}] Stored {payload.count} documents in '{collection_name}'")
+                report.add(payload.count)
+
+    checkpoint = {
+        'hash': payload.hash, 'count': payload.count, 'watermark': payload.watermark,
+        'fetched_at': datetime.now(timezone.utc)
+    }
+    state = db.ingestion_state.find_one_and_update(
+        {'_id': session_key},
+        {'$set': {f'endpoints.{endpoint}': checkpoint}, '$pull': {'pending': endpoint}},
+        return_document=ReturnDocument.AFTER
+    )
+    if state and not state.get('pending'):
+        db.ingestion_state.update_one({'_id': session_key}, {'$set': {'complete': True}})
+
+def settled_max_age(date_end, cutoff_utc):
+    """Cache lifetime for data that ended at `date_end`: unlimited once OpenF1 has settled it, else none."""
+    if not date_end:
+        return 0
+    ended = datetime.fromisoformat(date_end)
+    if ended.tzinfo is None:
+        ended = ended.replace(tzinfo=timezone.utc)
+    return float('inf') if ended < cutoff_utc - timedelta(days=RAW_CACHE_SETTLED_DAYS) else 0
+
+def fetch_sessions(api, executor, meetings, cutoff_utc):
+    """
+    Fetches the sessions of `meetings` with one `sessions?year=` call per season instead of one call
+    per meeting, falling back to per-meeting calls for a season whose bulk fetch fails.
+    """
+    meetings_by_year = {}
+    for meeting in meetings:
+        meetings_by_year.setdefault(meeting.get('year'), []).append(meeting['_id'])
+
+    def fetch_year(year):
+        wanted = set(meetings_by_year[year])
+        if year is not None:
+            settled = datetime(year + 1, 1, 1, tzinfo=timezone.utc).isoformat()
+            sessions = fetch_data(api, 'sessions', {'year': year}, settled_max_age(settled, cutoff_utc))
+            if sessions is not None:
+                return [s for s in sessions if s.get('meeting_key') in wanted]
+        sessions = []
+        for meeting_key in wanted:
+            sessions.extend(fetch_data(api, 'sessions', {'meeting_key': meeting_key}) or [])
+        return sessions
+
+    return [session for sessions in executor.map(fetch_year, meetings_by_year) for session in sessions]
+
+def populate_all_data(workers=INGEST_WORKERS, rate_limit=OPENF1_RATE_LIMIT, api_base=OPENF1_API_BASE,
+                      full=False, since=None, offline=False, cache=True):
+    """
+    Main function to ingest the OpenF1 dataset incrementally.
+    Per-session, per-endpoint checkpoints in `ingestion_state` mean only new sessions, sessions
+    whose upstream payload changed, and sessions an interrupted run left unfinished are fetched.
+    `full` refreshes every session regardless; `since` (an ISO date) limits the run to sessions
+    starting on or after it. Session endpoints are fetched concurrently by `workers` threads
+    sharing one rate-limited connection pool, and each worker writes its own results.
+    Raw responses go through the disk cache in raw_cache.py unless `cache` is false; `offline`
+    answers every request from that cache, rebuilding the database without network access.
+    """
+    raw_cache = RawCache(RAW_CACHE_DIR, offline=offline) if cache or offline else None
+    api = OpenF1Client(api_base, rate_limit=rate_limit, pool_size=workers, cache=raw_cache)
+    report = IngestReport()
     try:
         cutoff_utc = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
         cutoff_date_str = cutoff_utc.isoformat(timespec='seconds')
-        print(f"--- Starting comprehensive data ingestion ---")
+        mode = ('full' if full else 'incremental') + (' offline' if offline else '')
+        print(f"--- Starting {mode} data ingestion ({workers} workers, {rate_limit or 'unlimited'} req/s) ---")
         print(f"Fetching data for all sessions completed before: {cutoff_date_str}Z")
+        if since:
+            print(f"Only considering sessions starting on or after: {since}")
+
+        migrate(db)
+        ensure_indexes(db)
 
         # 1. Fetch all meetings and upsert them into the meetings collection
         print("\n--- Step 1: Fetching and storing all meetings ---")
-        meetings_data = fetch_data('meetings', {})
+        meetings_data = fetch_data(api, 'meetings', {})
         if not meetings_data:
             raise Exception("Failed to fetch meetings. The API might be down. Aborting.")
-        
+
         meeting_updates = [ReplaceOne({'_id': m['meeting_key']}, {**m, '_id': m['meeting_key']}, upsert=True) for m in meetings_data]
+        meetings_changed = 0
         if meeting_updates:
-            db.meetings.bulk_write(meeting_updates)
+            result = db.meetings.bulk_write(meeting_updates)
+            meetings_changed = result.upserted_count + result.modified_count
             print(f"Upserted {len(meeting_updates)} meetings.")
 
-        # 2. Fetch all sessions and filter for completed ones
-        print("\n--- Step 2: Identifying completed sessions ---")
-        all_meetings = list(db.meetings.find({}, {'_id': 1}))
-        completed_sessions = []
-        for meeting in all_meetings:
-            sessions_data = fetch_data('sessions', {'meeting_key': meeting['_id']})
-            if sessions_data:
-                for session in sessions_data:
-                    if session.get('date_end') and session.get('date_end') < cutoff_date_str:
-                        completed_sessions.append({**session, '_id': session['session_key']})
-        
-        if not completed_sessions:
-            print("No new completed sessions found to process. Exiting.")
-            return
-        
-        # Upsert the session documents
-        session_updates = [ReplaceOne({'_id': s['_id']}, s, upsert=True) for s in completed_sessions]
-        db.sessions.bulk_write(session_updates)
-        print(f"Found and stored {len(completed_sessions)} completed sessions.")
-
-        # 3. For each completed session, clear its related data and re-ingest
-        print(f"\n--- Step 3: Fetching detailed data for {len(completed_sessions)} sessions ---")
-        
-        session_endpoints = [
-            'drivers', 'intervals', 'laps', 'pit', 'position', 
-            'race_control', 'session_result', 'stints', 'weather'
-        ]
-
-        for session in completed_sessions:
-            session_key = session['_id']
-            print(f"\nProcessing session: {session.get('session_name', 'N/A')} (Key: {session_key})")
-            
-            # Clear existing data for this session to avoid duplicates
-            for endpoint in session_endpoints:
-                collection_name = endpoint
-                if endpoint == 'pit': collection_name = 'pit_stops'
-                if endpoint == 'session_result': collection_name = 'session_results'
-                if endpoint != 'drivers': # Don't clear master driver list
-                    db[collection_name].delete_many({'session_key': session_key})
-
-            # Fetch new data for this session
-            for endpoint in session_endpoints:
-                time.sleep(0.1) # Be kind to the API
-                collection_name = endpoint
-                if endpoint == 'pit': collection_name = 'pit_stops'
-                if endpoint == 'session_result': collection_name = 'session_results'
-
-                data = fetch_data(endpoint, {'session_key': session_key})
-                if data:
-                    if endpoint == 'drivers':
-                        driver_updates = [ReplaceOne({'_id': d['driver_number']}, {**d, '_id': d['driver_number']}, upsert=True) for d in data]
-                        if driver_updates:
-                            db.drivers.bulk_write(driver_updates, ordered=False)
-                            print(f"  -> Upserted {len(driver_updates)} drivers.")
-                    else:
-                        db[collection_name].insert_many(data, ordered=False)
-                        print(f"  -> Stored {len(data)} documents in '{collection_name}'")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # 2. Fetch all sessions and filter for completed ones
+            print("\n--- Step 2: Identifying completed sessions ---")
+            meeting_query = {}
+            if since:
+                # A meeting can start up to a few days before its last session
+                meeting_query = {'date_start': {'$gte': (datetime.fromisoformat(since) - timedelta(days=7)).isoformat()}}
+            all_meetings = list(db.meetings.find(meeting_query, {'_id': 1, 'year': 1}))
+            completed_sessions = []
+            for session in fetch_sessions(api, executor, all_meetings, cutoff_utc):
+                if since and session.get('date_start', '') < since:
+                    continue
+                if session.get('date_end') and session.get('date_end') < cutoff_date_str:
+                    completed_sessions.append({**session, '_id': session['session_key']})
+
+            if not completed_sessions:
+                print("No new completed sessions found to process. Exiting.")
+                return
+
+            # Decide per session what needs fetching, using the checkpoints from earlier runs
+            meetings_by_key = {m['meeting_key']: m for m in meetings_data}
+            states = {s['_id']: s for s in db.ingestion_state.find({'_id': {'$in': [s['_id'] for s in completed_sessions]}})}
+            work, changed_sessions = [], []
+            for session in completed_sessions:
+                state = states.get(session['_id'])
+                status, pending = classify_session(session, state, full)
+                report.sessions[status] += 1
+                if status == 'skipped':
+                    continue
+                changed_sessions.append(session)
+                db.ingestion_state.update_one({'_id': session['_id']}, {'$set': {
+                    'session_hash': payload_hash(session), 'year': session.get('year'),
+                    'date_start': session.get('date_start'), 'complete': False, 'pending': pending
+                }}, upsert=True)
+                previous = (state or {}).get('endpoints', {})
+                attributes = session_attributes(session, meetings_by_key.get(session.get('meeting_key')))
+                max_age = settled_max_age(session.get('date_end'), cutoff_utc)
+                work.extend((session['_id'], endpoint, previous.get(endpoint, {}).get('hash'), attributes, max_age)
+                            for endpoint in pending)
+
+            # Upsert the session documents that are new or changed
+            session_updates = [ReplaceOne({'_id': s['_id']}, s, upsert=True) for s in changed_sessions]
+            if session_updates:
+                db.sessions.bulk_write(session_updates)
+            print(f"Found {len(completed_sessions)} completed sessions: {report.sessions['added']} new, "
+                  f"{report.sessions['refreshed']} to refresh, {report.sessions['skipped']} up to date.")
+
+            # 3. Fetch every pending (session, endpoint) pair concurrently, checkpointing each as it lands
+            print(f"\n--- Step 3: Fetching {len(work)} session endpoints ---")
+            futures = [
+                executor.submit(ingest_session_endpoint, api, session_key, endpoint, previous_hash, attributes, full,
+                                report, max_age)
+                for session_key, endpoint, previous_hash, attributes, max_age in work
+            ]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"  -> Failed to store session data: {e}")
+
+        # Time-align weather and race control onto the laps of the sessions that changed
+        annotate_sessions(db, [s['_id'] for s in changed_sessions])
+
+        # 4. Rebuild the materialized standings for the seasons that changed, and the changed races' traces
+        changed_years = {s.get('year') for s in changed_sessions}
+        print(f"\n--- Step 4: Rebuilding standings for {len(changed_years)} seasons and race traces ---")
+        rebuild_standings(db, changed_years)
+        rebuild_race_traces(db, [s['_id'] for s in changed_sessions])
+
+        # 5. Commit: tell the API its cached responses are stale
+        if changed_sessions or meetings_changed:
+            generation = bump_generation(db)
+            print(f"Committed ingestion generation {generation}.")
+
+            # 6. Refresh the columnar lap store; it is derived data, so a failure here is not fatal
+            if LAP_STORE_DIR:
+                print(f"\n--- Step 6: Exporting {len(changed_years)} seasons to the lap store ---")
+                try:
+                    export_seasons(db, LAP_STORE_DIR, changed_years, generation)
+                except Exception as e:
+                    print(f"  -> Could not export the lap store: {e}")
+
+        # 7. Publish static snapshots of settled sessions that changed or have none yet
+        if SNAPSHOT_DIR:
+            print("\n--- Step 7: Publishing session snapshots ---")
+            try:
+                publish_snapshots(db, SNAPSHOT_DIR, [s['_id'] for s in changed_sessions])
+            except Exception as e:
+                print(f"  -> Could not publish snapshots: {e}")
 
         print("\nData population complete!")
+        print(report.summary(api))
+        if raw_cache is not None:
+            print(raw_cache.summary())
 
     except Exception as e:
         print(f"\nAn unexpected high-level error occurred: {e}")
     finally:
+        api.close()
         client.close()
         print("MongoDB connection closed.")
 
 
 if __name__ == '__main__':
-    populate_all_data()
+    parser = argparse.ArgumentParser(description="Ingest OpenF1 data into MongoDB.")
+    parser.add_argument('--workers', type=int, default=INGEST_WORKERS,
+                        help="Number of concurrent fetch/write workers (1 reproduces a serial run).")
+    parser.add_argument('--rate-limit', type=float, default=OPENF1_RATE_LIMIT,
+                        help="Maximum OpenF1 requests per second across all workers (0 disables).")
+    parser.add_argument('--api-base', default=OPENF1_API_BASE,
+                        help="OpenF1 base URL, e.g. a local stand-in server from bench/fake_openf1.py.")
+    parser.add_argument('--full', action='store_true',
+                        help="Refresh every completed session, ignoring stored checkpoints.")
+    parser.add_argument('--since', metavar='YYYY-MM-DD',
+                        help="Only ingest sessions starting on or after this date.")
+    parser.add_argument('--offline', action='store_true',
+                        help="Answer every request from the raw response cache instead of OpenF1.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Bypass the raw response cache and download everything.")
+    args = parser.parse_args()
+    if args.offline and args.no_cache:
+        parser.error("--offline needs the raw response cache")
+    populate_all_data(workers=args.workers, rate_limit=args.rate_limit, api_base=args.api_base,
+                      full=args.full, since=args.since, offline=args.offline, cache=not args.no_cache)
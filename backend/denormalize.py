@@ -0,0 +1,63 @@
+# backend/denormalize.py
+"""
+Session and meeting attributes copied onto lap and result documents, so analytical queries
+can filter with an indexed $match instead of joining `sessions` and `meetings`.
+
+The ingestor stamps these fields as it writes; run this module directly to backfill data
+ingested before they existed:
+
+    python denormalize.py
+"""
+import os
+
+from pymongo import UpdateMany
+
+from generation import bump_generation
+
+SESSION_ATTRIBUTES = ['year', 'session_name', 'session_type', 'meeting_key', 'circuit_key']
+DENORMALIZED_COLLECTIONS = ['laps', 'session_results']
+
+
+def session_attributes(session, meeting=None):
+    """The attributes stamped onto a session's laps and results; circuit_key falls back to the meeting's."""
+    attributes = {field: session.get(field) for field in SESSION_ATTRIBUTES}
+    if attributes['circuit_key'] is None and meeting:
+        attributes['circuit_key'] = meeting.get('circuit_key')
+    return attributes
+
+
+def backfill_session_attributes(db, batch_size=500):
+    """Stamps session attributes onto every existing lap and result, one bulk update per batch of sessions."""
+    meetings = {m['_id']: m for m in db.meetings.find({}, {'circuit_key': 1})}
+    updates = []
+    total = 0
+    for session in db.sessions.find({}, {field: 1 for field in SESSION_ATTRIBUTES}):
+        attributes = session_attributes(session, meetings.get(session.get('meeting_key')))
+        updates.append(UpdateMany({'session_key': session['_id']}, {'$set': attributes}))
+        if len(updates) == batch_size:
+            total += _apply(db, updates)
+            updates = []
+    if updates:
+        total += _apply(db, updates)
+    return total
+
+
+def _apply(db, updates):
+    modified = 0
+    for collection_name in DENORMALIZED_COLLECTIONS:
+        modified += db[collection_name].bulk_write(updates, ordered=False).modified_count
+    return modified
+
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+
+    MONGO_URI = os.environ.get('MONGO_URI')
+    if not MONGO_URI:
+        raise Exception("MONGO_URI environment variable not set!")
+    client = MongoClient(MONGO_URI)
+    print("Backfilling session attributes onto laps and session_results...")
+    modified = backfill_session_attributes(client['f1_data'])
+    print(f"Updated {modified} documents.")
+    bump_generation(client['f1_data'])
+    client.close()
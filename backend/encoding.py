@@ -0,0 +1,65 @@
+# backend/encoding.py
+"""
+Single-pass BSON-to-JSON response encoding.
+
+pymongo results are serialized straight to response bytes with orjson. BSON types are
+rendered in the same relaxed Extended JSON shapes `bson.json_util` produced before
+(`{"$oid": ...}`, `{"$date": ...}`, `{"$numberDecimal": ...}`), so clients see no change.
+"""
+from datetime import datetime, timezone
+
+import orjson
+from bson import Decimal128, ObjectId
+from flask import Response, stream_with_context
+
+JSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+STREAM_CHUNK_SIZE = 256
+
+
+def _bson_default(value):
+    if isinstance(value, ObjectId):
+        return {'$oid': str(value)}
+    if isinstance(value, datetime):
+        return {'$date': _format_date(value)}
+    if isinstance(value, Decimal128):
+        return {'$numberDecimal': str(value)}
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _format_date(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec='milliseconds' if value.microsecond >= 1000 else 'seconds') + 'Z'
+
+
+def dumps(data):
+    """Encodes pymongo results to JSON bytes."""
+    return orjson.dumps(data, default=_bson_default, option=JSON_OPTIONS)
+
+
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def _iter_json_array(documents, chunk_size):
+    yield b'['
+    chunk = []
+    first = True
+    for document in documents:
+        chunk.append(dumps(document))
+        if len(chunk) == chunk_size:
+            yield (b'' if first else b',') + b','.join(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        yield (b'' if first else b',') + b','.join(chunk)
+    yield b']'
+
+
+def json_stream(documents, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Streams an iterable of documents (e.g. a cursor) as a JSON array without building the list first.
+    The request context stays active while the body is written, so the cursor's getMores are
+    attributed to the route and the request's timing covers them.
+    """
+    return Response(stream_with_context(_iter_json_array(documents, chunk_size)), mimetype='application/json')
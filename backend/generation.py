@@ -0,0 +1,48 @@
+# backend/generation.py
+"""
+Ingestion generation counter.
+
+Every process that changes served data bumps the counter once it has committed, and the
+API uses the current value to know when its in-process caches have gone stale.
+
+Live polling (see live.py) writes one session's rows every few seconds. It bumps that
+session's live generation instead, which only the response cache's entries for the session
+follow, so the other caches and the lap store stay valid through a race weekend.
+"""
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+
+GENERATION_ID = 'ingest_generation'
+LIVE_GENERATION_ID = 'live_generation'
+
+
+def bump_generation(db):
+    """Marks the data as changed; returns the new generation."""
+    doc = db.meta.find_one_and_update(
+        {'_id': GENERATION_ID},
+        {'$inc': {'value': 1}, '$set': {'committed_at': datetime.now(timezone.utc)}},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return doc['value']
+
+
+def read_generation(db):
+    doc = db.meta.find_one({'_id': GENERATION_ID})
+    return doc['value'] if doc else 0
+
+
+def bump_live_generation(db, session_key):
+    """Marks one session's live rows as changed; returns its new live generation."""
+    doc = db.meta.find_one_and_update(
+        {'_id': LIVE_GENERATION_ID},
+        {'$inc': {f'sessions.{session_key}': 1}, '$set': {'committed_at': datetime.now(timezone.utc)}},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return doc['sessions'][str(session_key)]
+
+
+def read_live_generations(db):
+    """{session_key: live generation} of every session live polling has written to."""
+    doc = db.meta.find_one({'_id': LIVE_GENERATION_ID})
+    return {int(key): value for key, value in (doc or {}).get('sessions', {}).items()}
@@ -0,0 +1,36 @@
+# backend/gunicorn.conf.py
+"""
+gunicorn settings for the API. gunicorn reads this file from the directory it starts in:
+
+    cd backend && gunicorn app:app
+
+With GUNICORN_PRELOAD on (the default), the master imports the app and calls `app.preload`
+before forking. The workers then start with the indexes ensured and the session catalog and
+reference data loaded, sharing those pages copy-on-write. With it off, each worker warms
+itself after it starts, as every worker used to. `bench/worker_startup.py` compares the two.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', '4'))
+# Threaded workers, so open /api/live/stream connections do not each hold a process
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() not in ('0', 'false', 'off', 'no')
+
+
+def when_ready(server):
+    """Runs in the master once it is listening, before the first worker forks."""
+    if preload_app:
+        import app
+        if app.preload():
+            server.log.info(f"Preloaded warm state in {app.warm_state['seconds']}s")
+        else:
+            server.log.warning(f"Preload failed, workers will warm themselves: {app.warm_state['error']}")
+
+
+def post_worker_init(worker):
+    """Runs in each worker once the app is loaded."""
+    if not preload_app:
+        import app
+        app.warm_up()
@@ -0,0 +1,222 @@
+# backend/indexes.py
+"""
+Declarative index registry for the f1_data collections.
+
+`ensure_indexes` is applied by the ingestor before it writes and by the API at startup. It
+creates the time-series collections first (see schema.py), since creating an index on a
+missing collection would create a regular one.
+Run this module directly to apply the registry, or with `--verify` to explain every route
+query (see `queries.route_queries`) and fail if any still needs a COLLSCAN or a blocking sort.
+A blocking sort is a SORT stage in a winning plan or a `$sort` the aggregation runs in memory
+(explain's `stages`). Sorts of computed values are listed in IN_MEMORY_SORTS with the reason.
+"""
+import os
+import sys
+import argparse
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+import queries
+from schema import ensure_collections
+
+
+def _index(name, *keys, **options):
+    return IndexModel([(key, direction) for key, direction in keys], name=name, **options)
+
+
+INDEXES = {
+    'laps': [
+        _index('session_driver_lap', ('session_key', ASCENDING), ('driver_number', ASCENDING), ('lap_number', ASCENDING)),
+        _index('session_lap_duration', ('session_key', ASCENDING), ('lap_duration', ASCENDING)),
+        _index('session_lap_number_duration', ('session_key', ASCENDING), ('lap_number', ASCENDING), ('lap_duration', ASCENDING)),
+        _index('session_lap_number_driver', ('session_key', ASCENDING), ('lap_number', ASCENDING), ('driver_number', ASCENDING)),
+        _index('year_lap_duration', ('year', ASCENDING), ('lap_duration', ASCENDING)),
+        _index('circuit_driver_lap_duration', ('circuit_key', ASCENDING), ('driver_number', ASCENDING), ('lap_duration', ASCENDING)),
+        # Lap condition filters (see conditions.py)
+        _index('session_track_status_lap_duration', ('session_key', ASCENDING), ('track_status', ASCENDING),
+               ('lap_number', ASCENDING), ('lap_duration', ASCENDING)),
+        _index('circuit_track_status_driver_lap_duration', ('circuit_key', ASCENDING), ('track_status', ASCENDING),
+               ('driver_number', ASCENDING), ('lap_duration', ASCENDING)),
+    ],
+    'session_results': [
+        _index('session_position', ('session_key', ASCENDING), ('position', ASCENDING)),
+        _index('session_driver', ('session_key', ASCENDING), ('driver_number', ASCENDING)),
+        _index('driver_position_session', ('driver_number', ASCENDING), ('position', ASCENDING), ('session_key', ASCENDING)),
+        _index('year_session_name_position', ('year', ASCENDING), ('session_name', ASCENDING), ('position', ASCENDING)),
+        _index('year_driver', ('year', ASCENDING), ('driver_number', ASCENDING)),
+        _index('session_name_year', ('session_name', ASCENDING), ('year', ASCENDING)),
+    ],
+    'sessions': [
+        _index('session_name', ('session_name', ASCENDING)),
+        _index('year', ('year', ASCENDING)),
+        _index('meeting_date_start', ('meeting_key', ASCENDING), ('date_start', DESCENDING)),
+    ],
+    'meetings': [
+        _index('date_start', ('date_start', DESCENDING)),
+    ],
+    'drivers': [
+        _index('full_name', ('full_name', ASCENDING)),
+        _index('team_name', ('team_name', ASCENDING)),
+    ],
+    'season_standings': [
+        _index('year_points', ('year', ASCENDING), ('points', DESCENDING)),
+        _index('driver_year', ('driver_number', ASCENDING), ('year', ASCENDING)),
+    ],
+    'season_records': [
+        _index('champion_driver', ('champion_driver', ASCENDING)),
+    ],
+    'pit_stops': [
+        _index('session_driver', ('session_key', ASCENDING), ('driver_number', ASCENDING)),
+    ],
+    'stints': [
+        _index('session_driver', ('session_key', ASCENDING), ('driver_number', ASCENDING)),
+    ],
+    'position': [
+        _index('meta_session_driver_date', ('meta.session_key', ASCENDING), ('meta.driver_number', ASCENDING), ('date', ASCENDING)),
+    ],
+    'intervals': [
+        _index('meta_session_driver_date', ('meta.session_key', ASCENDING), ('meta.driver_number', ASCENDING), ('date', ASCENDING)),
+    ],
+    'race_control': [
+        _index('session_date', ('session_key', ASCENDING), ('date', ASCENDING)),
+    ],
+    'weather': [
+        _index('meta_session_date', ('meta.session_key', ASCENDING), ('date', ASCENDING)),
+    ],
+    'live_leases': [
+        # MongoDB deletes a lease once it has expired (see live.py)
+        _index('expires_at', ('expires_at', ASCENDING), expireAfterSeconds=0),
+    ],
+}
+
+
+# Route query -> sort patterns it is expected to sort in memory, each with why no index can serve it
+IN_MEMORY_SORTS = {
+    'records_champion': {(('total_points', -1),): "Ranks per-driver point totals computed by $group."},
+    'records_most_wins': {(('wins', -1),): "Ranks per-driver win counts computed by $group."},
+    'meetings': {(('year', -1), ('date_start', -1)): "Orders the meetings left after $group de-duplicates them."},
+    'session_positions': {(('is_finisher', 1), ('position', 1)): "is_finisher is computed by $addFields."},
+    'session_fastest_laps': {(('fastest_lap_duration', 1),): "Ranks each driver's best lap, one row per driver after $group."},
+    'laps_fastest': {(('lap_duration', 1),): "Re-sorts the one lap per driver left after $group."},
+    'driver_championships': {(('_id.year', 1), ('total_points', -1)): "Ranks per-season point totals computed by $group."},
+}
+
+
+def ensure_indexes(db, prune=False):
+    """Creates every registered index (a no-op for ones that exist). `prune` drops unregistered indexes."""
+    ensure_collections(db)
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        collection.create_indexes(models)
+        if prune:
+            wanted = {model.document['name'] for model in models} | {'_id_'}
+            for name in collection.index_information():
+                if name not in wanted:
+                    collection.drop_index(name)
+                    print(f"  -> Dropped unregistered index {collection_name}.{name}")
+
+
+def sample_keys(db):
+    """Real keys from the database to instantiate the route queries with."""
+    race = db.sessions.find_one({'session_name': 'Race'}, sort=[('date_start', DESCENDING)])
+    if not race:
+        raise Exception("No race sessions found; ingest some data before verifying.")
+    result = db.session_results.find_one({'session_key': race['_id']}) or {}
+    meeting = db.meetings.find_one({'_id': race['meeting_key']}) or {}
+    return {
+        'session_key': race['_id'], 'year': race.get('year'), 'meeting_key': race['meeting_key'],
+        'circuit_key': meeting.get('circuit_key'), 'driver_number': result.get('driver_number', 1),
+    }
+
+
+def explain(db, collection, operation, spec):
+    if operation == 'aggregate':
+        command = {'aggregate': collection, 'pipeline': spec, 'cursor': {}}
+    elif operation == 'find':
+        command = {'find': collection, **spec}
+    elif operation == 'count':
+        command = {'count': collection, **spec}
+    else:
+        command = {'distinct': collection, **spec}
+    return db.command('explain', command, verbosity='queryPlanner')
+
+
+def plan_stages(node, in_winning_plan=False):
+    """Yields every stage name inside the winning plans of an explain document."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'rejectedPlans':
+                continue
+            if key == 'stage' and in_winning_plan:
+                yield value
+            yield from plan_stages(value, in_winning_plan or key == 'winningPlan')
+    elif isinstance(node, list):
+        for item in node:
+            yield from plan_stages(item, in_winning_plan)
+
+
+def blocking_sorts(node, in_winning_plan=False):
+    """Yields the sort pattern, as ((field, direction), ...), of every in-memory sort in an explain document."""
+    if isinstance(node, dict):
+        if in_winning_plan and node.get('stage') == 'SORT':
+            yield tuple((node.get('sortPattern') or {}).items())
+        sort = node.get('$sort')
+        if isinstance(sort, dict) and 'sortKey' in sort:
+            # An aggregation stage that did not become part of the query plan
+            yield tuple(sort['sortKey'].items())
+        for key, value in node.items():
+            # `command` echoes the pipeline as sent; rejected plans never run
+            if key not in ('rejectedPlans', 'command'):
+                yield from blocking_sorts(value, in_winning_plan or key == 'winningPlan')
+    elif isinstance(node, list):
+        for item in node:
+            yield from blocking_sorts(item, in_winning_plan)
+
+
+def verify(db):
+    """Explains each route query; returns the names of those that scan the collection or sort in memory unexpectedly."""
+    failures = []
+    for name, collection, operation, spec in queries.route_queries(sample_keys(db)):
+        plan = explain(db, collection, operation, spec)
+        stages = set(plan_stages(plan))
+        # Each listed pattern excuses one sort, so an indexed sort on the same key cannot regress unseen
+        allowed = list(IN_MEMORY_SORTS.get(name, {}))
+        sorts = []
+        for pattern in blocking_sorts(plan):
+            if pattern in allowed:
+                allowed.remove(pattern)
+            else:
+                sorts.append(pattern)
+        bad = sorted(stages & {'COLLSCAN'}) + [f"SORT {dict(pattern)}" for pattern in sorts]
+        print(f"{'FAIL' if bad else 'ok  '}  {name:<28} {collection:<16} {', '.join(sorted(stages))}"
+              + (f"  ({'; '.join(bad)})" if bad else ""))
+        if bad:
+            failures.append(name)
+    return failures
+
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Apply or verify the f1_data index registry.")
+    parser.add_argument('--verify', action='store_true',
+                        help="Explain every route query and fail on COLLSCAN or an unexpected in-memory sort.")
+    parser.add_argument('--prune', action='store_true', help="Drop indexes that are not in the registry.")
+    args = parser.parse_args()
+
+    MONGO_URI = os.environ.get('MONGO_URI')
+    if not MONGO_URI:
+        raise Exception("MONGO_URI environment variable not set!")
+    client = MongoClient(MONGO_URI)
+    db = client['f1_data']
+    ensure_indexes(db, prune=args.prune)
+    print("Indexes are up to date.")
+    if args.verify:
+        failures = verify(db)
+        client.close()
+        if failures:
+            print(f"\n{len(failures)} route queries still scan or sort in memory: {', '.join(failures)}")
+            sys.exit(1)
+        print("\nEvery route query is served by an index.")
+    else:
+        client.close()
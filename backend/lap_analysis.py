@@ -0,0 +1,92 @@
+# backend/lap_analysis.py
+"""
+Vectorized lap comparison for the comparison page.
+
+Each column's laps are aligned onto the union of lap numbers as NumPy arrays (NaN where a
+column has no lap), so deltas, rolling averages and sector comparisons are array
+operations instead of per-lap loops in the browser.
+"""
+import warnings
+
+import numpy as np
+
+LAP_FIELDS = ['lap_duration', 'sector_1_time', 'sector_2_time', 'sector_3_time']
+
+
+def _round(values, digits=3):
+    """Rounded floats for JSON; NaN becomes null when encoded."""
+    return np.round(values, digits).tolist()
+
+
+def _scalar(value, digits=3):
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def align_laps(columns_laps):
+    """Returns the sorted union of lap numbers and a (columns, laps, fields) array of times."""
+    lap_numbers = np.array(sorted({lap['lap_number'] for laps in columns_laps for lap in laps}), dtype=np.int64)
+    aligned = np.full((len(columns_laps), len(lap_numbers), len(LAP_FIELDS)), np.nan)
+    for column, laps in enumerate(columns_laps):
+        if not laps:
+            continue
+        rows = np.searchsorted(lap_numbers, [lap['lap_number'] for lap in laps])
+        values = np.array([[lap.get(field) for field in LAP_FIELDS] for lap in laps], dtype=float)
+        aligned[column, rows] = values
+    return lap_numbers, aligned
+
+
+def rolling_mean(values, window):
+    """Trailing mean over `window` laps that ignores missing laps; NaN until a lap is present."""
+    present = ~np.isnan(values)
+    sums = np.cumsum(np.where(present, values, 0.0))
+    counts = np.cumsum(present)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts[window:] = counts[window:] - counts[:-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def compare_columns(columns_laps, reference=0, window=3):
+    """
+    Per-column analysis against the `reference` column: lap-by-lap and cumulative delta,
+    rolling average, sector deltas, and summary pace and consistency figures.
+    """
+    lap_numbers, aligned = align_laps(columns_laps)
+    if not len(lap_numbers):
+        return [None for _ in columns_laps]
+    durations = aligned[:, :, 0]
+    deltas = aligned - aligned[reference]
+    lap_deltas = deltas[:, :, 0]
+    # Cumulative delta only accrues on laps both columns completed
+    cumulative = np.cumsum(np.nan_to_num(lap_deltas), axis=1)
+    cumulative[np.isnan(lap_deltas)] = np.nan
+
+    # Columns with no laps at all produce all-NaN slices; their figures are simply null
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        fastest = np.nanmin(durations, axis=1)
+        average = np.nanmean(durations, axis=1)
+        stddev = np.nanstd(durations, axis=1)
+        mean_sector_deltas = np.nanmean(deltas[:, :, 1:], axis=1)
+        mean_lap_delta = np.nanmean(lap_deltas, axis=1)
+
+    results = []
+    for column in range(len(columns_laps)):
+        results.append({
+            'lap_numbers': lap_numbers.tolist(),
+            'delta_to_reference': _round(lap_deltas[column]),
+            'cumulative_delta': _round(cumulative[column]),
+            'rolling_average': _round(rolling_mean(durations[column], window)),
+            'sector_deltas': {
+                f'sector_{sector}': _round(deltas[column, :, sector]) for sector in (1, 2, 3)
+            },
+            'mean_sector_delta': {
+                f'sector_{sector}': _scalar(mean_sector_deltas[column, sector - 1]) for sector in (1, 2, 3)
+            },
+            'mean_lap_delta': _scalar(mean_lap_delta[column]),
+            'fastest_lap': _scalar(fastest[column]),
+            'average_lap': _scalar(average[column]),
+            'consistency_stddev': _scalar(stddev[column]),
+            'laps_counted': int(np.count_nonzero(~np.isnan(durations[column]))),
+        })
+    return results
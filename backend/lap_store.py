@@ -0,0 +1,312 @@
+# backend/lap_store.py
+"""
+Columnar, memory-mapped copy of the `laps` collection for analytical queries.
+
+Mongo remains the system of record. After each ingest that changes data, the ingestor
+exports the changed seasons to one directory per season. Each directory holds one `.npy`
+array per field:
+
+    <LAP_STORE_DIR>/manifest.json        generation, row counts per season and the dictionaries
+    <LAP_STORE_DIR>/2024/lap_duration.npy
+    <LAP_STORE_DIR>/2024/driver.npy      ...
+
+Drivers, circuits, compounds and session names are dictionary-encoded into small integer
+codes shared by every season, with the code tables kept in the manifest. Seasons are written
+to a temporary directory and renamed into place, so a reader never sees half a season.
+
+The API opens the arrays with `mmap_mode='r'`, so the page cache holds the data and every
+worker process shares it. Best-lap, percentile and grouped aggregate queries are vectorized
+scans over the selected seasons. The store is only used while its manifest generation
+matches the database's (see generation.py). Otherwise, for example between an ingest and
+its export, callers fall back to Mongo.
+
+    python lap_store.py                    # export every season
+    python lap_store.py --years 2023 2024
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import threading
+
+import numpy as np
+
+LAP_STORE_DIR = os.environ.get('LAP_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lap_store'))
+LAP_STORE_GENERATION_TTL = float(os.environ.get('LAP_STORE_GENERATION_TTL', '5'))
+MANIFEST = 'manifest.json'
+MISSING = -1
+
+# Column -> dtype; float columns use NaN for a missing value
+COLUMNS = {
+    'session_key': np.int32, 'lap_number': np.int16, 'driver': np.int16, 'circuit': np.int16,
+    'session_name': np.int8, 'compound': np.int8, 'is_pit_out_lap': np.bool_,
+    'lap_duration': np.float64, 'duration_sector_1': np.float64,
+    'duration_sector_2': np.float64, 'duration_sector_3': np.float64,
+}
+DICTIONARIES = ('drivers', 'circuits', 'compounds', 'session_names')
+GROUP_DICTIONARIES = {'driver': 'drivers', 'circuit': 'circuits', 'compound': 'compounds', 'session_name': 'session_names'}
+LAP_PROJECTION = {
+    '_id': 0, 'session_key': 1, 'lap_number': 1, 'driver_number': 1, 'circuit_key': 1, 'session_name': 1,
+    'is_pit_out_lap': 1, 'lap_duration': 1, 'duration_sector_1': 1, 'duration_sector_2': 1, 'duration_sector_3': 1,
+}
+
+
+class _Encoder:
+    """Maps values to codes, appending new values to the dictionary. Existing codes never change."""
+
+    def __init__(self, dictionary):
+        self.dictionary = dictionary
+        self.codes = {value: code for code, value in enumerate(dictionary)}
+
+    def __call__(self, value):
+        if value is None:
+            return MISSING
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.dictionary)
+            self.dictionary.append(value)
+        return code
+
+
+def _float(value):
+    return np.nan if value is None else value
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'generation': None, 'seasons': {}, 'dictionaries': {name: [] for name in DICTIONARIES}}
+
+
+def _write_manifest(directory, manifest):
+    temporary = os.path.join(directory, f'.{MANIFEST}.{os.getpid()}')
+    with open(temporary, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(temporary, os.path.join(directory, MANIFEST))
+
+
+def _stint_compounds(db, session_keys):
+    """(session_key, driver_number) -> [(lap_start, lap_end, compound)]."""
+    stints = {}
+    for stint in db.stints.find({'session_key': {'$in': session_keys}},
+                                {'_id': 0, 'session_key': 1, 'driver_number': 1, 'lap_start': 1, 'lap_end': 1, 'compound': 1}):
+        stints.setdefault((stint['session_key'], stint['driver_number']), []).append(
+            (stint.get('lap_start') or 0, stint.get('lap_end') or 10 ** 4, stint.get('compound')))
+    return stints
+
+
+def _compound(stints, lap):
+    for lap_start, lap_end, compound in stints:
+        if lap_start <= lap <= lap_end:
+            return compound
+    return None
+
+
+def export_season(db, directory, year, dictionaries):
+    """Writes one season's laps as columns; returns its row count. `dictionaries` grows in place."""
+    values = {name: [] for name in COLUMNS}
+    laps = list(db.laps.find({'year': year}, LAP_PROJECTION).sort([('session_key', 1), ('driver_number', 1), ('lap_number', 1)]))
+    stints = _stint_compounds(db, sorted({lap['session_key'] for lap in laps}))
+    encode = {name: _Encoder(dictionaries[name]) for name in DICTIONARIES}
+    for lap in laps:
+        values['session_key'].append(lap['session_key'])
+        values['lap_number'].append(lap.get('lap_number') or 0)
+        values['driver'].append(encode['drivers'](lap.get('driver_number')))
+        values['circuit'].append(encode['circuits'](lap.get('circuit_key')))
+        values['session_name'].append(encode['session_names'](lap.get('session_name')))
+        values['compound'].append(encode['compounds'](_compound(
+            stints.get((lap['session_key'], lap.get('driver_number')), []), lap.get('lap_number') or 0)))
+        values['is_pit_out_lap'].append(bool(lap.get('is_pit_out_lap')))
+        for name in ('lap_duration', 'duration_sector_1', 'duration_sector_2', 'duration_sector_3'):
+            values[name].append(_float(lap.get(name)))
+
+    temporary = os.path.join(directory, f'.{year}.{os.getpid()}')
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    for name, dtype in COLUMNS.items():
+        np.save(os.path.join(temporary, f'{name}.npy'), np.array(values[name], dtype=dtype))
+    target, retired = os.path.join(directory, str(year)), os.path.join(directory, f'.{year}.retired.{os.getpid()}')
+    if os.path.exists(target):
+        # Readers that still map the old files keep them until they let go
+        os.rename(target, retired)
+    os.rename(temporary, target)
+    shutil.rmtree(retired, ignore_errors=True)
+    return len(laps)
+
+
+def export_seasons(db, directory, years, generation):
+    """
+    Exports `years` (every season if None) and stamps the store with the data generation.
+    Seasons the store does not hold yet are always exported, so a new store starts complete.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    available = {y for y in db.sessions.distinct('year') if y is not None}
+    years = available if years is None else {y for y in years if y is not None}
+    years |= {y for y in available if str(y) not in manifest['seasons']}
+    for year in sorted(years):
+        rows = export_season(db, directory, year, manifest['dictionaries'])
+        manifest['seasons'][str(year)] = rows
+        print(f"  -> Exported {rows} laps for {year} to the lap store.")
+    manifest['generation'] = generation
+    manifest['exported_at'] = time.time()
+    _write_manifest(directory, manifest)
+
+
+class LapStoreSnapshot:
+    """Read-only view of the store as of one manifest, with each season's columns mapped on first use."""
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.generation = manifest['generation']
+        self.years = sorted(int(year) for year in manifest['seasons'])
+        self.dictionaries = manifest['dictionaries']
+        self.codes = {name: {value: code for code, value in enumerate(values)}
+                      for name, values in self.dictionaries.items()}
+        self.partitions = {}
+        self.lock = threading.Lock()
+
+    def partition(self, year):
+        columns = self.partitions.get(year)
+        if columns is None:
+            with self.lock:
+                columns = self.partitions.get(year)
+                if columns is None:
+                    path = os.path.join(self.directory, str(year))
+                    columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in COLUMNS}
+                    self.partitions[year] = columns
+        return columns
+
+    def _code_list(self, dictionary, values):
+        return [self.codes[dictionary][v] for v in values if v in self.codes[dictionary]]
+
+    def _selections(self, years=None, drivers=None, circuit_key=None, session_name=None, compound=None,
+                    field='lap_duration', exclude_pit_out=False):
+        """Yields (year, columns, row positions) for the laps matching every given filter."""
+        filters = []
+        for column, dictionary, value in (('circuit', 'circuits', circuit_key), ('session_name', 'session_names', session_name),
+                                          ('compound', 'compounds', compound)):
+            if value is not None:
+                if value not in self.codes[dictionary]:
+                    return
+                filters.append((column, self.codes[dictionary][value]))
+        driver_codes = self._code_list('drivers', drivers) if drivers is not None else None
+        if driver_codes == []:
+            return
+        for year in self.years if years is None else [y for y in years if y in self.years]:
+            columns = self.partition(year)
+            mask = ~np.isnan(columns[field])
+            for column, code in filters:
+                mask &= columns[column] == code
+            if driver_codes is not None:
+                mask &= np.isin(columns['driver'], driver_codes)
+            if exclude_pit_out:
+                mask &= ~columns['is_pit_out_lap']
+            rows = np.flatnonzero(mask)
+            if len(rows):
+                yield year, columns, rows
+
+    def best_laps(self, drivers=None, circuit_key=None, years=None, session_name=None):
+        """driver_number -> (fastest lap_duration, year) among the matching laps."""
+        best = {}
+        for year, columns, rows in self._selections(years, drivers, circuit_key, session_name):
+            durations = columns['lap_duration'][rows]
+            order = np.argsort(durations, kind='stable')
+            codes, first = np.unique(columns['driver'][rows][order], return_index=True)
+            for code, index in zip(codes.tolist(), first.tolist()):
+                driver, duration = self.dictionaries['drivers'][code], float(durations[order[index]])
+                if driver not in best or duration < best[driver][0]:
+                    best[driver] = (duration, year)
+        return best
+
+    def percentiles(self, q=(50, 90, 99), field='lap_duration', **filters):
+        """The `q` percentiles of `field` over the matching laps, or None if there are none."""
+        values = [columns[field][rows] for _, columns, rows in self._selections(field=field, **filters)]
+        if not values:
+            return None
+        return dict(zip(q, np.percentile(np.concatenate(values), q).tolist()))
+
+    def aggregate(self, by='driver', field='lap_duration', **filters):
+        """Count, mean, min, max and standard deviation of `field` per driver, circuit, compound, session name or year."""
+        groups, samples = [], []
+        for year, columns, rows in self._selections(field=field, **filters):
+            groups.append(np.full(len(rows), year) if by == 'year' else np.asarray(columns[by][rows], dtype=np.int64))
+            samples.append(columns[field][rows])
+        if not groups:
+            return {}
+        groups, samples = np.concatenate(groups), np.concatenate(samples)
+        keys, inverse = np.unique(groups, return_inverse=True)
+        count = np.bincount(inverse)
+        total = np.bincount(inverse, weights=samples)
+        mean = total / count
+        variance = np.bincount(inverse, weights=(samples - mean[inverse]) ** 2) / count
+        minimum = np.full(len(keys), np.inf)
+        maximum = np.full(len(keys), -np.inf)
+        np.minimum.at(minimum, inverse, samples)
+        np.maximum.at(maximum, inverse, samples)
+        labels = self.dictionaries.get(GROUP_DICTIONARIES.get(by))
+        label = lambda key: key if labels is None else labels[key] if key != MISSING else None
+        return {
+            label(key): {
+                'count': int(count[i]), 'mean': float(mean[i]), 'min': float(minimum[i]),
+                'max': float(maximum[i]), 'stddev': float(np.sqrt(variance[i])),
+            } for i, key in enumerate(keys.tolist())
+        }
+
+
+class LapStore:
+    """Hands out the current snapshot, or None when the store is missing or behind the database."""
+
+    def __init__(self, directory, generation_loader, generation_ttl=LAP_STORE_GENERATION_TTL):
+        self.directory = directory
+        self.generation_loader = generation_loader
+        self.generation_ttl = generation_ttl
+        self.snapshot = None
+        self.usable = False
+        self.manifest_mtime = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def current(self):
+        now = time.monotonic()
+        if now - self.checked_at > self.generation_ttl:
+            with self.lock:
+                if now - self.checked_at > self.generation_ttl:
+                    self._refresh()
+                    self.checked_at = now
+        return self.snapshot if self.usable else None
+
+    def _refresh(self):
+        if not self.directory:
+            return
+        try:
+            mtime = os.stat(os.path.join(self.directory, MANIFEST)).st_mtime
+        except FileNotFoundError:
+            self.snapshot, self.usable = None, False
+            return
+        if mtime != self.manifest_mtime:
+            self.snapshot = LapStoreSnapshot(self.directory, read_manifest(self.directory))
+            self.manifest_mtime = mtime
+        self.usable = self.snapshot.generation == self.generation_loader()
+
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+
+    from generation import read_generation
+
+    parser = argparse.ArgumentParser(description="Export laps from MongoDB to the columnar lap store.")
+    parser.add_argument('--years', type=int, nargs='+', help="Seasons to export. Defaults to every season.")
+    parser.add_argument('--directory', default=LAP_STORE_DIR)
+    args = parser.parse_args()
+
+    MONGO_URI = os.environ.get('MONGO_URI')
+    if not MONGO_URI:
+        raise Exception("MONGO_URI environment variable not set!")
+    client = MongoClient(MONGO_URI)
+    db = client['f1_data']
+    export_seasons(db, args.directory, args.years, read_generation(db))
+    client.close()
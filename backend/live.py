@@ -0,0 +1,356 @@
+# backend/live.py
+"""
+Live session mode: incremental OpenF1 polling with fan-out to Server-Sent Events clients.
+
+A `LivePoller` polls the live streams of one session, asking OpenF1 only for rows newer than
+the latest it has already stored (a `date>` watermark per stream). New rows are upserted into
+Mongo on their natural key and then published to every subscriber. `position` and `intervals`
+are time-series collections (see schema.py), which do not support upserts; their new rows are
+inserted, skipping any whose driver and date are already stored.
+
+Every API worker process runs its own pollers, so only the holder of the session's lease in
+`live_leases` polls OpenF1 and writes. The holder renews it on every poll; it lapses
+LIVE_LEASE_SECONDS after the last renewal, and any poller of the session may then take it over.
+The other pollers read the rows the holder stored from Mongo and publish those instead.
+`LiveHub` keeps one poller per session for the whole process and stops it once the last
+subscriber leaves, so the load on OpenF1 does not depend on the number of viewers or workers.
+
+Run it directly to ingest the active session without serving the API:
+
+    python live.py --session-key latest --interval 4
+"""
+import os
+import time
+import uuid
+import queue
+import socket
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from denormalize import DENORMALIZED_COLLECTIONS, session_attributes
+from generation import bump_live_generation
+from schema import META_FIELD, TIME_FIELD, TIME_SERIES, compact_batch, expand, format_date, session_filter, to_datetime
+from openf1_client import OpenF1Client, OPENF1_API_BASE
+
+LIVE_POLL_INTERVAL = float(os.environ.get('LIVE_POLL_INTERVAL', 4))
+LIVE_QUEUE_SIZE = int(os.environ.get('LIVE_QUEUE_SIZE', 256))
+# Several polls long, so one slow poll does not hand the session to another process
+LIVE_LEASE_SECONDS = float(os.environ.get('LIVE_LEASE_SECONDS', 15))
+# OpenF1's date_end is the scheduled end; red flags and late timing rows run past it
+LIVE_GRACE_SECONDS = float(os.environ.get('LIVE_GRACE_SECONDS', 3600))
+
+# Stream -> (watermark field, natural key of a row)
+LIVE_STREAMS = {
+    'position': ('date', ['session_key', 'driver_number', 'date']),
+    'intervals': ('date', ['session_key', 'driver_number', 'date']),
+    'laps': ('date_start', ['session_key', 'driver_number', 'lap_number']),
+    'race_control': ('date', ['session_key', 'date', 'category', 'message']),
+}
+
+
+def fetch_session(api, session_key='latest'):
+    """The OpenF1 session document for a key, or the most recent session for 'latest'."""
+    sessions = api.get('sessions', {'session_key': session_key})
+    return sessions[-1] if sessions else None
+
+
+def fetch_since(api, endpoint, session_key, field, watermark):
+    """Rows of a session's stream newer than `watermark`, using OpenF1's `field>value` filter syntax."""
+    query = f"session_key={session_key}"
+    if watermark:
+        # The comparison is part of the key, so the query string is built by hand
+        query += f"&{field}>{quote(watermark, safe=':.')}"
+    return api.get(endpoint, query)
+
+
+def has_ended(session, now=None, grace_seconds=LIVE_GRACE_SECONDS):
+    """True once a session's `date_end`, plus the grace period, has passed. A session without one has not ended."""
+    date_end = to_datetime(session.get('date_end'))
+    if date_end is None:
+        return False
+    if date_end.tzinfo is None:
+        # pymongo returns naive datetimes, which are UTC
+        date_end = date_end.replace(tzinfo=timezone.utc)
+    return (now or datetime.now(timezone.utc)) > date_end + timedelta(seconds=grace_seconds)
+
+
+def acquire_lease(db, session_key, owner, seconds=LIVE_LEASE_SECONDS):
+    """Takes or renews the session's polling lease for `owner`; False while another owner holds it."""
+    now = datetime.now(timezone.utc)
+    try:
+        db.live_leases.find_one_and_update(
+            {'_id': session_key, '$or': [{'owner': owner}, {'expires_at': {'$lt': now}}]},
+            {'$set': {'owner': owner, 'expires_at': now + timedelta(seconds=seconds)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # Another owner holds the lease, so the upsert tried to insert a second one
+        return False
+    return True
+
+
+def release_lease(db, session_key, owner):
+    db.live_leases.delete_one({'_id': session_key, 'owner': owner})
+
+
+def _sample_key(document):
+    """(meta, date) of a time-series sample, with the date as the naive UTC datetime pymongo returns."""
+    date = document.get(TIME_FIELD)
+    if isinstance(date, datetime) and date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return tuple(sorted((document.get(META_FIELD) or {}).items())), date
+
+
+def _drain(subscriber):
+    while True:
+        try:
+            subscriber.get_nowait()
+        except queue.Empty:
+            return
+
+
+class Broadcaster:
+    """Fans events out to subscriber queues. A subscriber that stops reading is dropped, not waited on."""
+
+    def __init__(self, queue_size=LIVE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+            return len(self.subscribers)
+
+    def publish(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # Drop the slow client with a None sentinel; it can reconnect and catch up from Mongo
+                self.unsubscribe(subscriber)
+                _drain(subscriber)
+                subscriber.put_nowait(None)
+
+
+class LivePoller:
+    """Polls one session's live streams into Mongo, or follows the lease holder's writes, and publishes the new rows."""
+
+    def __init__(self, db, api, session_key, interval=LIVE_POLL_INTERVAL, broadcaster=None):
+        self.db = db
+        self.api = api
+        self.session_key = session_key
+        self.interval = interval
+        self.broadcaster = broadcaster or Broadcaster()
+        self.watermarks = {}
+        self.attributes = None
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.leading = False
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _load_watermarks(self):
+        """Resumes from the newest row already stored for each stream."""
+        for stream, (field, _) in LIVE_STREAMS.items():
+            latest = self.db[stream].find_one({**session_filter(stream, self.session_key), field: {'$ne': None}},
+                                              {field: 1}, sort=[(field, -1)])
+            # Time-series samples store a datetime; the watermark is compared with OpenF1's ISO strings
+            self.watermarks[stream] = format_date(latest[field]) if latest else None
+
+    def _load_session(self):
+        session = fetch_session(self.api, self.session_key)
+        if not session:
+            return
+        session = {**session, '_id': session['session_key']}
+        self.db.sessions.replace_one({'_id': session['_id']}, session, upsert=True)
+        meeting = self.db.meetings.find_one({'_id': session.get('meeting_key')}, {'circuit_key': 1})
+        self.attributes = session_attributes(session, meeting)
+
+    def _new_samples(self, stream, documents):
+        """The time-series samples of a batch that are not stored yet."""
+        dates = [document[TIME_FIELD] for document in documents]
+        stored = {_sample_key(document) for document in self.db[stream].find(
+            {**session_filter(stream, self.session_key), TIME_FIELD: {'$gte': min(dates), '$lte': max(dates)}},
+            {'_id': 0, META_FIELD: 1, TIME_FIELD: 1})}
+        return [document for document in documents if _sample_key(document) not in stored]
+
+    def _store(self, stream, natural_key, documents):
+        if stream in TIME_SERIES:
+            # A lease handed over mid-poll can have two processes insert the same samples
+            documents = self._new_samples(stream, documents)
+            if documents:
+                self.db[stream].insert_many(documents, ordered=False)
+        else:
+            self.db[stream].bulk_write([
+                UpdateOne({key: row.get(key) for key in natural_key}, {'$set': row}, upsert=True) for row in documents
+            ], ordered=False)
+
+    def _fetch(self):
+        """Polls OpenF1 and stores the new rows; returns {stream: rows}."""
+        batches = {}
+        for stream, (field, natural_key) in LIVE_STREAMS.items():
+            try:
+                rows = fetch_since(self.api, stream, self.session_key, field, self.watermarks.get(stream))
+            except Exception as e:
+                logging.warning(f"Live poll of {stream} for session {self.session_key} failed: {e}")
+                continue
+            watermark = self.watermarks.get(stream)
+            rows = [row for row in rows or [] if row.get(field) and (not watermark or row[field] > watermark)]
+            if not rows:
+                continue
+            if self.attributes and stream in DENORMALIZED_COLLECTIONS:
+                rows = [{**row, **self.attributes} for row in rows]
+            self._store(stream, natural_key, compact_batch(stream, rows))
+            batches[stream] = rows
+        return batches
+
+    def _follow(self):
+        """Reads the rows the lease holder stored after the watermarks; returns {stream: rows}."""
+        batches = {}
+        for stream, (field, _) in LIVE_STREAMS.items():
+            watermark = self.watermarks.get(stream)
+            if stream in TIME_SERIES:
+                watermark = to_datetime(watermark)
+            documents = self.db[stream].find(
+                {**session_filter(stream, self.session_key), field: {'$gt': watermark} if watermark else {'$ne': None}},
+                sort=[(field, 1)],
+            )
+            rows = [expand(stream, document) if stream in TIME_SERIES
+                    else {key: value for key, value in document.items() if key != '_id'} for document in documents]
+            if rows:
+                batches[stream] = rows
+        return batches
+
+    def poll_once(self):
+        """Stores (as the lease holder) or reads (otherwise) every stream's new rows; returns the number of rows."""
+        leading = acquire_lease(self.db, self.session_key, self.owner, max(LIVE_LEASE_SECONDS, self.interval * 2))
+        if leading and not self.leading:
+            # Picks up the session, and whatever the previous holder stored after our last read
+            self._load_session()
+            self._load_watermarks()
+        self.leading = leading
+        batches = self._fetch() if leading else self._follow()
+        rows_read = 0
+        for stream, rows in batches.items():
+            self.watermarks[stream] = format_date(max(row[LIVE_STREAMS[stream][0]] for row in rows))
+            rows_read += len(rows)
+            self.broadcaster.publish({'stream': stream, 'session_key': self.session_key, 'rows': rows})
+        if rows_read and leading:
+            # Cached responses for this session are stale now; nothing else is
+            bump_live_generation(self.db, self.session_key)
+        return rows_read
+
+    def run(self, verbose=False):
+        """Polls every `interval` seconds until stopped."""
+        try:
+            self._load_watermarks()
+        except Exception as e:
+            logging.error(f"Could not start live polling for session {self.session_key}: {e}")
+            self.stop_event.set()
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                count = self.poll_once()
+            except Exception as e:
+                logging.warning(f"Live poll for session {self.session_key} failed: {e}")
+                count = 0
+            if verbose and count:
+                print(f"  -> {'Stored' if self.leading else 'Read'} {count} new rows (watermarks: {self.watermarks})")
+            self.stop_event.wait(max(0.0, self.interval - (time.monotonic() - started)))
+        if self.leading:
+            # Another process can take over now instead of once the lease lapses
+            release_lease(self.db, self.session_key, self.owner)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=f'live-{self.session_key}', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def stopped(self):
+        return self.stop_event.is_set() or self.thread is None or not self.thread.is_alive()
+
+
+class LiveHub:
+    """One poller per live session for the whole process, shared by every subscriber and stopped with the last."""
+
+    def __init__(self, db, api_factory=OpenF1Client, interval=LIVE_POLL_INTERVAL):
+        self.db = db
+        self.api_factory = api_factory
+        self.interval = interval
+        self.pollers = {}
+        self.lock = threading.Lock()
+        self.api = None
+
+    def resolve_session(self, session_key='latest'):
+        """The session document for a key or 'latest', from Mongo when stored and OpenF1 otherwise; None if unknown."""
+        if session_key != 'latest':
+            session_key = int(session_key)
+            session = self.db.sessions.find_one({'_id': session_key})
+            if session:
+                return session
+        with self.lock:
+            self.api = self.api or self.api_factory()
+        return fetch_session(self.api, session_key)
+
+    def subscribe(self, session_key):
+        """Returns (poller, subscriber queue), starting the session's poller if none is running."""
+        with self.lock:
+            self.api = self.api or self.api_factory()
+            poller = self.pollers.get(session_key)
+            if poller is None or poller.stopped():
+                poller = LivePoller(self.db, self.api, session_key, self.interval)
+                self.pollers[session_key] = poller
+                subscriber = poller.broadcaster.subscribe()
+                poller.start()
+            else:
+                subscriber = poller.broadcaster.subscribe()
+        return poller, subscriber
+
+    def unsubscribe(self, poller, subscriber):
+        with self.lock:
+            if not poller.broadcaster.unsubscribe(subscriber):
+                poller.stop()
+
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Ingest the live streams of a session as they happen.")
+    parser.add_argument('--session-key', default='latest', help="Session to follow. Defaults to the latest one.")
+    parser.add_argument('--interval', type=float, default=LIVE_POLL_INTERVAL, help="Seconds between polls.")
+    parser.add_argument('--api-base', default=OPENF1_API_BASE)
+    args = parser.parse_args()
+
+    MONGO_URI = os.environ.get('MONGO_URI')
+    if not MONGO_URI:
+        raise Exception("MONGO_URI environment variable not set!")
+    client = MongoClient(MONGO_URI)
+    api = OpenF1Client(base_url=args.api_base)
+    session = fetch_session(api, args.session_key)
+    if not session:
+        raise SystemExit(f"No session found for {args.session_key}.")
+    poller = LivePoller(client['f1_data'], api, session['session_key'], args.interval)
+    print(f"Following session {session['session_key']} ({session.get('session_name')}) every {args.interval}s. Ctrl+C to stop.")
+    try:
+        poller.run(verbose=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.close()
+        client.close()
@@ -0,0 +1,253 @@
+# backend/metrics.py
+"""
+Request and MongoDB command instrumentation, exposed in Prometheus text format.
+
+Request timing hooks record each request's duration under its route rule, for example
+`/api/sessions/<int:session_key>/details`, rather than the concrete path. A pymongo
+`CommandListener` records every command's duration and the number of documents it returned,
+attributed to the route that issued it. The route is kept in a context variable, so queries
+run on the pool in concurrency.py are counted against the request that started them.
+Commands issued outside a request (the catalog, the live poller) are counted under
+`background`.
+
+A command slower than SLOW_QUERY_MS is logged with its pipeline or filter. The log also
+carries a summary of the winning plan from `explain`. The explain runs on a background
+thread, so the request that was slow is not delayed further.
+
+The histograms belong to one process. Under gunicorn, each worker reports its own.
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import json_util
+from flask import Response, g, request
+from pymongo import monitoring
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'off', 'no')
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'true').lower() not in ('0', 'false', 'off', 'no')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DOCUMENT_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+EXPLAINABLE_COMMANDS = {'aggregate', 'find', 'count', 'distinct'}
+SLOW_QUERY_LOG_CHARS = 2000
+
+current_route = contextvars.ContextVar('current_route', default='background')
+_explaining = contextvars.ContextVar('explaining', default=False)
+
+
+class Histogram:
+    """A labelled Prometheus histogram with fixed buckets."""
+
+    def __init__(self, name, description, label_names, buckets):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}  # label values -> [count per bucket..., overflow count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        for labels, values in sorted(series.items()):
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def returned_documents(reply):
+    """How many documents a command reply carries: a cursor batch, a count or distinct values."""
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+    if 'values' in reply:
+        return len(reply['values'])
+    return reply.get('n', 0)
+
+
+def explain_summary(explain):
+    """Winning plan stages and the indexes they use, e.g. 'IXSCAN(session_lap_number), FETCH'."""
+    stages = []
+
+    def walk(node, in_winning_plan=False):
+        if isinstance(node, dict):
+            if in_winning_plan and 'stage' in node:
+                stages.append(f"{node['stage']}({node['indexName']})" if 'indexName' in node else node['stage'])
+            for key, value in node.items():
+                if key != 'rejectedPlans':
+                    walk(value, in_winning_plan or key == 'winningPlan')
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, in_winning_plan)
+
+    walk(explain)
+    return ', '.join(stages) or 'no plan'
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Records each command's duration and returned documents under the issuing route; logs slow ones."""
+
+    def __init__(self, registry, slow_query_ms=SLOW_QUERY_MS, explain=SLOW_QUERY_EXPLAIN):
+        self.registry = registry
+        self.slow_query_ms = slow_query_ms
+        self.explain = explain
+        self.client = None
+        self.pending = {}
+        self._explainer = None
+        self.explainer_pid = None
+        self.lock = threading.Lock()
+
+    @property
+    def explainer(self):
+        """This process's explain thread, created on first use: one made before a fork has no thread in the child."""
+        pid = os.getpid()
+        if self._explainer is None or self.explainer_pid != pid:
+            with self.lock:
+                if self._explainer is None or self.explainer_pid != pid:
+                    self._explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='explain')
+                    self.explainer_pid = pid
+        return self._explainer
+
+    def started(self, event):
+        if _explaining.get():
+            return
+        command = event.command
+        collection = command.get(event.command_name)
+        if event.command_name == 'getMore':
+            collection = command.get('collection')
+        self.pending[event.request_id] = (
+            current_route.get(), collection if isinstance(collection, str) else '-',
+            command if event.command_name in EXPLAINABLE_COMMANDS else None
+        )
+
+    def succeeded(self, event):
+        self._finish(event, returned_documents(event.reply))
+
+    def failed(self, event):
+        self._finish(event, 0)
+
+    def _finish(self, event, documents):
+        pending = self.pending.pop(event.request_id, None)
+        if pending is None:
+            return
+        route, collection, command = pending
+        seconds = event.duration_micros / 1e6
+        labels = (route, event.command_name, collection)
+        self.registry.command_seconds.observe(labels, seconds)
+        self.registry.command_documents.observe(labels, documents)
+        if seconds * 1000 >= self.slow_query_ms:
+            self.explainer.submit(self._log_slow, event.database_name, route, event.command_name,
+                                  collection, command, seconds, documents)
+
+    def _log_slow(self, database_name, route, command_name, collection, command, seconds, documents):
+        spec = None
+        plan = None
+        if command is not None:
+            spec = {k: v for k, v in command.items()
+                    if not k.startswith('$') and k not in ('lsid', 'txnNumber', 'readConcern', 'cursor')}
+            if self.explain and self.client is not None:
+                _explaining.set(True)
+                try:
+                    explain_command = {**spec, 'cursor': {}} if command_name == 'aggregate' else spec
+                    plan = explain_summary(self.client[database_name].command(
+                        'explain', explain_command, verbosity='queryPlanner'))
+                except Exception as e:
+                    plan = f"explain failed: {e}"
+        text = json_util.dumps(spec)[:SLOW_QUERY_LOG_CHARS] if spec is not None else '-'
+        logging.warning(f"Slow query ({seconds * 1000:.1f} ms, {documents} documents) from {route}: "
+                        f"{command_name} on {collection}: {text}" + (f"; plan: {plan}" if plan else ""))
+
+
+class Metrics:
+    """Per-process request and query metrics for one Flask app and its MongoClient."""
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self.request_seconds = Histogram(
+            'f1_api_request_duration_seconds', "API request duration by route rule.",
+            ('route', 'method', 'status'), LATENCY_BUCKETS)
+        self.command_seconds = Histogram(
+            'f1_mongo_command_duration_seconds', "MongoDB command duration by issuing route.",
+            ('route', 'command', 'collection'), LATENCY_BUCKETS)
+        self.command_documents = Histogram(
+            'f1_mongo_command_documents', "Documents returned per MongoDB command by issuing route.",
+            ('route', 'command', 'collection'), DOCUMENT_BUCKETS)
+        self.command_listener = CommandMetrics(self)
+
+    def event_listeners(self):
+        """Listeners to pass to MongoClient(event_listeners=...)."""
+        return [self.command_listener] if self.enabled else []
+
+    def attach(self, client):
+        """Gives the listener a client to run slow-query explains with."""
+        self.command_listener.client = client
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def start_timer():
+            rule = request.url_rule.rule if request.url_rule else 'unmatched'
+            g.metrics_started = time.perf_counter()
+            g.metrics_route_token = current_route.set(rule)
+
+        @app.after_request
+        def record_request(response):
+            started = g.pop('metrics_started', None)
+            if started is None:
+                return response
+            labels = (request.url_rule.rule if request.url_rule else 'unmatched', request.method,
+                      str(response.status_code))
+            if not response.is_streamed:
+                self.request_seconds.observe(labels, time.perf_counter() - started)
+                return response
+            # A streamed body is written after this hook: time it, and keep its route, until the body is done
+            token = g.pop('metrics_route_token', None)
+
+            def finish():
+                self.request_seconds.observe(labels, time.perf_counter() - started)
+                if token is not None:
+                    current_route.reset(token)
+            response.call_on_close(finish)
+            return response
+
+        @app.teardown_request
+        def reset_route(exception=None):
+            token = g.pop('metrics_route_token', None)
+            if token is not None:
+                current_route.reset(token)
+
+    def render(self):
+        lines = []
+        for histogram in (self.request_seconds, self.command_seconds, self.command_documents):
+            lines.extend(histogram.render())
+        return '\n'.join(lines) + '\n'
+
+    def response(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
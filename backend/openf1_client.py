@@ -0,0 +1,173 @@
+# backend/openf1_client.py
+import os
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from raw_cache import CacheMiss
+
+# --- Configuration ---
+OPENF1_API_BASE = os.environ.get('OPENF1_API_BASE', 'https://api.openf1.org/v1')
+OPENF1_RATE_LIMIT = float(os.environ.get('OPENF1_RATE_LIMIT', '3'))  # requests per second, 0 disables
+OPENF1_MAX_RETRIES = int(os.environ.get('OPENF1_MAX_RETRIES', '5'))
+OPENF1_TIMEOUT = float(os.environ.get('OPENF1_TIMEOUT', '60'))
+OPENF1_STREAM_CHUNK_SIZE = 64 * 1024
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` calls per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available. A rate of 0 means unlimited."""
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def _raise_for_cached_status(cache, entry, revalidated=False):
+    """Replays a cached 404, which OpenF1 answers when a query has no results."""
+    if entry.get('status', 200) == 404:
+        cache.hit(entry, revalidated)
+        response = requests.Response()
+        response.status_code = 404
+        raise requests.exceptions.HTTPError("404 Not Found (cached)", response=response)
+
+
+class OpenF1Client:
+    """
+    Pooled, rate-limited HTTP client for the OpenF1 API that retries 429/5xx responses with backoff.
+    With a `cache` (see raw_cache.py), responses are stored on disk and served or revalidated from it.
+    """
+
+    def __init__(self, base_url=OPENF1_API_BASE, rate_limit=OPENF1_RATE_LIMIT, pool_size=10,
+                 max_retries=OPENF1_MAX_RETRIES, backoff=0.5, timeout=OPENF1_TIMEOUT, cache=None):
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache
+        self.limiter = TokenBucket(rate_limit)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.stats = {'requests': 0, 'retries': 0, 'bytes': 0}
+        self.stats_lock = threading.Lock()
+
+    def _count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def _retry_delay(self, attempt, response=None):
+        """Honours Retry-After when the server sends it, otherwise exponential backoff with jitter."""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        return self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+
+    def _request(self, endpoint, params, stream=False, headers=None):
+        """Sends a GET, retrying connection errors and 429/5xx statuses. Raises on non-retryable failures."""
+        url = f"{self.base_url}/{endpoint}"
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            self._count('requests')
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout, stream=stream, headers=headers)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                self._count('retries')
+                time.sleep(self._retry_delay(attempt))
+                continue
+
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                response.close()
+                self._count('retries')
+                time.sleep(self._retry_delay(attempt, response))
+                continue
+
+            if not response.ok:
+                response.close()
+            response.raise_for_status()
+            return response
+
+    def get(self, endpoint, params=None, max_age=0):
+        """Fetches an endpoint and returns the decoded JSON body. Raises on non-retryable failures."""
+        if self.cache is not None:
+            return json.loads(b''.join(self.stream(endpoint, params, max_age=max_age)))
+        response = self._request(endpoint, params)
+        self._count('bytes', len(response.content))
+        return response.json()
+
+    def stream(self, endpoint, params=None, chunk_size=OPENF1_STREAM_CHUNK_SIZE, max_age=0):
+        """
+        Yields an endpoint's raw body in chunks as it arrives. The body is only read as fast as
+        the caller consumes it, so a slow consumer slows the transfer instead of buffering it.
+        A cached body younger than `max_age` seconds is served without a request.
+        """
+        cache = self.cache
+        entry = cache.lookup(endpoint, params) if cache is not None else None
+        if entry is not None and (cache.offline or time.time() - entry['fetched_at'] <= max_age):
+            _raise_for_cached_status(cache, entry)
+            yield from cache.read(entry)
+            return
+        if cache is not None and cache.offline:
+            cache.miss()
+            raise CacheMiss(f"{endpoint} {params} is not cached")
+
+        try:
+            response = self._request(endpoint, params, stream=True,
+                                     headers=cache.validators(entry) if cache is not None else None)
+        except requests.exceptions.HTTPError as e:
+            if cache is not None and e.response is not None and e.response.status_code == 404:
+                # Cached too, so offline runs see the same "no results" answer
+                cache.miss()
+                with cache.writer(endpoint, params, status=404) as writer:
+                    writer.write(b'[]')
+            raise
+        with response:
+            if response.status_code == 304 and entry is not None:
+                cache.touch(endpoint, params, entry)
+                _raise_for_cached_status(cache, entry, revalidated=True)
+                yield from cache.read(entry, revalidated=True)
+                return
+            if cache is None:
+                for chunk in response.iter_content(chunk_size):
+                    self._count('bytes', len(chunk))
+                    yield chunk
+                return
+            cache.miss()
+            with cache.writer(endpoint, params, response.headers) as writer:
+                for chunk in response.iter_content(chunk_size):
+                    self._count('bytes', len(chunk))
+                    writer.write(chunk)
+                    yield chunk
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,30 @@
+# backend/pagination.py
+"""
+Keyset cursors and columnar output for list endpoints.
+
+A cursor is the sort key of the last row a client received, encoded as opaque URL-safe
+base64 so clients pass it back unchanged rather than building it themselves.
+"""
+import base64
+
+import orjson
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(orjson.dumps(list(key))).rstrip(b'=').decode()
+
+
+def decode_cursor(token, length):
+    """Decodes a cursor into its sort key; raises ValueError if it is not one this API issued."""
+    try:
+        key = orjson.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(key, list) or len(key) != length:
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def to_columns(rows, fields):
+    """Turns a list of row documents into one list per field."""
+    return {field: [row.get(field) for row in rows] for field in fields}
@@ -0,0 +1,378 @@
+# backend/queries.py
+"""
+Query shapes issued by the API routes.
+
+Routes build their Mongo queries from these helpers so that `indexes.py --verify` can explain
+exactly the same shapes against the live database.
+"""
+from schema import to_datetime
+
+DRIVER_LOOKUP = {'$lookup': {'from': 'drivers', 'localField': 'driver_number', 'foreignField': '_id', 'as': 'driver_info'}}
+POSITION_PROJECTION = {
+    '_id': 0, 'position': '$position', 'driver_number': '$driver_number',
+    'full_name': '$driver_info.full_name', 'team_name': '$driver_info.team_name',
+    'team_color': '$driver_info.team_colour', 'laps_completed': '$number_of_laps',
+    'headshot_url': '$driver_info.headshot_url', 'dnf': '$dnf'
+}
+
+
+def split_driver_lookup(pipeline):
+    """
+    Splits a pipeline at its `drivers` $lookup: (the stages before it, the lookup's local field,
+    the stages after it). `join_drivers` applies the latter to drivers the caller already has.
+    """
+    index = next(i for i, stage in enumerate(pipeline) if stage.get('$lookup', {}).get('from') == 'drivers')
+    return pipeline[:index], pipeline[index]['$lookup']['localField'], pipeline[index + 1:]
+
+
+def _project(document, projection):
+    """A `$project` of plain inclusions and `$field.path` references, fields in the order MongoDB emits them."""
+    def resolve(path):
+        value = document
+        for part in path.split('.'):
+            if not isinstance(value, dict) or part not in value:
+                return None, False
+            value = value[part]
+        return value, True
+
+    projected = {}
+    if projection.get('_id', 1) == 1 and '_id' in document:
+        projected['_id'] = document['_id']
+    projected.update({field: value for field, value in document.items() if field != '_id' and projection.get(field) == 1})
+    for field, spec in projection.items():
+        if isinstance(spec, str):
+            value, found = resolve(spec[1:])
+            if found:
+                projected[field] = value
+    return projected
+
+
+def join_drivers(rows, local_field, drivers, stages):
+    """
+    The rows a `split_driver_lookup` head returned, joined to `drivers` ({number: driver}) as its
+    $lookup would have, then run through the remaining $unwind, $project and $limit stages.
+    """
+    joined = [{**row, 'driver_info': drivers[row.get(local_field)]} for row in rows if row.get(local_field) in drivers]
+    for stage in stages:
+        if '$project' in stage:
+            joined = [_project(row, stage['$project']) for row in joined]
+        elif '$limit' in stage:
+            joined = joined[:stage['$limit']]
+        elif '$unwind' not in stage:
+            raise ValueError(f"Cannot apply {next(iter(stage))} after a driver join")
+    return joined
+
+
+def comparison_laps_pipeline(pairs):
+    """Laps for every (session_key, driver_number) pair in one query; the caller splits them by pair."""
+    return [
+        {'$match': {
+            '$or': [{'session_key': session_key, 'driver_number': driver_number} for session_key, driver_number in pairs],
+            'lap_duration': {'$ne': None}
+        }},
+        {'$sort': {'session_key': 1, 'driver_number': 1, 'lap_number': 1}},
+        {'$project': {
+            '_id': 0,
+            'session_key': 1,
+            'driver_number': 1,
+            'lap_number': 1,
+            'lap_duration': 1,
+            # OpenF1 names the sector times duration_sector_N
+            'sector_1_time': {'$ifNull': ['$sector_1_time', '$duration_sector_1']},
+            'sector_2_time': {'$ifNull': ['$sector_2_time', '$duration_sector_2']},
+            'sector_3_time': {'$ifNull': ['$sector_3_time', '$duration_sector_3']},
+            'tyre_compound': 1
+        }}
+    ]
+
+def career_stats_pipeline(driver_ids):
+    """Race wins, podiums and qualifying poles for all the drivers in one pass over their top-three results."""
+    return [
+        {'$match': {
+            'driver_number': {'$in': driver_ids}, 'position': {'$gte': 1, '$lte': 3},
+            'session_name': {'$in': ['Race', 'Qualifying']}
+        }},
+        {'$group': {
+            '_id': '$driver_number',
+            'wins': {'$sum': {'$cond': [{'$and': [{'$eq': ['$session_name', 'Race']}, {'$eq': ['$position', 1]}]}, 1, 0]}},
+            'podiums': {'$sum': {'$cond': [{'$eq': ['$session_name', 'Race']}, 1, 0]}},
+            'poles': {'$sum': {'$cond': [{'$and': [{'$eq': ['$session_name', 'Qualifying']}, {'$eq': ['$position', 1]}]}, 1, 0]}},
+        }},
+        {'$project': {'_id': 0, 'driver_number': '$_id', 'wins': 1, 'podiums': 1, 'poles': 1}}
+    ]
+
+def season_analysis_pipeline(driver_ids, year):
+    return [
+        {'$match': {'year': year, 'driver_number': {'$in': driver_ids}, 'position': {'$ne': None}}},
+        {'$group': {
+            '_id': '$driver_number',
+            'wins': {'$sum': {'$cond': [{'$eq': ['$position', 1]}, 1, 0]}},
+            'podiums': {'$sum': {'$cond': [{'$lte': ['$position', 3]}, 1, 0]}}
+        }},
+        {'$project': {'_id': 0, 'driver_number': '$_id', 'wins': 1, 'podiums': 1}}
+    ]
+
+def track_analysis_pipeline(driver_ids, circuit_key, conditions=None):
+    """Each driver's best lap at a circuit; `conditions` are extra lap predicates (see conditions.condition_filter)."""
+    return [
+        {'$match': {'circuit_key': circuit_key, 'driver_number': {'$in': driver_ids}, 'lap_duration': {'$ne': None},
+                    **(conditions or {})}},
+        {'$sort': {'lap_duration': 1}},
+        {'$group': {
+            '_id': '$driver_number',
+            'best_lap_time': {'$first': {'fastest_lap': '$lap_duration', 'year': '$year'}}
+        }},
+        {'$project': {'_id': 0, 'driver_number': '$_id', 'best_lap_time': 1}}
+    ]
+
+def champion_pipeline(year):
+    return [
+        {'$match': {'year': year, 'session_name': 'Race', 'points': {'$ne': None}}},
+        {'$group': {'_id': '$driver_number', 'total_points': {'$sum': '$points'}}},
+        {'$sort': {'total_points': -1}},
+        {'$limit': 1},
+        {'$lookup': {'from': 'drivers', 'localField': '_id', 'foreignField': '_id', 'as': 'driver_info'}},
+        {'$unwind': '$driver_info'}
+    ]
+
+def most_wins_pipeline(year):
+    return [
+        {'$match': {'year': year, 'session_name': 'Race', 'position': 1}},
+        {'$group': {'_id': '$driver_number', 'wins': {'$sum': 1}}},
+        {'$sort': {'wins': -1}},
+        {'$limit': 1},
+        {'$lookup': {'from': 'drivers', 'localField': '_id', 'foreignField': '_id', 'as': 'driver_info'}},
+        {'$unwind': '$driver_info'}
+    ]
+
+def season_fastest_lap_pipeline(year):
+    return [
+        {'$match': {'year': year, 'lap_duration': {'$ne': None}}},
+        {'$sort': {'lap_duration': 1}},
+        {'$limit': 1},
+        {'$lookup': {'from': 'sessions', 'localField': 'session_key', 'foreignField': '_id', 'as': 'session_info'}},
+        {'$unwind': '$session_info'},
+        {'$lookup': {'from': 'drivers', 'localField': 'driver_number', 'foreignField': '_id', 'as': 'driver_info'}},
+        {'$unwind': '$driver_info'},
+        {'$lookup': {'from': 'meetings', 'localField': 'meeting_key', 'foreignField': '_id', 'as': 'meeting_info'}},
+        {'$unwind': '$meeting_info'}
+    ]
+
+def meetings_pipeline():
+    return [
+        {'$sort': {'date_start': -1}},
+        {'$group': {
+            '_id': {'year': '$year', 'meeting_name': '$meeting_name'},
+            'doc': {'$first': '$$ROOT'}
+        }},
+        {'$replaceRoot': {'newRoot': '$doc'}},
+        {'$sort': {'year': -1, 'date_start': -1}}
+    ]
+
+def race_winner_pipeline(session_key):
+    return [
+        {'$match': {'session_key': session_key, 'position': 1}}, {'$limit': 1},
+        DRIVER_LOOKUP,
+        {'$unwind': '$driver_info'},
+        {'$project': POSITION_PROJECTION}
+    ]
+
+def session_positions_pipeline(session_key):
+    return [
+        {'$match': {'session_key': session_key}},
+        {'$addFields': {'is_finisher': {'$cond': {'if': {'$eq': ["$dnf", False]}, 'then': 1, 'else': 2}}}},
+        {'$sort': {'is_finisher': 1, 'position': 1}},
+        DRIVER_LOOKUP,
+        {'$unwind': '$driver_info'},
+        {'$project': POSITION_PROJECTION}
+    ]
+
+def session_fastest_laps_pipeline(session_key):
+    return [
+        {'$match': {'session_key': session_key, 'lap_duration': {'$ne': None}}},
+        {'$sort': {'lap_duration': 1}},
+        {'$group': {
+            '_id': '$driver_number', 'fastest_lap_duration': {'$first': '$lap_duration'},
+            'lap_number': {'$first': '$lap_number'}
+        }},
+        {'$sort': {'fastest_lap_duration': 1}}, {'$limit': 10},
+        {'$lookup': {'from': 'drivers', 'localField': '_id', 'foreignField': '_id', 'as': 'driver_info'}},
+        {'$unwind': '$driver_info'},
+        {'$project': {
+            '_id': 0, 'driver_number': '$_id', 'full_name': '$driver_info.full_name',
+            'team_name': '$driver_info.team_name', 'team_color': '$driver_info.team_colour',
+            'lap_duration': '$fastest_lap_duration', 'lap_number': '$lap_number'
+        }}
+    ]
+
+LAP_FIELDS = ['driver_number', 'lap_number', 'lap_duration', 'stint', 'is_pit_out_lap', 'tyre_compound',
+              'track_status', 'rainfall', 'track_temperature', 'air_temperature']
+LAP_JOIN_STAGES = [
+    DRIVER_LOOKUP,
+    {'$unwind': '$driver_info'},
+    {'$project': {
+        '_id': 1, 'session_key': 1, 'driver_number': 1, 'lap_number': 1, 'lap_duration': 1,
+        'stint': 1, 'is_pit_out_lap': 1, 'tyre_compound': 1,
+        'track_status': 1, 'rainfall': 1, 'track_temperature': 1, 'air_temperature': 1,
+        'full_name': '$driver_info.full_name', 'team_name': '$driver_info.team_name',
+        'team_color': '$driver_info.team_colour'
+    }}
+]
+
+
+def laps_pipeline(session_key, fastest=False, join=True, conditions=None):
+    """
+    Laps of a session joined to driver info; `fastest` keeps each driver's best lap, top ten only.
+    With `join=False` only LAP_FIELDS are returned and driver info is left to the caller.
+    `conditions` are extra lap predicates, such as a track status (see conditions.condition_filter).
+    """
+    match_stage = {'$match': {'session_key': session_key, 'lap_duration': {'$ne': None}, **(conditions or {})}}
+    output_stages = LAP_JOIN_STAGES if join else [{'$project': {'_id': 0, **{field: 1 for field in LAP_FIELDS}}}]
+    if fastest:
+        # Reduce to one lap per driver before joining, instead of joining every lap
+        return [
+            match_stage,
+            {'$sort': {'lap_duration': 1}},
+            {'$group': {'_id': '$driver_number', 'fastest_lap_doc': {'$first': '$$ROOT'}}},
+            {'$replaceRoot': {'newRoot': '$fastest_lap_doc'}},
+            {'$sort': {'lap_duration': 1}},
+            *output_stages,
+            {'$limit': 10}
+        ]
+    # Sorting straight after the $match lets the index deliver laps in order
+    return [match_stage, {'$sort': {'lap_number': 1, 'lap_duration': 1}}, *output_stages]
+
+
+def laps_page_pipeline(session_key, after=None, limit=None, join=True, conditions=None):
+    """
+    One page of a session's laps in (lap_number, driver_number) order, starting after the
+    `after` key. Keyset rather than skip, so every page is an index range scan.
+    """
+    match = {'session_key': session_key, 'lap_duration': {'$ne': None}, **(conditions or {})}
+    if after:
+        lap_number, driver_number = after
+        match['lap_number'] = {'$gte': lap_number}
+        match['$or'] = [{'lap_number': {'$gt': lap_number}}, {'driver_number': {'$gt': driver_number}}]
+    stages = [{'$match': match}, {'$sort': {'lap_number': 1, 'driver_number': 1}}]
+    if limit:
+        stages.append({'$limit': limit})
+    return stages + (LAP_JOIN_STAGES if join else [{'$project': {'_id': 0, **{field: 1 for field in LAP_FIELDS}}}])
+
+STINT_LAP_FIELDS = ['driver_number', 'lap_number', 'lap_duration', 'is_pit_out_lap']
+
+
+def stint_laps_pipeline(session_key):
+    """Every lap of a session with the fields the stint analysis reads, in (driver, lap) order off the index."""
+    return [
+        {'$match': {'session_key': session_key}},
+        {'$sort': {'driver_number': 1, 'lap_number': 1}},
+        {'$project': {'_id': 0, **{field: 1 for field in STINT_LAP_FIELDS}}}
+    ]
+
+
+def stints_query(session_key):
+    return {'filter': {'session_key': session_key},
+            'projection': {'_id': 0, 'driver_number': 1, 'stint_number': 1, 'compound': 1,
+                           'lap_start': 1, 'lap_end': 1, 'tyre_age_at_start': 1}}
+
+
+def pit_laps_query(session_key):
+    return {'filter': {'session_key': session_key}, 'projection': {'_id': 0, 'driver_number': 1, 'lap_number': 1}}
+
+def race_wins_filter(driver_number):
+    return {'driver_number': driver_number, 'position': 1, 'session_name': 'Race'}
+
+def championships_pipeline(driver_number):
+    return [
+        {'$match': {'session_name': 'Race', 'points': {'$ne': None}}},
+        {'$group': {
+            '_id': {'year': '$year', 'driver_number': '$driver_number'},
+            'total_points': {'$sum': '$points'}
+        }},
+        {'$sort': {'_id.year': 1, 'total_points': -1}},
+        {'$group': {
+            '_id': '$_id.year',
+            'champion_driver': {'$first': '$_id.driver_number'}
+        }},
+        {'$match': {'champion_driver': driver_number}},
+        {'$count': 'count'}
+    ]
+
+def compare_fastest_laps_pipeline(session_key, driver_ids):
+    return [
+        {'$match': {'session_key': session_key, 'driver_number': {'$in': driver_ids}, 'lap_duration': {'$ne': None}}},
+        {'$sort': {'lap_duration': 1}},
+        {'$group': {'_id': '$driver_number', 'fastest_lap': {'$first': '$lap_duration'}}}
+    ]
+
+def compare_pit_stops_pipeline(session_key, driver_ids):
+    return [
+        {'$match': {'session_key': session_key, 'driver_number': {'$in': driver_ids}}},
+        {'$group': {'_id': '$driver_number', 'pit_stop_count': {'$sum': 1}}}
+    ]
+
+
+def telemetry_pipeline(session_key, fields, drivers=None, start=None, end=None):
+    """
+    A session's position or interval samples, in (driver_number, date) order for per-driver downsampling.
+    The collections are time-series with the keys under `meta` (see schema.py); `start` and `end` are ISO timestamps.
+    """
+    match = {'meta.session_key': session_key}
+    if drivers:
+        match['meta.driver_number'] = {'$in': drivers}
+    if start or end:
+        match['date'] = {**({'$gte': to_datetime(start)} if start else {}), **({'$lte': to_datetime(end)} if end else {})}
+    return [
+        {'$match': match},
+        {'$sort': {'meta.driver_number': 1, 'date': 1}},
+        {'$project': {'_id': 0, 'driver_number': '$meta.driver_number', 'date': 1, **{field: 1 for field in fields}}}
+    ]
+
+
+def route_queries(sample):
+    """
+    Every query the routes issue, instantiated with sample keys from the database.
+    Each entry is (name, collection, operation, spec) where operation is one of
+    'aggregate', 'find', 'count' or 'distinct'.
+    """
+    session_key, driver, year = sample['session_key'], sample['driver_number'], sample['year']
+    drivers = [driver]
+    return [
+        ('comparison_laps', 'laps', 'aggregate', comparison_laps_pipeline([(session_key, driver)])),
+        ('analysis_career', 'session_results', 'aggregate', career_stats_pipeline(drivers)),
+        ('analysis_season', 'session_results', 'aggregate', season_analysis_pipeline(drivers, year)),
+        ('analysis_track', 'laps', 'aggregate', track_analysis_pipeline(drivers, sample['circuit_key'])),
+        ('records', 'season_records', 'find', {'filter': {'_id': year}}),
+        ('records_champion', 'session_results', 'aggregate', champion_pipeline(year)),
+        ('records_most_wins', 'session_results', 'aggregate', most_wins_pipeline(year)),
+        ('records_fastest_lap', 'laps', 'aggregate', season_fastest_lap_pipeline(year)),
+        ('meetings', 'meetings', 'aggregate', meetings_pipeline()),
+        ('meeting_sessions', 'sessions', 'find', {'filter': {'meeting_key': sample['meeting_key']}, 'sort': {'date_start': -1}}),
+        ('meeting_winner', 'session_results', 'aggregate', race_winner_pipeline(session_key)),
+        ('session_positions', 'session_results', 'aggregate', session_positions_pipeline(session_key)),
+        ('session_fastest_laps', 'laps', 'aggregate', session_fastest_laps_pipeline(session_key)),
+        ('laps', 'laps', 'aggregate', laps_pipeline(session_key)),
+        ('laps_fastest', 'laps', 'aggregate', laps_pipeline(session_key, fastest=True)),
+        ('laps_page', 'laps', 'aggregate', laps_page_pipeline(session_key, after=(10, driver), limit=500)),
+        ('laps_columnar', 'laps', 'aggregate', laps_pipeline(session_key, join=False)),
+        ('laps_green', 'laps', 'aggregate', laps_pipeline(session_key, conditions={'track_status': 'GREEN'})),
+        ('analysis_track_green', 'laps', 'aggregate',
+         track_analysis_pipeline(drivers, sample['circuit_key'], {'track_status': 'GREEN', 'rainfall': False})),
+        ('positions_timeline', 'position', 'aggregate', telemetry_pipeline(session_key, ['position'])),
+        ('intervals', 'intervals', 'aggregate', telemetry_pipeline(session_key, ['gap_to_leader', 'interval'], drivers)),
+        ('drivers_all', 'drivers', 'find', {'filter': {}, 'sort': {'full_name': 1}}),
+        ('session_driver_numbers', 'session_results', 'distinct', {'key': 'driver_number', 'query': {'session_key': session_key}}),
+        ('session_lap_driver_numbers', 'laps', 'distinct', {'key': 'driver_number', 'query': {'session_key': session_key}}),
+        ('session_drivers', 'drivers', 'find', {'filter': {'_id': {'$in': drivers}}, 'sort': {'team_name': 1}}),
+        ('season_drivers', 'session_results', 'distinct', {'key': 'driver_number', 'query': {'year': year}}),
+        ('driver_career', 'driver_career_stats', 'find', {'filter': {'_id': driver}}),
+        ('driver_wins', 'session_results', 'count', {'query': race_wins_filter(driver)}),
+        ('driver_championships', 'session_results', 'aggregate', championships_pipeline(driver)),
+        ('compare_positions', 'session_results', 'find', {'filter': {'session_key': session_key, 'driver_number': {'$in': drivers}}}),
+        ('compare_fastest_laps', 'laps', 'aggregate', compare_fastest_laps_pipeline(session_key, drivers)),
+        ('compare_pit_stops', 'pit_stops', 'aggregate', compare_pit_stops_pipeline(session_key, drivers)),
+        ('race_trace', 'race_traces', 'find', {'filter': {'_id': session_key}}),
+        ('stint_laps', 'laps', 'aggregate', stint_laps_pipeline(session_key)),
+        ('stints', 'stints', 'find', stints_query(session_key)),
+        ('stint_pit_laps', 'pit_stops', 'find', pit_laps_query(session_key)),
+    ]
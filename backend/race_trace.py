@@ -0,0 +1,188 @@
+# backend/race_trace.py
+"""
+Precomputed race traces: running order and gaps of every race, built after ingestion.
+
+    race_traces           one document per race or sprint session
+
+For each race the session's laps become a (drivers x laps) matrix of the time each driver
+completed each lap, in seconds from the start. A lap's completion time is taken from the
+timestamps where OpenF1 has them (the lap's `date_start` plus its duration, or the next lap's
+`date_start`), so a lap with a missing `lap_duration`, such as many pit-out laps and the
+first lap, does not break the sum. Between timestamps, durations are accumulated from the
+last known completion time. A lap that cannot be placed either way, and every lap after it
+until the next timestamp, is null.
+
+From that matrix the build derives, per driver and lap:
+
+* `position`: the running order when the lap was completed
+* `gap_to_leader` and `gap_to_ahead`: seconds behind the leader and the car in front
+* `race_trace`: seconds ahead (positive) or behind the winner's average pace
+
+Pit-in and pit-out laps are listed per driver. Cumulative times include the time lost in
+the pits, which is what moves the running order. The API serves the stored document as is
+(`/api/sessions/<key>/race-trace`). Run this module directly to rebuild every race, or pass
+`--session` or `--year`.
+"""
+import os
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+from pymongo import ReplaceOne
+
+from generation import bump_generation
+from schema import to_datetime
+
+RACE_SESSION_TYPE = 'Race'
+
+
+def _rounded(matrix, digits=3):
+    """Rows of a float matrix as lists, with NaN as None."""
+    return [[None if np.isnan(value) else round(float(value), digits) for value in row] for row in matrix]
+
+
+def _epoch(value):
+    return to_datetime(value).timestamp() if value else np.nan
+
+
+def lap_matrices(laps):
+    """
+    Driver numbers, lap count, laps completed per driver and (drivers, laps) matrices of lap
+    durations and start times in epoch seconds.
+    """
+    drivers = np.array(sorted({lap['driver_number'] for lap in laps}), dtype=np.int64)
+    lap_count = max(lap['lap_number'] for lap in laps)
+    durations = np.full((len(drivers), lap_count), np.nan)
+    starts = np.full((len(drivers), lap_count), np.nan)
+    rows = np.searchsorted(drivers, [lap['driver_number'] for lap in laps])
+    columns = np.array([lap['lap_number'] for lap in laps], dtype=np.int64) - 1
+    durations[rows, columns] = np.array([lap.get('lap_duration') for lap in laps], dtype=float)
+    starts[rows, columns] = [_epoch(lap.get('date_start')) for lap in laps]
+    laps_completed = np.zeros(len(drivers), dtype=np.int64)
+    np.maximum.at(laps_completed, rows, columns + 1)
+    return drivers, lap_count, laps_completed, durations, starts
+
+
+def cumulative_times(durations, starts):
+    """
+    Seconds from the start at which each driver completed each lap. Completion times known
+    from timestamps anchor the sum; durations are accumulated from the latest anchor, and
+    a missing duration leaves the laps after it null until the next anchor.
+    """
+    origin = np.nanmin(starts[:, 0]) if np.isfinite(starts[:, 0]).any() else np.nan
+    anchored = starts + durations - origin
+    # The start of the next lap is the end of this one
+    next_starts = np.concatenate([starts[:, 1:], np.full((len(starts), 1), np.nan)], axis=1) - origin
+    anchored = np.where(np.isnan(anchored), next_starts, anchored)
+
+    laps = np.arange(durations.shape[1])
+    known = ~np.isnan(durations)
+    summed = np.cumsum(np.where(known, durations, 0.0), axis=1)
+    gaps = np.cumsum(~known, axis=1)
+    # Index of the latest anchor at or before each lap, -1 before the first
+    last = np.maximum.accumulate(np.where(np.isnan(anchored), -1, laps), axis=1)
+    rows = np.arange(len(durations))[:, None]
+    at_last = np.maximum(last, 0)
+    from_anchor = anchored[rows, at_last] + summed - summed[rows, at_last]
+    from_anchor[gaps - gaps[rows, at_last] > 0] = np.nan
+    # Before any anchor, only an unbroken run of durations from the start places a lap
+    from_start = np.where(gaps == 0, summed, np.nan)
+    return np.where(last >= 0, from_anchor, from_start)
+
+
+def running_order(cumulative):
+    """Per-lap position, gap to the leader and gap to the car ahead; null where a lap was not completed."""
+    completed = ~np.isnan(cumulative)
+    order = np.argsort(np.where(completed, cumulative, np.inf), axis=0, kind='stable')
+    ordered = np.take_along_axis(cumulative, order, axis=0)
+    position = np.empty_like(order)
+    np.put_along_axis(position, order, np.arange(1, len(cumulative) + 1)[:, None], axis=0)
+    position = np.where(completed, position, 0)
+
+    gap_to_leader = cumulative - ordered[0]
+    ahead = np.concatenate([np.zeros((1, cumulative.shape[1])), np.diff(ordered, axis=0)])
+    gap_to_ahead = np.empty_like(cumulative)
+    np.put_along_axis(gap_to_ahead, order, ahead, axis=0)
+    gap_to_ahead[~completed] = np.nan
+    return position, gap_to_leader, gap_to_ahead
+
+
+def build_trace(session_key, laps, pit_stops):
+    """The race_traces document for one session, or None without laps."""
+    if not laps:
+        return None
+    drivers, lap_count, laps_completed, durations, starts = lap_matrices(laps)
+    cumulative = cumulative_times(durations, starts)
+    position, gap_to_leader, gap_to_ahead = running_order(cumulative)
+
+    # Classified by laps completed, then by the time the last of them was completed
+    final_time = cumulative[np.arange(len(drivers)), laps_completed - 1]
+    classification = np.lexsort((np.nan_to_num(final_time, nan=np.inf), -laps_completed))
+    winner = classification[0]
+    reference_lap = final_time[winner] / laps_completed[winner]
+    race_trace = reference_lap * np.arange(1, lap_count + 1) - cumulative
+
+    pit_laps = {}
+    for stop in pit_stops:
+        if stop.get('lap_number') is not None:
+            pit_laps.setdefault(stop['driver_number'], set()).add(stop['lap_number'])
+    for lap in laps:
+        if lap.get('is_pit_out_lap') and lap['lap_number'] > 1:
+            pit_laps.setdefault(lap['driver_number'], set()).add(lap['lap_number'])
+
+    rows = classification.tolist()
+    return {
+        '_id': session_key, 'session_key': session_key, 'laps': int(lap_count),
+        'drivers': drivers[rows].tolist(),
+        'laps_completed': laps_completed[rows].tolist(),
+        'reference_lap': None if np.isnan(reference_lap) else round(float(reference_lap), 3),
+        'cumulative_time': _rounded(cumulative[rows]),
+        'position': [[int(p) or None for p in row] for row in position[rows]],
+        'gap_to_leader': _rounded(gap_to_leader[rows]),
+        'gap_to_ahead': _rounded(gap_to_ahead[rows]),
+        'race_trace': _rounded(race_trace[rows]),
+        'pit_laps': [sorted(pit_laps.get(int(driver), ())) for driver in drivers[rows]],
+        'built_at': datetime.now(timezone.utc),
+    }
+
+
+def rebuild_race_traces(db, session_keys=None):
+    """Rebuilds the traces of the given sessions that are races (every race when None); returns how many were built."""
+    query = {'session_type': RACE_SESSION_TYPE}
+    if session_keys is not None:
+        query['_id'] = {'$in': list(session_keys)}
+    race_keys = [s['_id'] for s in db.sessions.find(query, {'_id': 1})]
+    updates = []
+    for session_key in race_keys:
+        laps = list(db.laps.find({'session_key': session_key},
+                                 {'_id': 0, 'driver_number': 1, 'lap_number': 1, 'lap_duration': 1,
+                                  'date_start': 1, 'is_pit_out_lap': 1}))
+        pit_stops = list(db.pit_stops.find({'session_key': session_key}, {'_id': 0, 'driver_number': 1, 'lap_number': 1}))
+        trace = build_trace(session_key, laps, pit_stops)
+        if trace:
+            updates.append(ReplaceOne({'_id': session_key}, trace, upsert=True))
+    if updates:
+        db.race_traces.bulk_write(updates, ordered=False)
+    print(f"  -> Rebuilt race traces for {len(updates)} of {len(race_keys)} race sessions.")
+    return len(updates)
+
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Rebuild the precomputed race traces.")
+    parser.add_argument('--session', type=int, action='append', help="Session to rebuild (repeatable).")
+    parser.add_argument('--year', type=int, action='append', help="Season to rebuild (repeatable).")
+    args = parser.parse_args()
+
+    MONGO_URI = os.environ.get('MONGO_URI')
+    if not MONGO_URI:
+        raise Exception("MONGO_URI environment variable not set!")
+    client = MongoClient(MONGO_URI)
+    db = client['f1_data']
+    keys = args.session
+    if args.year:
+        keys = (keys or []) + db.sessions.distinct('_id', {'year': {'$in': args.year}})
+    rebuild_race_traces(db, keys)
+    bump_generation(db)
+    client.close()
@@ -0,0 +1,190 @@
+# backend/raw_cache.py
+"""
+Content-addressed, compressed disk cache of raw OpenF1 responses.
+
+Each request is keyed by its endpoint and sorted query parameters. The key's index entry
+records the response's validators (ETag, Last-Modified), the time it was fetched and the
+SHA-256 of its body. Bodies are stored gzipped under that hash, so identical payloads, such
+as the many empty ones, are stored once:
+
+    <RAW_CACHE_DIR>/index/<key hash>.json
+    <RAW_CACHE_DIR>/objects/<ab>/<body hash>.json.gz
+
+`OpenF1Client` consults the cache on every call (see openf1_client.py):
+
+* An entry younger than the caller's `max_age` is served without a request. The ingestor
+  passes an unlimited age for sessions that ended more than RAW_CACHE_SETTLED_DAYS ago,
+  because OpenF1 no longer changes them.
+* An older entry is revalidated with If-None-Match / If-Modified-Since when the server
+  gave validators. A 304 serves the cached body.
+* In offline mode every call is answered from the cache, and a miss is an error. The
+  database can then be rebuilt without network access:
+
+    python data_ingestor.py --offline
+
+Run this module directly for the cache's size on disk.
+"""
+import os
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+
+RAW_CACHE_DIR = os.environ.get('RAW_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'raw_cache'))
+RAW_CACHE_SETTLED_DAYS = float(os.environ.get('RAW_CACHE_SETTLED_DAYS', '7'))
+READ_SIZE = 64 * 1024
+
+
+class CacheMiss(Exception):
+    """Raised in offline mode for a request the cache cannot answer."""
+
+
+def cache_key(endpoint, params):
+    """Hash of an endpoint and its parameters, given as a dict or a prebuilt query string."""
+    if not isinstance(params, str):
+        params = sorted((str(k), str(v)) for k, v in (params or {}).items())
+    return hashlib.sha256(json.dumps([endpoint, params]).encode()).hexdigest()
+
+
+class RawCache:
+    """The on-disk cache plus this process's hit, revalidation and byte counters."""
+
+    def __init__(self, directory=RAW_CACHE_DIR, offline=False):
+        self.directory = directory
+        self.offline = offline
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'bytes_saved': 0, 'bytes_stored': 0}
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(directory, 'index'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def _index_path(self, key):
+        return os.path.join(self.directory, 'index', f'{key}.json')
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], f'{digest}.json.gz')
+
+    def lookup(self, endpoint, params):
+        """The index entry for a request, or None."""
+        try:
+            with open(self._index_path(cache_key(endpoint, params))) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry if os.path.exists(self._object_path(entry['body'])) else None
+
+    def validators(self, entry):
+        """Conditional request headers for revalidating an entry."""
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def hit(self, entry, revalidated=False):
+        self._count('revalidated' if revalidated else 'hits')
+        self._count('bytes_saved', entry['size'])
+
+    def read(self, entry, revalidated=False):
+        """Yields a cached body in chunks, counting it as a hit."""
+        self.hit(entry, revalidated)
+        with gzip.open(self._object_path(entry['body']), 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_SIZE), b''):
+                yield chunk
+
+    def touch(self, endpoint, params, entry):
+        """Records that the server confirmed an entry is still current."""
+        self._write_index(cache_key(endpoint, params), {**entry, 'fetched_at': time.time()})
+
+    def miss(self):
+        self._count('misses')
+
+    def writer(self, endpoint, params, headers=None, status=200):
+        return _Writer(self, endpoint, params, headers or {}, status)
+
+    def _write_index(self, key, entry):
+        path = self._index_path(key)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}'
+        with open(temporary, 'w') as f:
+            json.dump(entry, f)
+        os.replace(temporary, path)
+
+    def summary(self):
+        stats = self.stats
+        served = stats['hits'] + stats['revalidated']
+        lookups = served + stats['misses']
+        rate = served / lookups if lookups else 0.0
+        return (f"Raw cache: {stats['hits']} hits, {stats['revalidated']} revalidated, {stats['misses']} misses "
+                f"({rate:.0%} served from cache), {stats['bytes_saved'] / 1e6:.1f} MB not downloaded, "
+                f"{stats['bytes_stored'] / 1e6:.1f} MB stored.")
+
+    def disk_usage(self):
+        """(index entries, stored objects, compressed bytes)."""
+        entries = len(os.listdir(os.path.join(self.directory, 'index')))
+        objects, size = 0, 0
+        for root, _, files in os.walk(os.path.join(self.directory, 'objects')):
+            for name in files:
+                objects += 1
+                size += os.path.getsize(os.path.join(root, name))
+        return entries, objects, size
+
+
+class _Writer:
+    """Compresses a body to a temporary file as it streams past; stores it only if the stream completes."""
+
+    def __init__(self, cache, endpoint, params, headers, status):
+        self.cache = cache
+        self.key = cache_key(endpoint, params)
+        self.entry = {
+            'endpoint': endpoint, 'params': params, 'status': status,
+            'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified'),
+        }
+        self.temporary = os.path.join(cache.directory, 'objects', f'.{self.key}.{threading.get_ident()}')
+        self.file = gzip.open(self.temporary, 'wb', compresslevel=6)
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.digest.update(chunk)
+        self.size += len(chunk)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.file.close()
+        if exc_type is not None:
+            os.remove(self.temporary)
+            return False
+        digest = self.digest.hexdigest()
+        path = self.cache._object_path(digest)
+        if os.path.exists(path):
+            os.remove(self.temporary)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.cache._count('bytes_stored', os.path.getsize(self.temporary))
+            os.replace(self.temporary, path)
+        self.cache._write_index(self.key, {**self.entry, 'body': digest, 'size': self.size, 'fetched_at': time.time()})
+        return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inspect the raw OpenF1 response cache.")
+    parser.add_argument('--directory', default=RAW_CACHE_DIR)
+    parser.add_argument('--clear', action='store_true', help="Delete the whole cache.")
+    args = parser.parse_args()
+
+    if args.clear:
+        shutil.rmtree(args.directory, ignore_errors=True)
+        print(f"Cleared {args.directory}.")
+    else:
+        entries, objects, size = RawCache(args.directory).disk_usage()
+        print(f"{entries} cached requests, {objects} distinct bodies, {size / 1e6:.1f} MB compressed in {args.directory}.")
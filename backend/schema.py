@@ -0,0 +1,290 @@
+# backend/schema.py
+"""
+Compact storage layout for the high-volume OpenF1 endpoints.
+
+OpenF1 rows are stored close to verbatim except where volume makes that expensive:
+
+* `position`, `intervals` and `weather` are MongoDB time-series collections. Each sample
+  keeps only the fields the API reads, its `date` as a native datetime, and its session and
+  driver under a `meta` field. MongoDB stores samples with the same `meta` together in
+  compressed buckets, so the keys are held once per bucket instead of once per sample.
+  Query them with `session_filter` and `meta.driver_number`.
+* `laps` drop the per-minisector `segments_sector_*` arrays, which nothing reads.
+
+The ingestor and the live poller pass every batch through `compact_batch` before writing it.
+`ensure_indexes` creates the time-series collections before their indexes (see indexes.py).
+An existing database in the old layout is converted by the next ingest, or by hand:
+
+    python schema.py migrate --keep-legacy   # keep the old collections as <name>_legacy
+    python schema.py report                  # storage, index size and query times, old vs new layout
+
+The report copies each time-series collection back into the old layout, unless a
+`<name>_legacy` collection is still there, and drops the copy afterwards.
+"""
+import os
+import time
+import logging
+import argparse
+import statistics
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+META_FIELD = 'meta'
+TIME_FIELD = 'date'
+LEGACY_SUFFIX = '_legacy'
+MIGRATION_ID = 'schema_migration'
+MIGRATE_BATCH_SIZE = 5000
+
+# Collection -> fields moved under `meta`, fields kept, and bucket granularity
+TIME_SERIES = {
+    'position': (['session_key', 'driver_number'], ['position'], 'seconds'),
+    'intervals': (['session_key', 'driver_number'], ['gap_to_leader', 'interval'], 'seconds'),
+    'weather': (['session_key'], ['air_temperature', 'humidity', 'pressure', 'rainfall',
+                                  'track_temperature', 'wind_direction', 'wind_speed'], 'minutes'),
+}
+# Collection -> fields dropped at ingest
+DROPPED_FIELDS = {
+    'laps': ['segments_sector_1', 'segments_sector_2', 'segments_sector_3'],
+}
+
+
+def to_datetime(value):
+    """A UTC datetime for an OpenF1 ISO timestamp; datetimes and None pass through."""
+    if not isinstance(value, str):
+        return value
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def format_date(value):
+    """The ISO form OpenF1 uses (`2023-09-16T13:03:35.292000+00:00`) for a stored datetime; strings pass through."""
+    if not isinstance(value, datetime):
+        return value
+    if value.tzinfo is None:
+        # pymongo returns naive datetimes, which are UTC
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def session_filter(collection_name, session_key):
+    """The filter selecting one session's documents in a collection, whatever its layout."""
+    if collection_name in TIME_SERIES:
+        return {f'{META_FIELD}.session_key': session_key}
+    return {'session_key': session_key}
+
+
+def compact(collection_name, document):
+    """A document in the stored layout. Documents already in that layout are returned unchanged."""
+    if collection_name in TIME_SERIES:
+        meta_fields, fields, _ = TIME_SERIES[collection_name]
+        meta = document.get(META_FIELD) or {}
+        return {
+            META_FIELD: {field: meta.get(field, document.get(field)) for field in meta_fields},
+            TIME_FIELD: to_datetime(document.get(TIME_FIELD)),
+            **{field: document.get(field) for field in fields},
+        }
+    dropped = DROPPED_FIELDS.get(collection_name)
+    if dropped:
+        return {key: value for key, value in document.items() if key not in dropped}
+    return document
+
+
+def compact_batch(collection_name, documents):
+    """`compact` over a batch, dropping time-series samples without a timestamp, which MongoDB rejects."""
+    if collection_name not in TIME_SERIES and collection_name not in DROPPED_FIELDS:
+        return documents
+    batch = [compact(collection_name, document) for document in documents]
+    if collection_name in TIME_SERIES:
+        batch = [document for document in batch if document[TIME_FIELD] is not None]
+    return batch
+
+
+def expand(collection_name, document):
+    """The old, flat layout of a time-series document: `meta` fields at the top level and ISO dates."""
+    flat = {key: value for key, value in document.items() if key not in (META_FIELD, '_id')}
+    flat.update(document.get(META_FIELD) or {})
+    flat[TIME_FIELD] = format_date(flat.get(TIME_FIELD))
+    return flat
+
+
+def collection_types(db):
+    """{collection name: 'collection' | 'timeseries' | 'view'}."""
+    return {info['name']: info.get('type', 'collection') for info in db.list_collections()}
+
+
+def create_time_series(db, collection_name):
+    """Creates one time-series collection. Returns False if the server does not support them (before 5.0)."""
+    _, _, granularity = TIME_SERIES[collection_name]
+    try:
+        db.create_collection(collection_name, timeseries={
+            'timeField': TIME_FIELD, 'metaField': META_FIELD, 'granularity': granularity,
+        })
+    except OperationFailure as e:
+        logging.warning(f"Could not create time-series collection {collection_name}, using a regular one: {e}")
+        return False
+    return True
+
+
+def ensure_collections(db):
+    """Creates the time-series collections that do not exist yet."""
+    existing = collection_types(db)
+    for collection_name in TIME_SERIES:
+        if collection_name not in existing:
+            create_time_series(db, collection_name)
+
+
+def _copy(source, target, collection_name):
+    copied, batch = 0, []
+    for document in source.find({}, {'_id': 0}):
+        batch.append(document)
+        if len(batch) == MIGRATE_BATCH_SIZE:
+            copied += _insert(target, collection_name, batch)
+            batch = []
+    return copied + _insert(target, collection_name, batch)
+
+
+def _insert(target, collection_name, batch):
+    batch = compact_batch(collection_name, batch)
+    if batch:
+        target.insert_many(batch, ordered=False)
+    return len(batch)
+
+
+def migrate(db, keep_legacy=False):
+    """
+    Converts regular `position`/`intervals`/`weather` collections into time-series ones and strips
+    dropped lap fields. The old collection is renamed to `<name>_legacy` while it is copied, so
+    an interrupted migration resumes on the next call. Fields stripped once are recorded in the
+    migration document and not scanned for again, since the ingestor never writes them back.
+    Returns the names of the converted collections.
+    """
+    migrated = []
+    types = collection_types(db)
+    state = db.meta.find_one({'_id': MIGRATION_ID}) or {}
+    for collection_name in TIME_SERIES:
+        legacy = f'{collection_name}{LEGACY_SUFFIX}'
+        if types.get(collection_name) == 'collection':
+            if legacy in types:
+                raise Exception(f"Cannot migrate {collection_name}: {legacy} already exists. Drop it first.")
+            db[collection_name].rename(legacy)
+            db.meta.update_one({'_id': MIGRATION_ID}, {'$set': {collection_name: 'copying'}}, upsert=True)
+        elif not (legacy in types and state.get(collection_name) == 'copying'):
+            continue
+
+        print(f"  -> Converting {collection_name} to a time-series collection...")
+        db.drop_collection(collection_name)
+        if not create_time_series(db, collection_name):
+            db[legacy].rename(collection_name)
+            db.meta.update_one({'_id': MIGRATION_ID}, {'$unset': {collection_name: ''}})
+            continue
+        copied = _copy(db[legacy], db[collection_name], collection_name)
+        db.meta.update_one({'_id': MIGRATION_ID}, {'$unset': {collection_name: ''}})
+        if not keep_legacy:
+            db.drop_collection(legacy)
+        print(f"  -> Copied {copied} documents into {collection_name}.")
+        migrated.append(collection_name)
+
+    dropped = state.get('dropped', {})
+    for collection_name, fields in DROPPED_FIELDS.items():
+        if set(fields) <= set(dropped.get(collection_name, [])):
+            continue
+        result = db[collection_name].update_many({'$or': [{field: {'$exists': True}} for field in fields]},
+                                                 {'$unset': {field: '' for field in fields}})
+        if result.modified_count:
+            print(f"  -> Dropped {', '.join(fields)} from {result.modified_count} {collection_name} documents.")
+        db.meta.update_one({'_id': MIGRATION_ID}, {'$set': {f'dropped.{collection_name}': fields}}, upsert=True)
+    return migrated
+
+
+def collection_stats(db, collection_name):
+    """(documents, storage bytes, index bytes) of a collection."""
+    stats = db.command('collStats', collection_name)
+    return db[collection_name].count_documents({}), stats.get('storageSize', 0), stats.get('totalIndexSize', 0)
+
+
+def _sample_query(collection_name, session_key, flat):
+    """The telemetry read of one session in either layout: its samples in (driver, date) order."""
+    meta_fields, fields, _ = TIME_SERIES[collection_name]
+    prefix = '' if flat else f'{META_FIELD}.'
+    order = [f'{prefix}{field}' for field in meta_fields[1:]] + [TIME_FIELD]
+    return [
+        {'$match': {f'{prefix}session_key': session_key}},
+        {'$sort': {field: 1 for field in order}},
+        {'$project': {'_id': 0, TIME_FIELD: 1, **{field: 1 for field in fields},
+                      **{field: f'${prefix}{field}' for field in meta_fields[1:]}}},
+    ]
+
+
+def _time_queries(collection, collection_name, session_keys, flat, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for session_key in session_keys:
+            list(collection.aggregate(_sample_query(collection_name, session_key, flat)))
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def report(db, sessions=5, repeat=3):
+    """Prints storage size, index size and per-session query time of each time-series collection in both layouts."""
+    types = collection_types(db)
+    print(f"{'collection':<12} {'layout':<12} {'documents':>10} {'storage MB':>11} {'index MB':>9} {'query ms':>9}")
+    for collection_name, (meta_fields, _, _) in TIME_SERIES.items():
+        if collection_name not in types:
+            continue
+        legacy = f'{collection_name}{LEGACY_SUFFIX}'
+        built = legacy not in types
+        if built:
+            legacy = f'{collection_name}_report_flat'
+            db.drop_collection(legacy)
+            batch = []
+            for document in db[collection_name].find():
+                batch.append(expand(collection_name, document))
+                if len(batch) == MIGRATE_BATCH_SIZE:
+                    db[legacy].insert_many(batch)
+                    batch = []
+            if batch:
+                db[legacy].insert_many(batch)
+            # The indexes the old layout had
+            db[legacy].create_index([(field, ASCENDING) for field in meta_fields] + [(TIME_FIELD, ASCENDING)])
+        try:
+            session_keys = sorted(db[legacy].distinct('session_key'))[-sessions:]
+            for layout, name, flat in (('flat', legacy, True), (types[collection_name], collection_name, False)):
+                documents, storage, indexes = collection_stats(db, name)
+                query_ms = _time_queries(db[name], collection_name, session_keys, flat, repeat)
+                print(f"{collection_name:<12} {layout:<12} {documents:>10} {storage / 1e6:>11.2f} "
+                      f"{indexes / 1e6:>9.2f} {query_ms:>9.1f}")
+        finally:
+            if built:
+                db.drop_collection(legacy)
+    print(f"Query times are the median of {repeat} runs reading the latest {sessions} sessions.")
+
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Migrate f1_data to the compact layout or compare the layouts.")
+    parser.add_argument('command', choices=['migrate', 'report'])
+    parser.add_argument('--keep-legacy', action='store_true', help="Keep the old collections as <name>_legacy.")
+    parser.add_argument('--sessions', type=int, default=5, help="Sessions read per query timing.")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    MONGO_URI = os.environ.get('MONGO_URI')
+    if not MONGO_URI:
+        raise Exception("MONGO_URI environment variable not set!")
+    client = MongoClient(MONGO_URI)
+    db = client['f1_data']
+    if args.command == 'migrate':
+        from indexes import ensure_indexes
+
+        migrated = migrate(db, keep_legacy=args.keep_legacy)
+        ensure_indexes(db)
+        print(f"Migrated {', '.join(migrated) or 'nothing'}; the schema is up to date.")
+    else:
+        report(db, sessions=args.sessions, repeat=args.repeat)
+    client.close()
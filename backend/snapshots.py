@@ -0,0 +1,289 @@
+# backend/snapshots.py
+"""
+Pre-compressed static snapshots of the responses of settled sessions.
+
+A session OpenF1 has settled (it ended more than RAW_CACHE_SETTLED_DAYS ago, see raw_cache.py)
+no longer changes, yet every view of its pages re-runs the same aggregations. After each
+ingest the ingestor publishes, for every settled session that changed or has no snapshot yet:
+
+    /api/sessions/<key>/details
+    /api/laps?session_key=<key>
+    /api/meetings/<key>/details      once every session of the meeting is settled
+
+Each response is rendered through the API itself, so a snapshot is byte for byte what the
+live route returned, and written once in three encodings under the BLAKE2b hash of its body:
+
+    <SNAPSHOT_DIR>/manifest.json                 request path -> hash and sizes
+    <SNAPSHOT_DIR>/objects/<hash>.json
+    <SNAPSHOT_DIR>/objects/<hash>.json.gz
+    <SNAPSHOT_DIR>/objects/<hash>.json.br
+
+Object files are never rewritten. Republishing a path writes new objects, swaps the manifest
+atomically and then removes objects no path refers to any more.
+
+The API's `route` decorator answers an exact match for a published path from the file in the
+best encoding the client accepts. The file goes out through `send_file`, which gunicorn sends
+with sendfile(2), with a strong ETag and a public `max-age` of SNAPSHOT_MAX_AGE seconds.
+Any other request, and any path without a snapshot, runs the live route. Unlike the lap store,
+snapshots do not follow the ingestion generation: every ingest bumps it, but a settled
+session only changes when a command rewrites it. A command that rewrites stored laps should
+republish them, as conditions.py does.
+
+    python snapshots.py                  # republish every settled session
+    python snapshots.py --year 2024
+"""
+import os
+import json
+import time
+import gzip
+import hashlib
+import argparse
+import threading
+import contextvars
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import brotli
+from flask import current_app, request, send_file
+
+from raw_cache import RAW_CACHE_SETTLED_DAYS
+
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots'))
+SNAPSHOT_ENABLED = os.environ.get('SNAPSHOT_ENABLED', 'true').lower() not in ('0', 'false', 'off', 'no')
+SNAPSHOT_MAX_AGE = int(os.environ.get('SNAPSHOT_MAX_AGE', str(24 * 3600)))
+SNAPSHOT_MANIFEST_TTL = float(os.environ.get('SNAPSHOT_MANIFEST_TTL', '5'))
+# Objects are compressed once, so the slowest, smallest settings are worth it
+SNAPSHOT_BROTLI_QUALITY = int(os.environ.get('SNAPSHOT_BROTLI_QUALITY', '11'))
+GZIP_LEVEL = 9
+MANIFEST = 'manifest.json'
+OBJECTS = 'objects'
+# Preferred first; identity is always available
+ENCODINGS = {'br': '.json.br', 'gzip': '.json.gz', 'identity': '.json'}
+
+_publishing = contextvars.ContextVar('snapshot_publishing', default=False)
+
+
+def snapshot_key(path, args=()):
+    """The manifest key of a request: its path plus its query arguments in sorted order."""
+    query = urlencode(sorted(args))
+    return f"{path}?{query}" if query else path
+
+
+def session_paths(session_key):
+    return [f"/api/sessions/{session_key}/details", f"/api/laps?session_key={session_key}"]
+
+
+def meeting_paths(meeting_key):
+    return [f"/api/meetings/{meeting_key}/details"]
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'entries': {}}
+
+
+def _write_manifest(directory, manifest):
+    temporary = os.path.join(directory, f'.{MANIFEST}.{os.getpid()}')
+    with open(temporary, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(temporary, os.path.join(directory, MANIFEST))
+
+
+def _write_object(directory, name, data):
+    target = os.path.join(directory, OBJECTS, name)
+    if os.path.exists(target):
+        return
+    temporary = os.path.join(directory, OBJECTS, f'.{name}.{os.getpid()}')
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, target)
+
+
+def write_snapshot(directory, body):
+    """Stores a response body in every encoding; returns its manifest entry."""
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    encoded = {
+        'identity': body,
+        'gzip': gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0),
+        'br': brotli.compress(body, quality=SNAPSHOT_BROTLI_QUALITY),
+    }
+    for encoding, data in encoded.items():
+        _write_object(directory, digest + ENCODINGS[encoding], data)
+    return {'hash': digest, 'bytes': {encoding: len(data) for encoding, data in encoded.items()}}
+
+
+def _prune(directory, manifest):
+    referenced = {entry['hash'] for entry in manifest['entries'].values()}
+    for name in os.listdir(os.path.join(directory, OBJECTS)):
+        if not name.startswith('.') and name.split('.', 1)[0] not in referenced:
+            # Readers that already opened the file keep it until they close it
+            os.remove(os.path.join(directory, OBJECTS, name))
+
+
+def settled_cutoff(now=None):
+    """ISO time before which a session's `date_end` makes it settled."""
+    now = now or datetime.now(timezone.utc)
+    return (now - timedelta(days=RAW_CACHE_SETTLED_DAYS)).isoformat()
+
+
+def _split(path):
+    url = urlsplit(path)
+    return url.path, parse_qsl(url.query)
+
+
+def _targets(db, manifest, session_keys, cutoff):
+    """Settled sessions to publish (the given ones, or all when None, plus any without a snapshot) and their settled meetings."""
+    settled = {s['_id']: s.get('meeting_key')
+               for s in db.sessions.find({'date_end': {'$lt': cutoff}}, {'_id': 1, 'meeting_key': 1})}
+    missing = {key for key in settled if any(snapshot_key(*_split(path)) not in manifest['entries']
+                                             for path in session_paths(key))}
+    requested = set(settled) if session_keys is None else {key for key in session_keys if key in settled}
+    sessions = sorted(missing | requested)
+    # A meeting is settled once none of its sessions ends after the cutoff
+    unsettled = set(db.sessions.distinct('meeting_key', {'$or': [{'date_end': {'$gte': cutoff}},
+                                                                  {'date_end': None}]}))
+    meetings = {settled[key] for key in sessions} | {
+        meeting for meeting in set(settled.values())
+        if any(snapshot_key(*_split(path)) not in manifest['entries'] for path in meeting_paths(meeting))
+    }
+    return sessions, sorted(m for m in meetings if m is not None and m not in unsettled)
+
+
+def publish_snapshots(db, directory, session_keys=None, cutoff=None):
+    """
+    Renders `db`'s snapshots into `directory`: those of the given sessions (every session when
+    None) and their meetings, where settled, and of every settled session or meeting that has
+    none yet. Returns the number of paths published.
+    """
+    if not directory:
+        return 0
+    # Imported here: the API module imports this one for its decorator
+    from app import create_app
+
+    os.makedirs(os.path.join(directory, OBJECTS), exist_ok=True)
+    manifest = read_manifest(directory)
+    sessions, meetings = _targets(db, manifest, session_keys, cutoff or settled_cutoff())
+    paths = [path for key in sessions for path in session_paths(key)] + \
+            [path for key in meetings for path in meeting_paths(key)]
+
+    client = create_app(db).test_client()
+    token = _publishing.set(True)
+    published, size, compressed = 0, 0, 0
+    try:
+        for path in paths:
+            response = client.get(path)
+            key = snapshot_key(*_split(path))
+            if response.status_code != 200:
+                # A path that no longer resolves must not keep serving an old body
+                manifest['entries'].pop(key, None)
+                continue
+            entry = write_snapshot(directory, response.get_data())
+            manifest['entries'][key] = {**entry, 'published_at': time.time()}
+            published += 1
+            size += entry['bytes']['identity']
+            compressed += entry['bytes']['br']
+    finally:
+        _publishing.reset(token)
+    manifest['published_at'] = time.time()
+    _write_manifest(directory, manifest)
+    _prune(directory, manifest)
+    print(f"  -> Published {published} snapshots for {len(sessions)} sessions and {len(meetings)} meetings "
+          f"({size} bytes, {compressed} with brotli).")
+    return published
+
+
+class SnapshotStore:
+    """The published snapshots, with the manifest re-read when it changes, checked at most every `manifest_ttl` seconds."""
+
+    def __init__(self, directory=SNAPSHOT_DIR, enabled=SNAPSHOT_ENABLED, max_age=SNAPSHOT_MAX_AGE,
+                 manifest_ttl=SNAPSHOT_MANIFEST_TTL):
+        self.directory = directory
+        self.enabled = enabled and bool(directory)
+        self.max_age = max_age
+        self.manifest_ttl = manifest_ttl
+        self.entries = {}
+        self.manifest_mtime = None
+        self.checked_at = 0.0
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    def current(self):
+        now = time.monotonic()
+        if now - self.checked_at > self.manifest_ttl:
+            with self.lock:
+                if now - self.checked_at > self.manifest_ttl:
+                    self._refresh()
+                    self.checked_at = now
+        return self.entries
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(os.path.join(self.directory, MANIFEST)).st_mtime
+        except FileNotFoundError:
+            self.entries, self.manifest_mtime = {}, None
+            return
+        if mtime != self.manifest_mtime:
+            self.entries = read_manifest(self.directory)['entries']
+            self.manifest_mtime = mtime
+
+    def stats(self):
+        return {'enabled': self.enabled, 'entries': len(self.entries), 'hits': self.hits}
+
+    def _response(self, entry):
+        accepted = request.accept_encodings
+        encoding = next(name for name in ENCODINGS if name == 'identity' or accepted[name])
+        response = send_file(os.path.join(self.directory, OBJECTS, entry['hash'] + ENCODINGS[encoding]),
+                             mimetype='application/json', etag=f"{entry['hash']}-{encoding}",
+                             max_age=self.max_age, conditional=True)
+        # An API response, not a download of the object file
+        del response.headers['Content-Disposition']
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.headers['X-Cache'] = 'SNAPSHOT'
+        return response
+
+    def route(self, view):
+        """Decorator answering published paths from their snapshot; everything else runs the view."""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enabled or _publishing.get() or not current_app.config.get('SNAPSHOT_ENABLED', True):
+                return view(*args, **kwargs)
+            entry = self.current().get(snapshot_key(request.path, request.args.items(multi=True)))
+            if entry is None:
+                return view(*args, **kwargs)
+            try:
+                response = self._response(entry)
+            except FileNotFoundError:
+                # Pruned after a republish this process has not seen yet
+                return view(*args, **kwargs)
+            self.hits += 1
+            return response
+        return wrapper
+
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Publish pre-compressed snapshots of settled sessions.")
+    parser.add_argument('--session', type=int, action='append', help="Session to republish (repeatable).")
+    parser.add_argument('--year', type=int, action='append', help="Season to republish (repeatable).")
+    parser.add_argument('--directory', default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    MONGO_URI = os.environ.get('MONGO_URI')
+    if not MONGO_URI:
+        raise Exception("MONGO_URI environment variable not set!")
+    client = MongoClient(MONGO_URI)
+    db = client['f1_data']
+    keys = args.session
+    if args.year:
+        keys = (keys or []) + db.sessions.distinct('_id', {'year': {'$in': args.year}})
+    try:
+        publish_snapshots(db, args.directory, keys)
+    finally:
+        client.close()
@@ -0,0 +1,118 @@
+# backend/standings.py
+"""
+Materialized season standings and records, built after ingestion.
+
+    season_standings      one document per (year, driver): points, wins, podiums, poles, rank
+    season_records        one document per year: champion, most wins and fastest lap
+    driver_career_stats   one document per driver: totals across seasons and championships won
+
+Only seasons whose sessions changed are rebuilt. Run this module directly to rebuild
+every season, or pass `--year` to rebuild one.
+"""
+import os
+import argparse
+from datetime import datetime, timezone
+
+from pymongo import DeleteMany, ReplaceOne
+
+import queries
+from generation import bump_generation
+
+
+def season_standings_pipeline(year):
+    return [
+        {'$match': {'year': year, 'session_name': {'$in': ['Race', 'Qualifying']}}},
+        {'$group': {
+            '_id': '$driver_number',
+            'points': {'$sum': {'$cond': [{'$eq': ['$session_name', 'Race']}, {'$ifNull': ['$points', 0]}, 0]}},
+            'wins': {'$sum': {'$cond': [{'$and': [{'$eq': ['$session_name', 'Race']}, {'$eq': ['$position', 1]}]}, 1, 0]}},
+            'podiums': {'$sum': {'$cond': [{'$and': [
+                {'$eq': ['$session_name', 'Race']}, {'$gte': ['$position', 1]}, {'$lte': ['$position', 3]}
+            ]}, 1, 0]}},
+            'poles': {'$sum': {'$cond': [{'$and': [{'$eq': ['$session_name', 'Qualifying']}, {'$eq': ['$position', 1]}]}, 1, 0]}},
+            'races': {'$sum': {'$cond': [{'$eq': ['$session_name', 'Race']}, 1, 0]}},
+        }},
+        {'$sort': {'points': -1, 'wins': -1}}
+    ]
+
+
+def build_season(db, year):
+    """Rebuilds the standings and records for one season; returns the driver numbers it covers."""
+    rows = list(db.session_results.aggregate(season_standings_pipeline(year)))
+    built_at = datetime.now(timezone.utc)
+    standings = [
+        ReplaceOne({'_id': f"{year}:{row['_id']}"}, {
+            '_id': f"{year}:{row['_id']}", 'year': year, 'driver_number': row['_id'], 'rank': rank,
+            'points': row['points'], 'wins': row['wins'], 'podiums': row['podiums'],
+            'poles': row['poles'], 'races': row['races'], 'built_at': built_at
+        }, upsert=True)
+        for rank, row in enumerate(rows, start=1)
+    ]
+    # Drivers who no longer appear in the season's results must not keep a stale row
+    db.season_standings.bulk_write(
+        [DeleteMany({'year': year, 'driver_number': {'$nin': [row['_id'] for row in rows]}})] + standings
+    )
+
+    # The records keep the response shape /api/records has always returned
+    champion = next(iter(db.session_results.aggregate(queries.champion_pipeline(year))), None)
+    most_wins = next(iter(db.session_results.aggregate(queries.most_wins_pipeline(year))), None)
+    fastest_lap = next(iter(db.laps.aggregate(queries.season_fastest_lap_pipeline(year))), None)
+    db.season_records.replace_one({'_id': year}, {
+        '_id': year, 'season_champion': champion, 'most_wins': most_wins, 'fastest_lap': fastest_lap,
+        'champion_driver': champion['_id'] if champion else None, 'built_at': built_at
+    }, upsert=True)
+    return [row['_id'] for row in rows]
+
+
+def build_career_stats(db, driver_numbers):
+    """Recomputes career totals for the given drivers from their season standings."""
+    totals = db.season_standings.aggregate([
+        {'$match': {'driver_number': {'$in': driver_numbers}}},
+        {'$group': {
+            '_id': '$driver_number', 'points': {'$sum': '$points'}, 'wins': {'$sum': '$wins'},
+            'podiums': {'$sum': '$podiums'}, 'poles': {'$sum': '$poles'}, 'races': {'$sum': '$races'},
+            'seasons': {'$push': '$year'}
+        }}
+    ])
+    titles = {}
+    for record in db.season_records.find({'champion_driver': {'$in': driver_numbers}}, {'champion_driver': 1}):
+        titles.setdefault(record['champion_driver'], []).append(record['_id'])
+    updates = [
+        ReplaceOne({'_id': row['_id']}, {
+            **row, 'seasons': sorted(row['seasons']),
+            'championships': len(titles.get(row['_id'], [])),
+            'championship_years': sorted(titles.get(row['_id'], []))
+        }, upsert=True)
+        for row in totals
+    ]
+    if updates:
+        db.driver_career_stats.bulk_write(updates, ordered=False)
+
+
+def rebuild_standings(db, years=None):
+    """Rebuilds the given seasons (every season when None) and the careers of everyone in them."""
+    if years is None:
+        years = db.sessions.distinct('year')
+    drivers = set()
+    for year in sorted(y for y in years if y is not None):
+        drivers.update(build_season(db, year))
+        print(f"  -> Rebuilt standings and records for {year}.")
+    if drivers:
+        build_career_stats(db, sorted(drivers))
+        print(f"  -> Rebuilt career stats for {len(drivers)} drivers.")
+
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Rebuild the materialized standings and records.")
+    parser.add_argument('--year', type=int, action='append', help="Season to rebuild (repeatable). Defaults to all.")
+    args = parser.parse_args()
+
+    MONGO_URI = os.environ.get('MONGO_URI')
+    if not MONGO_URI:
+        raise Exception("MONGO_URI environment variable not set!")
+    client = MongoClient(MONGO_URI)
+    rebuild_standings(client['f1_data'], args.year)
+    bump_generation(client['f1_data'])
+    client.close()
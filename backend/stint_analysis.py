@@ -0,0 +1,182 @@
+# backend/stint_analysis.py
+"""
+Vectorized tyre stint analysis for a session.
+
+A session's laps, stints and pit stops are joined in memory: every lap is assigned to its
+driver's stint with one `searchsorted` over (driver, lap) keys. Pit-out laps, in-laps (the
+lap a pit stop is recorded on) and laps without a time are left out. Each remaining lap
+time is fuel corrected to the session's final lap, so laps from early and late stints are
+comparable:
+
+    corrected = lap_duration - FUEL_CORRECTION_PER_LAP * (last_lap - lap_number)
+
+Every stint then gets a least-squares fit of corrected time against tyre age, computed for
+all stints at once from grouped sums. Laps whose residual is more than
+OUTLIER_THRESHOLD robust standard deviations (1.4826 x the median absolute deviation) from
+the stint's median residual, such as safety car or traffic laps, are reported as outliers
+and the stints are fitted again without them. The slope is the degradation per lap.
+"""
+import os
+
+import numpy as np
+
+FUEL_CORRECTION_PER_LAP = float(os.environ.get('FUEL_CORRECTION_PER_LAP', '0.06'))
+OUTLIER_THRESHOLD = float(os.environ.get('STINT_OUTLIER_THRESHOLD', '3'))
+# Stints with fewer clean laps than this get no degradation figure
+MIN_FIT_LAPS = 3
+# Floor on the robust spread, in seconds, so very consistent stints do not flag every lap
+MIN_SPREAD = 0.1
+LAP_KEY_BASE = 10000
+
+
+def _scalar(value, digits=3):
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def _keys(drivers, lap_numbers):
+    return drivers.astype(np.int64) * LAP_KEY_BASE + lap_numbers.astype(np.int64)
+
+
+def grouped_median(groups, values, count):
+    """Median of `values` within each of `count` groups; NaN for empty groups."""
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    sizes = np.bincount(groups, minlength=count)
+    starts = np.cumsum(sizes) - sizes
+    present = sizes > 0
+    low = starts + np.maximum(sizes - 1, 0) // 2
+    high = starts + sizes // 2
+    medians = np.full(count, np.nan)
+    medians[present] = (ordered[low[present]] + ordered[high[present]]) / 2
+    return medians
+
+
+def grouped_fit(groups, x, y, count):
+    """Least-squares (slope, intercept, laps) of y on x within each group; slope is NaN when it cannot be fitted."""
+    laps = np.bincount(groups, minlength=count).astype(float)
+    sum_x = np.bincount(groups, x, minlength=count)
+    sum_y = np.bincount(groups, y, minlength=count)
+    sum_xx = np.bincount(groups, x * x, minlength=count)
+    sum_xy = np.bincount(groups, x * y, minlength=count)
+    denominator = laps * sum_xx - sum_x * sum_x
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = np.where((laps >= MIN_FIT_LAPS) & (denominator > 0),
+                         (laps * sum_xy - sum_x * sum_y) / denominator, np.nan)
+        intercept = np.where(np.isnan(slope), sum_y / laps, (sum_y - slope * sum_x) / laps)
+    return slope, intercept, laps
+
+
+def _stint_table(stints):
+    """Stint columns sorted by (driver, lap_start), the order the lap join searches."""
+    stints = sorted((s for s in stints if s.get('lap_start') is not None),
+                    key=lambda s: (s['driver_number'], s['lap_start']))
+    return stints, {
+        'driver': np.array([s['driver_number'] for s in stints], dtype=np.int64),
+        'start': np.array([s['lap_start'] for s in stints], dtype=np.int64),
+        'end': np.array([s['lap_end'] if s.get('lap_end') is not None else LAP_KEY_BASE - 1 for s in stints],
+                        dtype=np.int64),
+        'age': np.array([s.get('tyre_age_at_start') or 0 for s in stints], dtype=np.int64),
+    }
+
+
+def analyze_stints(laps, stints, pit_stops, fuel_correction=FUEL_CORRECTION_PER_LAP):
+    """
+    Per-stint degradation, fuel-corrected pace and outlier laps, plus a per-compound comparison.
+    `laps` need driver_number, lap_number, lap_duration and is_pit_out_lap; `pit_stops` driver_number and lap_number.
+    """
+    stints, table = _stint_table(stints)
+    count = len(stints)
+    drivers = np.array([lap['driver_number'] for lap in laps], dtype=np.int64)
+    lap_numbers = np.array([lap['lap_number'] for lap in laps], dtype=np.int64)
+    durations = np.array([lap.get('lap_duration') for lap in laps], dtype=float)
+    pit_out = np.array([bool(lap.get('is_pit_out_lap')) for lap in laps], dtype=bool)
+    pit_in = np.isin(_keys(drivers, lap_numbers),
+                     [stop['driver_number'] * LAP_KEY_BASE + stop['lap_number'] for stop in pit_stops
+                      if stop.get('lap_number') is not None])
+
+    # The stint that starts at or before each lap, if that lap is within it
+    stint_index = np.searchsorted(_keys(table['driver'], table['start']), _keys(drivers, lap_numbers), side='right') - 1
+    found = stint_index >= 0
+    candidate = np.where(found, stint_index, 0)
+    if count:
+        found &= (table['driver'][candidate] == drivers) & (lap_numbers <= table['end'][candidate])
+    else:
+        found[:] = False
+    timed = ~np.isnan(durations)
+    excluded = found & (pit_out | pit_in | ~timed)
+    clean = found & ~excluded
+
+    last_lap = lap_numbers.max() if len(lap_numbers) else 0
+    corrected = durations - fuel_correction * (last_lap - lap_numbers)
+    groups = stint_index[clean]
+    tyre_age = (table['age'][groups] + lap_numbers[clean] - table['start'][groups]).astype(float)
+    values = corrected[clean]
+
+    slope, intercept, _ = grouped_fit(groups, tyre_age, values, count)
+    residuals = values - (intercept[groups] + np.nan_to_num(slope[groups]) * tyre_age)
+    center = grouped_median(groups, residuals, count)
+    deviation = np.abs(residuals - center[groups])
+    spread = np.maximum(1.4826 * grouped_median(groups, deviation, count), MIN_SPREAD)
+    outlier = deviation > OUTLIER_THRESHOLD * spread[groups]
+
+    kept = ~outlier
+    groups, tyre_age, values = groups[kept], tyre_age[kept], values[kept]
+    slope, intercept, counted = grouped_fit(groups, tyre_age, values, count)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_lap = np.bincount(groups, durations[clean][kept], minlength=count) / counted
+        corrected_pace = np.bincount(groups, values, minlength=count) / counted
+    excluded_laps = np.bincount(stint_index[excluded], minlength=count)
+    outlier_order = np.argsort(stint_index[clean][outlier], kind='stable')
+    outlier_groups = stint_index[clean][outlier][outlier_order]
+    outlier_laps = np.split(lap_numbers[clean][outlier][outlier_order],
+                            np.searchsorted(outlier_groups, np.arange(1, count))) if count else []
+
+    results = []
+    for index, stint in enumerate(stints):
+        results.append({
+            'driver_number': stint['driver_number'],
+            'stint_number': stint.get('stint_number'),
+            'compound': stint.get('compound'),
+            'lap_start': stint['lap_start'],
+            'lap_end': stint.get('lap_end'),
+            'tyre_age_at_start': int(table['age'][index]),
+            'laps_counted': int(counted[index]),
+            'excluded_laps': int(excluded_laps[index]),
+            'outlier_laps': outlier_laps[index].tolist(),
+            'mean_lap': _scalar(mean_lap[index]),
+            'fuel_corrected_pace': _scalar(corrected_pace[index]),
+            'degradation_per_lap': _scalar(slope[index], 4),
+        })
+    return {
+        'fuel_correction_per_lap': fuel_correction,
+        'laps_analyzed': int(np.count_nonzero(clean)),
+        'stints': results,
+        'compounds': compare_compounds(results),
+    }
+
+
+def compare_compounds(stints):
+    """Per compound: stints, laps, median fuel-corrected stint pace, lap-weighted degradation and the gap to the fastest."""
+    compounds = {}
+    for stint in stints:
+        if stint['compound'] and stint['laps_counted']:
+            compounds.setdefault(stint['compound'], []).append(stint)
+    summary = []
+    for compound, members in compounds.items():
+        paces = np.array([s['fuel_corrected_pace'] for s in members], dtype=float)
+        fitted = [s for s in members if s['degradation_per_lap'] is not None]
+        weights = np.array([s['laps_counted'] for s in fitted], dtype=float)
+        degradation = (np.dot(weights, [s['degradation_per_lap'] for s in fitted]) / weights.sum()
+                       if fitted else np.nan)
+        summary.append({
+            'compound': compound,
+            'stints': len(members),
+            'laps': int(sum(s['laps_counted'] for s in members)),
+            'median_fuel_corrected_pace': _scalar(np.median(paces)),
+            'degradation_per_lap': _scalar(degradation, 4),
+        })
+    summary.sort(key=lambda c: c['median_fuel_corrected_pace'])
+    fastest = summary[0]['median_fuel_corrected_pace'] if summary else None
+    for compound in summary:
+        compound['delta_to_fastest'] = _scalar(compound['median_fuel_corrected_pace'] - fastest)
+    return summary
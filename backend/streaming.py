@@ -0,0 +1,142 @@
+# backend/streaming.py
+"""
+Bounded-memory handling of large OpenF1 payloads.
+
+A race's `position` or `intervals` payload runs to tens of thousands of rows. Decoding it
+with `response.json()` and inserting the whole list holds every row in memory at once, in
+every ingest worker. Instead, the body is read in chunks and parsed one array element at a
+time. While it downloads it is spooled to a temporary file, kept in memory up to
+INGEST_SPOOL_MEMORY bytes and on disk beyond that, and its content hash, row count and
+watermark are computed on the way.
+
+Only when the hash shows the payload changed is the spool parsed a second time and written
+in batches of INGEST_BATCH_SIZE. Each batch is inserted before the next is parsed. Memory
+per worker is then one read chunk plus one batch, whatever the payload size. The network
+read only advances as the parser consumes it, so TCP flow control slows a fast server down
+rather than buffering its output. Existing documents are still only replaced once the whole
+payload has arrived.
+"""
+import os
+import json
+import codecs
+import hashlib
+import tempfile
+
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', '1000'))
+INGEST_SPOOL_MEMORY = int(os.environ.get('INGEST_SPOOL_MEMORY', str(1024 * 1024)))
+SPOOL_READ_SIZE = 64 * 1024
+HASH_BATCH_SIZE = 1000
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',]'
+
+
+def iter_json_array(chunks):
+    """Yields the elements of a JSON array whose bytes arrive as an iterable of chunks."""
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer, position, started, finished = '', 0, False, False
+    chunks = iter(chunks)
+    while True:
+        # Skip separators and the opening bracket, then decode one element if it is complete
+        while position < len(buffer) and buffer[position] in _WHITESPACE:
+            position += 1
+        if position < len(buffer):
+            character = buffer[position]
+            if not started:
+                if character != '[':
+                    raise ValueError(f"Expected a JSON array, got {buffer[position:position + 40]!r}")
+                started, position = True, position + 1
+                continue
+            if character == ',':
+                position += 1
+                continue
+            if character == ']':
+                return
+            try:
+                item, end = _decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                end = None
+            # A number or literal is only complete once a delimiter follows it
+            if end is not None and (character in '{["' or finished
+                                    or (end < len(buffer) and buffer[end] in _DELIMITERS)):
+                yield item
+                position = end
+                continue
+        if finished:
+            raise ValueError("Truncated JSON array")
+        chunk = next(chunks, None)
+        if chunk is None:
+            finished = True
+            buffer = buffer[position:] + text.decode(b'', final=True)
+        else:
+            buffer = buffer[position:] + text.decode(chunk)
+        position = 0
+
+
+class SpooledPayload:
+    """
+    A downloaded JSON array with the same `hash` as hashing the decoded list in canonical form,
+    plus its row `count` and latest `date`/`date_start` (`watermark`). Use as a context manager.
+    """
+
+    def __init__(self, chunks, spool_memory=INGEST_SPOOL_MEMORY):
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_memory)
+        self.digest = hashlib.sha256(b'[')
+        self.count, self.watermark = 0, None
+        pending = []
+        spooled = self._spool(chunks)
+        try:
+            for item in iter_json_array(spooled):
+                pending.append(item)
+                date = (item.get('date') or item.get('date_start')) if isinstance(item, dict) else None
+                if date and (self.watermark is None or date > self.watermark):
+                    self.watermark = date
+                if len(pending) >= HASH_BATCH_SIZE:
+                    self._hash(pending)
+                    pending = []
+            self._hash(pending)
+            # Read to the end of the body, so a source that checks it arrived whole (the raw cache) sees it all
+            for _ in spooled:
+                pass
+        except BaseException:
+            self.file.close()
+            raise
+        self.digest.update(b']')
+        self.hash = self.digest.hexdigest()
+
+    def _hash(self, items):
+        """Hashes items as they appear inside the canonical encoding of the whole list."""
+        if not items:
+            return
+        if self.count:
+            self.digest.update(b',')
+        # Encoding a batch at once is much cheaper than item by item; drop its brackets
+        self.digest.update(json.dumps(items, sort_keys=True, separators=(',', ':'))[1:-1].encode())
+        self.count += len(items)
+
+    def _spool(self, chunks):
+        for chunk in chunks:
+            self.file.write(chunk)
+            yield chunk
+
+    def batches(self, size=INGEST_BATCH_SIZE):
+        """Parses the spool again, yielding lists of at most `size` elements."""
+        self.file.seek(0)
+        batch = []
+        for item in iter_json_array(iter(lambda: self.file.read(SPOOL_READ_SIZE), b'')):
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
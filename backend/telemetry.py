@@ -0,0 +1,116 @@
+# backend/telemetry.py
+"""
+Server-side downsampling of the position and intervals streams.
+
+Samples are read one driver at a time from a cursor sorted by (driver_number, date), and each
+driver's series is reduced to the point budget with Largest-Triangle-Three-Buckets before
+the next is read. Peak memory is one driver's projected series, whatever the session length.
+"""
+from datetime import datetime, timezone
+from itertools import groupby
+
+import numpy as np
+
+from schema import format_date
+
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+
+# Collection, the field LTTB selects on, and the fields returned for each kept sample
+STREAMS = {
+    'position': ('position', 'position', ['position']),
+    'intervals': ('intervals', 'gap_to_leader', ['gap_to_leader', 'interval']),
+}
+
+
+def parse_time(value):
+    """Parses an ISO timestamp query parameter to the UTC form OpenF1 stores; naive times are taken as UTC."""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+def to_epoch_ms(dates):
+    """Milliseconds since the epoch for a list of ISO strings or datetimes."""
+    if dates and isinstance(dates[0], datetime):
+        return np.array([int((d if d.tzinfo else d.replace(tzinfo=timezone.utc)).timestamp() * 1000) for d in dates],
+                        dtype=np.int64)
+    # OpenF1 timestamps are UTC with a +00:00 suffix, which numpy will not parse itself
+    return np.array([d[:-6] if d.endswith('+00:00') else parse_time(d)[:-6] for d in dates],
+                    dtype='datetime64[ms]').astype(np.int64)
+
+
+def to_float(values):
+    """Float array of a numeric field; gaps such as '+1 LAP' or null carry the last numeric value forward."""
+    y = np.array([v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan for v in values], dtype=float)
+    missing = np.isnan(y)
+    if missing.all():
+        return np.zeros_like(y)
+    if missing.any():
+        last = np.where(~missing, np.arange(len(y)), 0)
+        np.maximum.accumulate(last, out=last)
+        y = y[last]
+        y[np.isnan(y)] = y[~np.isnan(y)][0]
+    return y
+
+
+def lttb(x, y, threshold):
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps to draw (x, y) with `threshold`
+    points. The first and last points are always kept.
+    """
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        raise ValueError("LTTB needs a threshold of at least 3 points")
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # The next bucket's average is the third vertex; the last bucket uses the final point
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        areas = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def change_points(y):
+    """Indices where a step series changes value, plus its last sample."""
+    if len(y) == 0:
+        return np.arange(0)
+    keep = np.flatnonzero(np.diff(y, prepend=np.nan) != 0)
+    return keep if keep[-1] == len(y) - 1 else np.append(keep, len(y) - 1)
+
+
+def downsample_driver(samples, value_field, fields, points, step=False):
+    """Reduces one driver's samples to at most `points`, returned as columns of date and `fields`."""
+    dates = [s['date'] for s in samples]
+    y = to_float([s.get(value_field) for s in samples])
+    keep = np.arange(len(samples))
+    if step:
+        # A rank only matters when it changes; thin to change points before spending the budget
+        keep = change_points(y)
+    if len(keep) > points:
+        x = to_epoch_ms([dates[i] for i in keep]) if step else to_epoch_ms(dates)
+        keep = keep[lttb(x.astype(float), y[keep], points)]
+    return {
+        'date': [format_date(dates[i]) for i in keep],
+        **{field: [samples[i].get(field) for i in keep] for field in fields},
+        'raw_samples': len(samples),
+    }
+
+
+def downsample_stream(cursor, stream, points):
+    """Consumes a cursor sorted by (driver_number, date) and returns {driver_number: columns}."""
+    _, value_field, fields = STREAMS[stream]
+    return {
+        driver_number: downsample_driver(list(samples), value_field, fields, points, step=stream == 'position')
+        for driver_number, samples in groupby(cursor, key=lambda s: s['driver_number'])
+    }
@@ -110,7 +110,7 @@ export default function ComparisonPage() {
         driverNumber: c.driver!._id,
         sessionKey: c.sessionKey!
     }));
-    const data = await f1Api.getComparisonLaps(payload);
+    const data = await f1Api.getComparisonLaps(payload, true);
     setComparisonData(data);
     setIsComparing(false);
   };
@@ -118,6 +118,14 @@ export default function ComparisonPage() {
   const calculatedStats = useMemo((): CalculatedStats[] | null => {
     if (!comparisonData) return null;
     return comparisonData.map(colData => {
+        // Summary figures are computed server-side when the analysis block is present
+        if (colData.analysis) {
+            const { fastest_lap, average_lap, consistency_stddev } = colData.analysis;
+            return { columnId: colData.columnId, fastestLap: fastest_lap, averageLap: average_lap, consistency: consistency_stddev };
+        }
+        if (colData.analysis === null) {
+            return { columnId: colData.columnId, fastestLap: null, averageLap: null, consistency: null };
+        }
         const laps = colData.laps.filter(l => l.lap_duration).map(l => l.lap_duration);
         if (laps.length === 0) {
             return { columnId: colData.columnId, fastestLap: null, averageLap: null, consistency: null };
@@ -6,9 +6,17 @@ import { Progress } from "@/components/ui/progress"
 import { XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, AreaChart, Area } from "recharts"
 import { Activity, Timer, TrendingUp, Users, Flag } from "lucide-react"
 import { useState, useEffect, useMemo } from "react"
-import type { Meeting, Session, Lap, Driver } from "@/lib/api"
+import { f1Api, type Meeting, type Session, type Lap, type Driver } from "@/lib/api"
 import { F1Car3D } from "./f1-car-3d"
 
+// Matches the backend's LIVE_GRACE_SECONDS: sessions can run past their scheduled end
+const LIVE_GRACE_MS = 60 * 60 * 1000
+
+const isLive = (session: Session) => {
+  const now = Date.now()
+  return new Date(session.date_start).getTime() <= now && now <= new Date(session.date_end).getTime() + LIVE_GRACE_MS
+}
+
 interface LiveDashboardProps {
   meetings: Meeting[]
   selectedMeeting: Meeting | null
@@ -29,7 +37,7 @@ export function LiveDashboard({
   apiStatus,
 }: LiveDashboardProps) {
   const [currentTime, setCurrentTime] = useState(new Date())
-  const [liveData, setLiveData] = useState<any[]>([])
+  const [liveData, setLiveData] = useState<Lap[]>([])
 
   useEffect(() => {
     const timer = setInterval(() => {
@@ -38,10 +46,29 @@ export function LiveDashboard({
     return () => clearInterval(timer)
   }, [])
 
+  // New laps pushed by the backend's shared live poller while the session is running
+  useEffect(() => {
+    setLiveData([])
+    // Finished and upcoming sessions have nothing to stream; the backend refuses finished ones
+    if (!selectedSession || !isLive(selectedSession)) return
+    const source = new EventSource(f1Api.liveStreamUrl(selectedSession._id))
+    source.addEventListener("laps", (event) => {
+      const rows = JSON.parse((event as MessageEvent).data) as Lap[]
+      setLiveData((previous) => [...previous, ...rows].slice(-200))
+    })
+    return () => source.close()
+  }, [selectedSession])
+
+  const allLaps = useMemo(() => {
+    if (!liveData.length) return laps
+    const seen = new Set(laps.map((lap) => `${lap.driver_number}:${lap.lap_number}`))
+    return [...laps, ...liveData.filter((lap) => !seen.has(`${lap.driver_number}:${lap.lap_number}`))]
+  }, [laps, liveData])
+
   const realtimeStats = useMemo(() => {
-    if (!laps.length) return []
+    if (!allLaps.length) return []
 
-    const last10Laps = laps.slice(-10).map((lap, index) => ({
+    const last10Laps = allLaps.slice(-10).map((lap, index) => ({
       lap: lap.lap_number,
       time: lap.lap_duration,
       driver: drivers.find((d) => d._id === lap.driver_number)?.full_name || `Driver ${lap.driver_number}`,
@@ -52,12 +79,13 @@ export function LiveDashboard({
     }))
 
     return last10Laps
-  }, [laps, drivers])
+  }, [allLaps, drivers])
 
   const fastestCurrentLap = useMemo(() => {
-    if (!laps.length) return null
-    return laps.reduce((fastest, current) => (current.lap_duration < fastest.lap_duration ? current : fastest))
-  }, [laps])
+    const completed = allLaps.filter((lap) => lap.lap_duration)
+    if (!completed.length) return null
+    return completed.reduce((fastest, current) => (current.lap_duration < fastest.lap_duration ? current : fastest))
+  }, [allLaps])
 
   const formatLapTime = (seconds: number) => {
     const minutes = Math.floor(seconds / 60)
@@ -150,13 +150,55 @@ export interface ComparisonLap {
     tyre_compound: string;
 }
 
+export interface ComparisonAnalysis {
+    lap_numbers: number[];
+    delta_to_reference: (number | null)[];
+    cumulative_delta: (number | null)[];
+    rolling_average: (number | null)[];
+    sector_deltas: { sector_1: (number | null)[]; sector_2: (number | null)[]; sector_3: (number | null)[] };
+    mean_sector_delta: { sector_1: number | null; sector_2: number | null; sector_3: number | null };
+    mean_lap_delta: number | null;
+    fastest_lap: number | null;
+    average_lap: number | null;
+    consistency_stddev: number | null;
+    laps_counted: number;
+}
+
 export interface ComparisonColumnData {
     columnId: string;
     laps: ComparisonLap[];
+    analysis?: ComparisonAnalysis | null;
 }
 
 export type ComparisonLapsResponse = ComparisonColumnData[];
 
+export interface BatchRequest {
+    id?: string;
+    path: string;
+    method?: 'GET' | 'POST';
+    body?: unknown;
+}
+
+export interface BatchItem<T = any> {
+    id: string | number;
+    status: number;
+    ms: number;
+    body: T;
+}
+
+export interface BatchResponse {
+    responses: BatchItem[];
+    shared_hits: number;
+    ms: number;
+}
+
+export interface SessionPageData {
+    details: SessionDetailsResponse | null;
+    drivers: Driver[] | null;
+    laps: Lap[] | null;
+    fastestLaps: Lap[] | null;
+}
+
 
 // --- API Service Class ---
 
@@ -272,9 +314,45 @@ class F1ApiService {
     return this.fetchWithErrorHandling<AnalysisResult>(`/analysis?${query.toString()}`);
   }
 
+  // Several API calls in one round trip; each result is the body, or null when that call failed
+  async batch(requests: (string | BatchRequest)[]): Promise<Record<string, any> | null> {
+    const items = requests.map((request, index) =>
+      typeof request === 'string' ? { id: String(index), path: `/api${request}` } : { id: String(index), ...request, path: `/api${request.path}` });
+    const data = await this.fetchWithErrorHandling<BatchResponse>('/batch', {
+        method: 'POST',
+        body: JSON.stringify({ requests: items })
+    });
+    if (!data) return null;
+    const results: Record<string, any> = {};
+    for (const item of data.responses) {
+      if (item.status !== 200) console.error(`API Error in batch: ${item.status} for ${item.id}`, item.body);
+      results[item.id] = item.status === 200 ? item.body : null;
+    }
+    return results;
+  }
+
+  async getSessionPage(sessionKey: number | string): Promise<SessionPageData | null> {
+    const results = await this.batch([
+      { id: 'details', path: `/sessions/${sessionKey}/details` },
+      { id: 'drivers', path: `/drivers?session_key=${sessionKey}` },
+      { id: 'laps', path: `/laps?session_key=${sessionKey}` },
+      { id: 'fastestLaps', path: `/laps?session_key=${sessionKey}&sort=fastest` },
+    ]);
+    return results && { details: results.details, drivers: results.drivers, laps: results.laps, fastestLaps: results.fastestLaps };
+  }
+
+  // Server-Sent Events stream of live position, intervals, laps and race_control rows
+  liveStreamUrl(sessionKey?: number): string {
+    return `${BASE_URL}/live/stream${sessionKey ? `?session_key=${sessionKey}` : ''}`;
+  }
+
   // --- NEW: Method for the robust Comparison Page ---
-  async getComparisonLaps(columns: {id: string, driverNumber: number, sessionKey: number}[]): Promise<ComparisonLapsResponse | null> {
-    return this.fetchWithErrorHandling<ComparisonLapsResponse>('/comparison/laps', {
+  async getComparisonLaps(columns: {id: string, driverNumber: number, sessionKey: number}[], analysis = false, reference?: string): Promise<ComparisonLapsResponse | null> {
+    const params = new URLSearchParams();
+    if (analysis) params.append('analysis', 'true');
+    if (reference) params.append('reference', reference);
+    const query = params.toString();
+    return this.fetchWithErrorHandling<ComparisonLapsResponse>(`/comparison/laps${query ? `?${query}` : ''}`, {
         method: 'POST',
         body: JSON.stringify(columns)
     });